@@ -0,0 +1,49 @@
+"""Reference counted GPU assets shared between the models that use them.
+
+Assets are keyed by tuples such as ("mesh", path) or ("texture", path, srgb).
+The first acquire of a key creates the asset, later ones return the same
+asset, and it is destroyed when the last user releases it. registry is the
+instance ObjModel and the view share.
+"""
+
+
+class AssetRegistry:
+    def __init__(self):
+        # key -> [asset, references, destroy]
+        self.entries = {}
+
+    def acquire(self, key, create, destroy=None):
+        """Return the asset of key, calling create() to make it if no one holds
+        it. destroy(asset) is called when the last reference is released."""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = [create(), 0, destroy]
+            self.entries[key] = entry
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        """Drop a reference to the asset of key, destroying it with the last."""
+        entry = self.entries[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.entries[key]
+            if entry[2] is not None:
+                entry[2](entry[0])
+
+    def references(self, key):
+        """The number of users of the asset of key, 0 when it is not loaded."""
+        entry = self.entries.get(key)
+        return entry[1] if entry is not None else 0
+
+    def summary(self):
+        """Return the number of assets and of references to them by kind, as
+        {kind: (assets, references)}."""
+        kinds = {}
+        for key, (_, references, _) in self.entries.items():
+            assets, total = kinds.get(key[0], (0, 0))
+            kinds[key[0]] = (assets + 1, total + references)
+        return kinds
+
+
+registry = AssetRegistry()
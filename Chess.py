@@ -3,20 +3,83 @@ import imgui
 
 import glfw
 import sys
+import argparse
+import shlex
 
 import magic
 from time import sleep
 
 
 from Chess.View import initGlFwAndResources, View, WIDTH, HEIGHT, WINDOW_TITLE
-from Chess.Model import Game
+from Chess.Model import Game, Colour
+from Chess.Opponent import Opponent
+from Chess.External import ExternalOpponent, format_info
+
+def setOffset(view, piece, offset):
+    model, i = piece.get_model_idx()
+    if i is not None:
+        view.offsets[model][i] = offset
+    else:
+        view.offsets[model] = offset
+
+def syncOffsets(view, game):
+    """Move every model to where its piece is, captured pieces go beside the board."""
+    for piece in game.get_pieces():
+        position = piece.get_position()
+        setOffset(view, piece, [position.get_file(), -position.get_rank()])
+
+    # white's losses line up beyond white's side of the board, black's beyond black's
+    taken = {Colour.WHITE: 0, Colour.BLACK: 0}
+    for piece in game.get_captured():
+        colour = piece.get_colour()
+        n = taken[colour]
+        row = 9 + n // 8 if colour == Colour.WHITE else -2 - n // 8
+        setOffset(view, piece, [row, -(n % 8)])
+        taken[colour] += 1
+
+def showOutcome(window, game):
+    """Print how the game ended and show it in the title."""
+    outcome = game.outcome()
+    if outcome is not None:
+        print('%s by %s' % outcome)
+        glfw.set_window_title(window, '%s - %s by %s' % ((WINDOW_TITLE,) + outcome))
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='A 3D chess game.')
+    parser.add_argument('--ai', choices=['white', 'black'], help='let the computer play this colour')
+    parser.add_argument('--movetime', type=float, default=1.0, help='seconds the computer may think per move')
+    parser.add_argument('--book', help='Polyglot opening book the computer plays from')
+    parser.add_argument('--tablebases', help='directory of endgame tables the computer plays perfectly from')
+    parser.add_argument('--ponder', action='store_true', help='let the computer think on your time too')
+    parser.add_argument('--engine', help='UCI engine command line to play with --ai, or else to analyse with')
+    return parser.parse_args()
 
 def main():
+    args = parseArgs()
     rotating = 0
 
     view = View()
     game = Game()
 
+    aiColour = None
+    if args.ai is not None:
+        aiColour = Colour.WHITE if args.ai == 'white' else Colour.BLACK
+        aiTurn = aiColour == Colour.WHITE
+        # the computer thinks in another process so frames keep coming
+        if args.engine:
+            opponent = ExternalOpponent(shlex.split(args.engine), args.movetime)
+        else:
+            opponent = Opponent(args.movetime, book=args.book, tablebases=args.tablebases)
+        # the board starts from white's side, face the human instead
+        if aiColour == Colour.WHITE:
+            rotating = 20
+
+    # without --ai an engine analyses the position, its line shown in the title
+    analyser = None
+    if args.engine and aiColour is None:
+        analyser = ExternalOpponent(shlex.split(args.engine))
+        analysedKey = None
+
     if not glfw.init():
         sys.exit(1)
 
@@ -24,10 +87,40 @@ def main():
     prevMouseX,prevMouseY = glfw.get_cursor_pos(window)
 
     hasClicked = False
-    while game.is_playing() and not glfw.window_should_close(window):
+    prevKeyStateMap = {}
+    # the window stays open once the game is over so the result can be seen
+    while not glfw.window_should_close(window):
         if rotating:
             view.rotate(9)
             rotating -= 1
+        elif aiColour is not None and game.turn == aiTurn and game.is_playing():
+            if not opponent.thinking:
+                opponent.start(game)
+                glfw.set_window_title(window, WINDOW_TITLE + ' - thinking')
+            result = opponent.poll()
+            if result is not None:
+                glfw.set_window_title(window, WINDOW_TITLE)
+                print(result)
+                game.play(result.move)
+                syncOffsets(view, game)
+                showOutcome(window, game)
+                if args.ponder and game.is_playing():
+                    opponent.ponder(game, result)
+            elif args.engine:
+                for info in opponent.infos():
+                    if 'pv' in info:
+                        glfw.set_window_title(window, '%s - thinking - %s' % (WINDOW_TITLE, format_info(info)))
+
+        if analyser is not None:
+            if not game.is_playing():
+                analyser.cancel()
+                analysedKey = None
+            elif game.get_zobrist_key() != analysedKey:
+                analyser.analyse(game)
+                analysedKey = game.get_zobrist_key()
+            for info in analyser.infos():
+                if 'pv' in info:
+                    glfw.set_window_title(window, '%s - %s' % (WINDOW_TITLE, format_info(info)))
 
         keyStateMap = {}
         for name,id in magic.g_glfwKeymap.items():
@@ -39,30 +132,41 @@ def main():
         mouseX, mouseY = glfw.get_cursor_pos(window)
         view.mousePos = [mouseX,mouseY]
 
-        if keyStateMap["SPACE"]:
+        humanTurn = aiColour is None or game.turn != aiTurn
+        if keyStateMap["SPACE"] and humanTurn and game.is_playing():
             if game.get_focused() is not None:
                 # second click
                 position = tuple(view.offsets['highlight'])
                 if position is not None:
                     x1, y1 = position
-                    y2, x2 = game.get_focused_position()
-                    model, i = game.get_model()
                     valid = game.move(y1, x1)
                     if valid:
-                        if i is not None:
-                            view.offsets[model][i][0] += x1-x2
-                            view.offsets[model][i][1] += y2-y1
-                        else:
-                            view.offsets[model][0] += x1-x2
-                            view.offsets[model][1] += y2-y1
-
-                        rotating = 20
+                        syncOffsets(view, game)
+                        showOutcome(window, game)
+
+                        if aiColour is None:
+                            rotating = 20
                         game.unfocus()
             else:
                 x, y = tuple(view.offsets['highlight'])
                 game.set_focused((y, x))
                 print('Selected')
 
+        # one takeback per key press, and in a game against the computer
+        # take back its reply too so it is the human's move again
+        # taking back while the computer thinks abandons its search
+        if keyStateMap["BACKSPACE"] and not prevKeyStateMap.get("BACKSPACE"):
+            if aiColour is not None and (opponent.thinking or opponent.pondering):
+                opponent.cancel()
+            if game.takeback() and aiColour is not None and game.turn == aiTurn:
+                game.takeback()
+            syncOffsets(view, game)
+            glfw.set_window_title(window, WINDOW_TITLE)
+        # F makes the computer play the best move it has found so far
+        if keyStateMap["F"] and aiColour is not None:
+            opponent.force()
+        prevKeyStateMap = keyStateMap
+
         if keyStateMap["W"]:
             if view.offsets['highlight'][0] > 0:
                 view.offsets['highlight'][0] -= 1
@@ -97,6 +201,11 @@ def main():
         glfw.poll_events()
         impl.process_inputs()
 
+    if aiColour is not None:
+        opponent.close()
+    if analyser is not None:
+        analyser.close()
+    view.releaseResources()
     glfw.terminate()
 
 if __name__ == '__main__':
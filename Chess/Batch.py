@@ -0,0 +1,320 @@
+"""Move counts, attack maps and evaluations for many positions at once.
+
+The functions here take N positions as NumPy arrays, the twelve piece sets
+of each as an (N, 12) uint64 array indexed like Game's (colour * 6 + kind),
+and work on all of them with whole-array operations: sliding attacks are
+Kogge-Stone fills, one direction at a time, and moves are counted per
+direction, where no two pieces can reach the same square, so pins, checks,
+castling and en passant are all handled without a per-board loop.
+
+  bitboards, turn, castling, ep = from_fens(fens)
+  counts = legal_move_counts(bitboards, turn, castling, ep)
+  scores = evaluate(bitboards, turn)
+
+  python -m Chess.Batch games.fen
+"""
+import argparse
+import time
+
+import numpy as np
+
+from Chess.Model import Game, START_FEN, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, \
+  PIECE_SQUARE, GAME_PHASE, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, \
+  _KING_MIDDLE, _KING_END, _MIDDLE_GAME
+
+_U64 = np.uint64
+_FILE_A = _U64(0x0101010101010101)
+_FILE_B = _FILE_A << _U64(1)
+_FILE_G = _FILE_A << _U64(6)
+_FILE_H = _FILE_A << _U64(7)
+_RANK_1 = _U64(0xFF)
+_RANK_3 = _U64(0xFF << 16)
+_RANK_6 = _U64(0xFF << 40)
+_RANK_8 = _U64(0xFF << 56)
+_NOT_A, _NOT_H = ~_FILE_A, ~_FILE_H
+_NOT_AB, _NOT_GH = ~(_FILE_A | _FILE_B), ~(_FILE_G | _FILE_H)
+_ALL = _U64(0xFFFFFFFFFFFFFFFF)
+_ZERO = _U64(0)
+
+# (bits, mask): positive bits shift towards h8, and the mask clears squares
+# that wrapped around the board edge
+_ORTHOGONAL = ((8, _ALL), (-8, _ALL), (1, _NOT_A), (-1, _NOT_H))
+_DIAGONAL = ((9, _NOT_A), (7, _NOT_H), (-7, _NOT_A), (-9, _NOT_H))
+_JUMPS = ((17, _NOT_A), (15, _NOT_H), (10, _NOT_AB), (6, _NOT_GH),
+  (-6, _NOT_AB), (-10, _NOT_GH), (-15, _NOT_A), (-17, _NOT_H))
+
+if hasattr(np, "bitwise_count"):
+  def _popcount(bb):
+    return np.bitwise_count(bb).astype(np.int32)
+else:
+  def _popcount(bb):
+    bb = bb - ((bb >> _U64(1)) & _U64(0x5555555555555555))
+    bb = (bb & _U64(0x3333333333333333)) + ((bb >> _U64(2)) & _U64(0x3333333333333333))
+    bb = (bb + (bb >> _U64(4))) & _U64(0x0F0F0F0F0F0F0F0F)
+    return ((bb * _U64(0x0101010101010101)) >> _U64(56)).astype(np.int32)
+
+def _shift(bb, bits, mask):
+  if bits > 0:
+    return (bb << _U64(bits)) & mask
+  return (bb >> _U64(-bits)) & mask
+
+def _ray(pieces, empty, bits, mask):
+  """Return the squares pieces attack in one direction, up to and including
+  the first occupied square (Kogge-Stone occluded fill).
+  """
+  empty = empty & mask
+  pieces = pieces | (empty & _shift(pieces, bits, mask))
+  empty = empty & _shift(empty, bits, mask)
+  pieces = pieces | (empty & _shift(pieces, 2 * bits, _ALL))
+  empty = empty & _shift(empty, 2 * bits, _ALL)
+  pieces = pieces | (empty & _shift(pieces, 4 * bits, _ALL))
+  return _shift(pieces, bits, mask)
+
+def _any(bb):
+  return bb != _ZERO
+
+def _pawn_attacks(pawns, colour):
+  if colour == 0:
+    return _shift(pawns, 9, _NOT_A) | _shift(pawns, 7, _NOT_H)
+  return _shift(pawns, -7, _NOT_A) | _shift(pawns, -9, _NOT_H)
+
+def _attacks(bitboards, colour, empty):
+  """Return every square colour's pieces attack, sliders seeing through empty."""
+  base = colour * 6
+  attacks = _pawn_attacks(bitboards[:, base + PAWN], colour)
+  knights = bitboards[:, base + KNIGHT]
+  king = bitboards[:, base + KING]
+  for bits, mask in _JUMPS:
+    attacks |= _shift(knights, bits, mask)
+  for bits, mask in _ORTHOGONAL + _DIAGONAL:
+    attacks |= _shift(king, bits, mask)
+  queens = bitboards[:, base + QUEEN]
+  for directions, sliders in ((_ORTHOGONAL, bitboards[:, base + ROOK] | queens),
+      (_DIAGONAL, bitboards[:, base + BISHOP] | queens)):
+    for bits, mask in directions:
+      attacks |= _ray(sliders, empty, bits, mask)
+  return attacks
+
+def _occupancy(bitboards):
+  white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+  black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+  return white, black
+
+def attack_maps(bitboards):
+  """Return an (N, 2) uint64 array of the squares white and black attack."""
+  bitboards = np.asarray(bitboards, dtype=_U64)
+  white, black = _occupancy(bitboards)
+  empty = ~(white | black)
+  return np.stack([_attacks(bitboards, 0, empty), _attacks(bitboards, 1, empty)], axis=1)
+
+def _count_pawns(pawns, colour, empty, enemy, allowed):
+  """Count the moves of a set of pawns landing on allowed squares."""
+  if colour == 0:
+    single = _shift(pawns, 8, _ALL) & empty
+    double = _shift(single & _RANK_3, 8, _ALL) & empty
+    captures = (_shift(pawns, 9, _NOT_A) & enemy, _shift(pawns, 7, _NOT_H) & enemy)
+    last = _RANK_8
+  else:
+    single = _shift(pawns, -8, _ALL) & empty
+    double = _shift(single & _RANK_6, -8, _ALL) & empty
+    captures = (_shift(pawns, -7, _NOT_A) & enemy, _shift(pawns, -9, _NOT_H) & enemy)
+    last = _RANK_1
+  count = _popcount(double & allowed)
+  for targets in (single,) + captures:
+    targets = targets & allowed
+    # a promotion is four moves
+    count += _popcount(targets & ~last) + 4 * _popcount(targets & last)
+  return count
+
+def _count_side(bitboards, colour, castling, ep):
+  """Count legal moves for positions that all have colour to move."""
+  n = len(bitboards)
+  them = colour ^ 1
+  ours = [bitboards[:, colour * 6 + kind] for kind in range(6)]
+  theirs = [bitboards[:, them * 6 + kind] for kind in range(6)]
+  own = ours[0] | ours[1] | ours[2] | ours[3] | ours[4] | ours[5]
+  enemy = theirs[0] | theirs[1] | theirs[2] | theirs[3] | theirs[4] | theirs[5]
+  occupied = own | enemy
+  empty = ~occupied
+  king = ours[KING]
+
+  # checks and pins, one line direction at a time from the king
+  checkers = (_pawn_attacks(king, colour) & theirs[PAWN])
+  for bits, mask in _JUMPS:
+    checkers |= _shift(king, bits, mask) & theirs[KNIGHT]
+  block = checkers.copy()
+  pinned = np.zeros(n, dtype=_U64)
+  pins = []
+  for directions, sliders in ((_ORTHOGONAL, theirs[ROOK] | theirs[QUEEN]),
+      (_DIAGONAL, theirs[BISHOP] | theirs[QUEEN])):
+    for bits, mask in directions:
+      ray = _ray(king, empty, bits, mask)
+      checker = ray & sliders
+      checkers |= checker
+      block |= np.where(_any(checker), ray, _ZERO)
+      # an own piece first on the ray with an enemy slider right behind it
+      shield = ray & own
+      beyond = _ray(shield, empty, bits, mask)
+      pin = np.where(_any(beyond & sliders), shield, _ZERO)
+      pinned |= pin
+      pins.append((bits, pin, ray | beyond))
+  check_count = _popcount(checkers)
+  allowed = np.where(check_count == 0, _ALL, np.where(check_count == 1, block, _ZERO)) & ~own
+
+  # the king, stepping out of enemy attacks seen without the king in the way
+  danger = _attacks(bitboards, them, empty | king)
+  targets = np.zeros(n, dtype=_U64)
+  for bits, mask in _ORTHOGONAL + _DIAGONAL:
+    targets |= _shift(king, bits, mask)
+  count = _popcount(targets & ~own & ~danger)
+
+  # with two checkers only the king moves
+  free = ~pinned
+  for bits, mask in _JUMPS:
+    count += _popcount(_shift(ours[KNIGHT] & free, bits, mask) & allowed)
+  for directions, sliders in ((_ORTHOGONAL, ours[ROOK] | ours[QUEEN]), (_DIAGONAL, ours[BISHOP] | ours[QUEEN])):
+    for bits, mask in directions:
+      # a pinned slider may only move along its pin
+      stuck = np.zeros(n, dtype=_U64)
+      for pin_bits, pin, _ in pins:
+        if pin_bits != bits and pin_bits != -bits:
+          stuck |= pin
+      count += _popcount(_ray(sliders & ~stuck, empty, bits, mask) & allowed)
+  count += _count_pawns(ours[PAWN] & free, colour, empty, enemy, allowed)
+  for _, pin, line in pins:
+    count += _count_pawns(ours[PAWN] & pin, colour, empty, enemy, allowed & line)
+
+  # castling through empty, unattacked squares while not in check
+  rights = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if colour == 0 else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+  offset = 0 if colour == 0 else 56
+  for right, between, safe in ((rights[0], 0x60, 0x70), (rights[1], 0x0E, 0x1C)):
+    between, safe = _U64(between << offset), _U64(safe << offset)
+    count += ((castling & right != 0) & ((occupied & between) == _ZERO) & ((danger & safe) == _ZERO)).astype(np.int32)
+
+  # en passant, tried by playing it out since it can uncover the king sideways
+  has_ep = ep >= 0
+  if has_ep.any():
+    ep_bit = np.where(has_ep, _U64(1) << np.where(has_ep, ep, 0).astype(_U64), _ZERO)
+    victim = _shift(ep_bit, -8 if colour == 0 else 8, _ALL)
+    for capturer in (_shift(ep_bit, -9 if colour == 0 else 7, _NOT_H), _shift(ep_bit, -7 if colour == 0 else 9, _NOT_A)):
+      capturer &= ours[PAWN]
+      after = empty | capturer | victim
+      after &= ~ep_bit
+      attacked = _pawn_attacks(king, colour) & theirs[PAWN] & ~victim
+      for bits, mask in _JUMPS:
+        attacked |= _shift(king, bits, mask) & theirs[KNIGHT]
+      for directions, sliders in ((_ORTHOGONAL, theirs[ROOK] | theirs[QUEEN]),
+          (_DIAGONAL, theirs[BISHOP] | theirs[QUEEN])):
+        for bits, mask in directions:
+          attacked |= _ray(king, after, bits, mask) & sliders
+      count += (_any(capturer) & ~_any(attacked)).astype(np.int32)
+  return count
+
+def legal_move_counts(bitboards, turn, castling=None, ep=None):
+  """Return the number of legal moves in each position.
+  Parameters:
+    bitboards:  (N, 12) uint64 piece sets
+    turn:       (N,) true where white is to move
+    castling:   (N,) castling rights bits, none if not given
+    ep:         (N,) en passant square or -1, none if not given
+  """
+  bitboards = np.asarray(bitboards, dtype=_U64)
+  n = len(bitboards)
+  turn = np.asarray(turn, dtype=bool)
+  castling = np.zeros(n, dtype=np.uint8) if castling is None else np.asarray(castling, dtype=np.uint8)
+  ep = np.full(n, -1, dtype=np.int8) if ep is None else np.asarray(ep, dtype=np.int8)
+  counts = np.zeros(n, dtype=np.int32)
+  for colour, rows in ((0, turn), (1, ~turn)):
+    if rows.any():
+      counts[rows] = _count_side(bitboards[rows], colour, castling[rows], ep[rows])
+  return counts
+
+def _byte_table():
+  """Return PIECE_SQUARE summed over every set of squares within one byte of a
+  bitboard, indexed by (code * 8 + byte) * 256 + value.
+  """
+  table = np.zeros((12, 8, 256), dtype=np.int32)
+  values = np.arange(256)
+  for bit in range(8):
+    has = (values >> bit) & 1
+    for code in range(12):
+      for byte in range(8):
+        table[code, byte] += has * PIECE_SQUARE[code * 64 + byte * 8 + bit]
+  return table.ravel()
+
+_PIECE_SQUARE_BYTES = _byte_table()
+_BYTE_OFFSETS = (np.arange(96, dtype=np.intp) * 256).reshape(12, 8)
+_GAME_PHASE = np.array(GAME_PHASE, dtype=np.int32)
+_KING_MIDDLE_TABLE = np.array(_KING_MIDDLE, dtype=np.int32).reshape(2, 64)
+_KING_END_TABLE = np.array(_KING_END, dtype=np.int32).reshape(2, 64)
+
+def _square(bb):
+  """Return the index of the lowest set bit of each bitboard."""
+  return _popcount((bb & (~bb + _U64(1))) - _U64(1))
+
+def evaluate(bitboards, turn):
+  """Return Game.evaluate() of each position, from the side to move's view."""
+  bitboards = np.ascontiguousarray(bitboards, dtype="<u8")
+  squares = bitboards.view(np.uint8).reshape(len(bitboards), 12, 8)
+  score = _PIECE_SQUARE_BYTES[squares + _BYTE_OFFSETS].sum(axis=(1, 2), dtype=np.int32)
+  phase = np.minimum(_popcount(bitboards) @ _GAME_PHASE, _MIDDLE_GAME)
+  for colour, sign in ((0, 1), (1, -1)):
+    king = _square(bitboards[:, colour * 6 + KING])
+    middle, end = _KING_MIDDLE_TABLE[colour][king], _KING_END_TABLE[colour][king]
+    score += sign * ((middle * phase + end * (_MIDDLE_GAME - phase)) // _MIDDLE_GAME)
+  return np.where(np.asarray(turn, dtype=bool), score, -score)
+
+def from_games(games):
+  """Return (bitboards, turn, castling, ep) arrays for a list of Games."""
+  bitboards = np.array([game.get_bitboards() for game in games], dtype=_U64).reshape(len(games), 12)
+  turn = np.array([game.turn for game in games], dtype=bool)
+  castling = np.array([game.get_castling_rights() for game in games], dtype=np.uint8)
+  ep = np.array([game.get_ep_square() for game in games], dtype=np.int8)
+  return bitboards, turn, castling, ep
+
+def from_fens(fens):
+  """Return (bitboards, turn, castling, ep) arrays for FEN strings."""
+  return from_games([Game.from_fen(fen) for fen in fens])
+
+def main():
+  parser = argparse.ArgumentParser(description="Time batched move counting and evaluation against Game.")
+  parser.add_argument("fens", nargs="?", help="file with one FEN per line, random game positions if not given")
+  parser.add_argument("--positions", type=int, default=20000, help="random positions to generate")
+  args = parser.parse_args()
+
+  if args.fens:
+    with open(args.fens) as f:
+      games = [Game.from_fen(line) for line in f if line.strip()]
+  else:
+    import random
+    rng = random.Random(1)
+    games = []
+    while len(games) < args.positions:
+      game = Game.from_fen(START_FEN)
+      for _ in range(rng.randrange(1, 120)):
+        moves = game.legal_moves()
+        if not moves:
+          break
+        game.make_move(rng.choice(moves))
+      games.append(Game.from_fen(game.to_fen()))
+  bitboards, turn, castling, ep = from_games(games)
+
+  for name, batched, single in (
+      ("legal move counts", lambda: legal_move_counts(bitboards, turn, castling, ep),
+        lambda: [len(game.legal_moves()) for game in games]),
+      ("evaluations", lambda: evaluate(bitboards, turn), lambda: [game.evaluate() for game in games])):
+    start = time.perf_counter()
+    result = batched()
+    batched_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = single()
+    single_seconds = time.perf_counter() - start
+    status = "ok" if list(result) == expected else "MISMATCH"
+    print("%-18s batched %10.0f positions/s   Game %10.0f positions/s  %s" % (name,
+      len(games) / max(batched_seconds, 1e-9), len(games) / max(single_seconds, 1e-9), status))
+  start = time.perf_counter()
+  attack_maps(bitboards)
+  print("%-18s batched %10.0f positions/s" % ("attack maps", len(games) / max(time.perf_counter() - start, 1e-9)))
+
+if __name__ == '__main__':
+  main()
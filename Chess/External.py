@@ -0,0 +1,424 @@
+"""Local UCI engines as opponents and analysers.
+
+EngineProcess talks to an engine binary run as an asyncio subprocess and
+streams the engine's info lines to a callback while it searches.
+ExternalOpponent runs one on an event loop in a background thread and
+offers Opponent's polling interface, so the render loop never waits on
+engine I/O:
+
+  engine = ExternalOpponent(["stockfish"], movetime=2.0)
+  engine.start(game)           # think about a move, poll() gives it
+  engine.analyse(game)         # or search until cancelled
+  for info in engine.infos():  # info lines seen since the last call
+    print(format_info(info))
+
+python -m Chess.External CMD analyses a position from the command line, and
+python -m Chess.FakeEngine is a small engine that can stand in for tests.
+"""
+import argparse
+import asyncio
+import queue
+import shlex
+import threading
+
+from Chess.Model import Game, START_FEN, move_uci
+from Chess.Search import SearchResult, MATE
+
+# seconds an engine has to answer uci, and to exit after quit
+STARTUP_TIMEOUT = 10.0
+QUIT_TIMEOUT = 2.0
+
+_INT_FIELDS = frozenset(("depth", "seldepth", "multipv", "nodes", "nps", "time", "hashfull", "tbhits",
+  "currmovenumber", "cpuload"))
+
+def parse_info(line):
+  """Return the fields of a UCI info line as a dict.
+  Numbers are ints, score is (kind, value) with kind 'cp' or 'mate', pv is a
+  list of UCI move strings and string is the rest of the line.
+  """
+  tokens = line.split()[1:]
+  info = {}
+  i = 0
+  while i < len(tokens):
+    name = tokens[i]
+    if name in _INT_FIELDS and i + 1 < len(tokens):
+      info[name] = int(tokens[i + 1])
+      i += 2
+    elif name == "score" and i + 2 < len(tokens):
+      info["score"] = (tokens[i + 1], int(tokens[i + 2]))
+      i += 3
+      if i < len(tokens) and tokens[i] in ("lowerbound", "upperbound"):
+        info["bound"] = tokens[i]
+        i += 1
+    elif name == "currmove" and i + 1 < len(tokens):
+      info[name] = tokens[i + 1]
+      i += 2
+    elif name == "pv":
+      info["pv"] = tokens[i + 1:]
+      break
+    elif name == "string":
+      info["string"] = " ".join(tokens[i + 1:])
+      break
+    else:
+      i += 1
+  return info
+
+def format_info(info):
+  """Return a short description of an info dict, e.g. 'depth 12 +0.35 e2e4 e7e5'."""
+  parts = []
+  if "depth" in info:
+    parts.append("depth %d" % info["depth"])
+  if "score" in info:
+    kind, value = info["score"]
+    parts.append("mate %d" % value if kind == "mate" else "%+.2f" % (value / 100))
+  parts.extend(info.get("pv", [])[:6])
+  return " ".join(parts)
+
+def position_command(game):
+  """Return the UCI position command for a game, with the moves since its
+  first position so the engine sees repetitions.
+  """
+  moves = game.get_moves()
+  for _ in moves:
+    game.unmake_move()
+  try:
+    fen = game.to_fen()
+  finally:
+    for move in moves:
+      game.make_move(move)
+  command = "position startpos" if fen == START_FEN else "position fen " + fen
+  if moves:
+    command += " moves " + " ".join(move_uci(move) for move in moves)
+  return command
+
+class EngineProcess:
+  """A UCI engine subprocess. One search may run at a time."""
+
+  def __init__(self, process):
+    self._process = process
+    self.name = None
+    # option name -> its whole 'option name ...' line
+    self.options = {}
+    # one writer drains at a time
+    self._writing = asyncio.Lock()
+
+  @classmethod
+  async def open(cls, command):
+    """Start an engine from its argument list and wait for uciok."""
+    process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE,
+      stdout=asyncio.subprocess.PIPE)
+    engine = cls(process)
+    try:
+      await asyncio.wait_for(engine._handshake(), STARTUP_TIMEOUT)
+    except BaseException:
+      process.kill()
+      await process.wait()
+      raise
+    return engine
+
+  async def send(self, line):
+    """Write a command, waiting while the engine is behind on reading them."""
+    async with self._writing:
+      self._process.stdin.write((line + "\n").encode())
+      await self._process.stdin.drain()
+
+  async def _readline(self):
+    line = await self._process.stdout.readline()
+    if not line:
+      raise EOFError("the engine exited")
+    return line.decode().strip()
+
+  async def _handshake(self):
+    await self.send("uci")
+    while True:
+      line = await self._readline()
+      if line.startswith("id name "):
+        self.name = line[len("id name "):]
+      elif line.startswith("option name "):
+        self.options[line[len("option name "):].split(" type ")[0]] = line
+      elif line == "uciok":
+        return
+
+  async def isready(self):
+    """Wait until the engine has caught up with the commands sent."""
+    await self.send("isready")
+    while await self._readline() != "readyok":
+      pass
+
+  async def setoption(self, name, value):
+    await self.send("setoption name %s value %s" % (name, value))
+    await self.isready()
+
+  async def go(self, position, arguments):
+    """Start a search, e.g. go(position_command(game), 'movetime 1000');
+    bestmove() waits for its result.
+    """
+    await self.send(position)
+    await self.send("go " + arguments)
+
+  async def bestmove(self, on_info=None):
+    """Return the (bestmove, ponder) strings of the search under way, ponder
+    None if not given, passing parse_info() of each info line to on_info.
+    """
+    while True:
+      line = await self._readline()
+      if line.startswith("info "):
+        if on_info is not None:
+          on_info(parse_info(line))
+      elif line.startswith("bestmove"):
+        parts = line.split()
+        ponder = parts[3] if len(parts) > 3 and parts[2] == "ponder" else None
+        return (parts[1] if len(parts) > 1 else "0000"), ponder
+
+  async def stop(self):
+    await self.send("stop")
+
+  async def ponderhit(self):
+    await self.send("ponderhit")
+
+  async def quit(self):
+    """Ask the engine to exit, killing it if it does not."""
+    try:
+      await self.send("quit")
+      await asyncio.wait_for(self._process.wait(), QUIT_TIMEOUT)
+    except (asyncio.TimeoutError, ConnectionError):
+      self._process.kill()
+      await self._process.wait()
+
+def _search_result(fen, bestmove, info, seconds):
+  """Convert an engine's answer into a SearchResult on our move encoding."""
+  game = Game.from_fen(fen)
+  try:
+    move = game.parse_uci(bestmove)
+  except ValueError:
+    move = 0
+  pv = []
+  for text in info.get("pv", [bestmove]):
+    try:
+      pv.append(game.parse_uci(text))
+    except ValueError:
+      break
+    game.make_move(pv[-1])
+  if not pv or pv[0] != move:
+    pv = [move] if move else []
+  kind, value = info.get("score", ("cp", 0))
+  score = value if kind == "cp" else (MATE - 2 * value + 1 if value > 0 else -MATE - 2 * value)
+  return SearchResult(move, score, info.get("depth", 0), info.get("nodes", 0),
+    info.get("time", seconds * 1000) / 1000, pv)
+
+class ExternalOpponent:
+  """A UCI engine on a background event loop, polled like an Opponent."""
+
+  def __init__(self, command, movetime=1.0, options=None):
+    """Start the engine, waiting for its handshake.
+    Parameters:
+      command:   the engine's argument list
+      movetime:  seconds the engine may think per move
+      options:   optional dict of UCI options to set
+    """
+    self.movetime = movetime
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+    self._thread.start()
+    self._results = queue.Queue()
+    self._infos = queue.Queue()
+    self._ident = 0
+    # the search the caller is waiting on, 0 if none
+    self._wanted = 0
+    # its result, once it has come before the caller asks for it
+    self._finished = None
+    self._ponder_key = None
+    self._analysing = False
+    # the following are only used on the event loop
+    self._running = 0
+    self._forced = 0
+    self._hit = 0
+    self._engine = self._call(self._open(command, options or {}))
+    self.name = self._engine.name
+
+  def _call(self, coroutine):
+    """Run a coroutine on the loop and wait for it; only used to start and close."""
+    return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+  async def _open(self, command, options):
+    self._busy = asyncio.Lock()
+    engine = await EngineProcess.open(command)
+    for name, value in options.items():
+      await engine.setoption(name, value)
+    return engine
+
+  @property
+  def thinking(self):
+    """True from start() until its move has been returned by poll() or it is cancelled."""
+    return self._wanted != 0 and self._ponder_key is None and not self._analysing
+
+  @property
+  def pondering(self):
+    return self._ponder_key is not None
+
+  @property
+  def analysing(self):
+    return self._analysing
+
+  def start(self, game):
+    """Start thinking about a move for the game, cancelling any search under way.
+    A ponder on this position becomes the search for it.
+    """
+    if self._ponder_key is not None and self._ponder_key == game.get_zobrist_key():
+      self._ponder_key = None
+      asyncio.run_coroutine_threadsafe(self._ponderhit(self._wanted), self._loop)
+      return
+    self.cancel()
+    self._send(game, "movetime %d" % int(self.movetime * 1000))
+
+  def ponder(self, game, result):
+    """Search the reply result predicts to the move just played in game."""
+    self.cancel()
+    if len(result.pv) < 2 or result.pv[1] not in game.legal_moves():
+      return
+    game.make_move(result.pv[1])
+    try:
+      self._send(game, "ponder movetime %d" % int(self.movetime * 1000))
+      self._ponder_key = game.get_zobrist_key()
+    finally:
+      game.unmake_move()
+
+  def analyse(self, game):
+    """Search the game until cancelled, for the info lines only."""
+    self.cancel()
+    self._send(game, "infinite")
+    self._analysing = True
+
+  def _send(self, game, arguments):
+    self._ident += 1
+    self._wanted = self._ident
+    self._finished = None
+    asyncio.run_coroutine_threadsafe(self._run(self._ident, position_command(game), game.to_fen(), arguments),
+      self._loop)
+
+  async def _run(self, ident, position, fen, arguments):
+    async with self._busy:
+      # cancelled while an earlier search was finishing
+      if self._wanted != ident:
+        return
+      self._running = ident
+      last = {}
+      def on_info(info):
+        if "pv" in info:
+          last.update(info)
+        self._infos.put((ident, info))
+      start = self._loop.time()
+      try:
+        await self._engine.go(position, arguments)
+        # stop and ponderhit may have come before the go was sent
+        if self._forced == ident:
+          await self._engine.stop()
+        if self._hit == ident:
+          await self._engine.ponderhit()
+        bestmove, _ = await self._engine.bestmove(on_info)
+      except (EOFError, ConnectionError):
+        self._results.put((ident, None))
+        return
+      finally:
+        self._running = 0
+      # nobody polls for a cancelled search or analysis, so do not keep it;
+      # one cancelled while this ran is dropped by poll()
+      if self._wanted == ident:
+        self._results.put((ident, _search_result(fen, bestmove, last, self._loop.time() - start)))
+
+  async def _stop(self, ident):
+    self._forced = ident
+    if self._running and self._running == ident:
+      await self._engine.stop()
+
+  async def _ponderhit(self, ident):
+    self._hit = ident
+    if self._running and self._running == ident:
+      await self._engine.ponderhit()
+
+  def poll(self):
+    """Return the SearchResult of the current search if it is done, else None.
+    Never blocks. An engine that exited gives a result without a move.
+    """
+    # drop the results of cancelled searches whatever the state, and keep a
+    # ponder's until it becomes the search
+    while True:
+      try:
+        ident, result = self._results.get_nowait()
+      except queue.Empty:
+        break
+      if ident == self._wanted:
+        self._finished = result or SearchResult(0, 0, 0, 0, 0.0, [])
+    if not self.thinking or self._finished is None:
+      return None
+    result, self._finished = self._finished, None
+    self._wanted = 0
+    return result
+
+  def infos(self):
+    """Return the info dicts of the current search seen since the last call."""
+    infos = []
+    while True:
+      try:
+        ident, info = self._infos.get_nowait()
+      except queue.Empty:
+        return infos
+      if ident == self._wanted:
+        infos.append(info)
+
+  def force(self):
+    """Make the engine play its best move so far."""
+    if self.thinking:
+      asyncio.run_coroutine_threadsafe(self._stop(self._wanted), self._loop)
+
+  def cancel(self):
+    """Stop the current search, ponder or analysis and discard its result."""
+    wanted, self._wanted = self._wanted, 0
+    if wanted:
+      # cleared first, so the search sees it is no longer wanted when it ends
+      asyncio.run_coroutine_threadsafe(self._stop(wanted), self._loop)
+    self._finished = None
+    self._ponder_key = None
+    self._analysing = False
+
+  def close(self):
+    """Stop the engine and the event loop."""
+    self.cancel()
+    self._call(self._close())
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+    self._loop.close()
+
+  async def _close(self):
+    # let a stopped search hand back its bestmove before quitting
+    async with self._busy:
+      await self._engine.quit()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def main():
+  parser = argparse.ArgumentParser(description="Analyse a position with a UCI engine.")
+  parser.add_argument("engine", help="the engine command line")
+  parser.add_argument("--fen", default=START_FEN, help="position to analyse")
+  parser.add_argument("--movetime", type=float, default=2.0, help="seconds to analyse for")
+  args = parser.parse_args()
+
+  with ExternalOpponent(shlex.split(args.engine), args.movetime) as engine:
+    print("engine:", engine.name)
+    engine.start(Game.from_fen(args.fen))
+    result = None
+    while result is None:
+      # the loop is free while the engine thinks, show its lines as they come
+      for info in engine.infos():
+        if "pv" in info:
+          print(format_info(info))
+      result = engine.poll()
+      threading.Event().wait(0.01)
+    print(result)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,101 @@
+"""A minimal UCI engine to stand in for real ones when testing.
+
+  python -m Chess.FakeEngine --delay 0.05 --depth 5
+
+It answers the handshake, then for every go prints one info line per
+"depth" --delay seconds apart and plays the first legal move in UCI order.
+Depth, movetime, stop, infinite, ponder and ponderhit behave as the protocol
+requires, so the timing of a client's I/O can be checked without a strong
+engine.
+"""
+import argparse
+import sys
+import threading
+
+from Chess.Model import Game, START_FEN, move_uci
+
+class FakeEngine:
+  """The engine behind the command line, fed one command at a time.
+  Searches run on a thread so stop and ponderhit are read while they do.
+  """
+
+  def __init__(self, delay, depth):
+    self.delay = delay
+    self.depth = depth
+    self.game = Game.from_fen(START_FEN)
+    self._thread = None
+    self._stop = threading.Event()
+    self._release = threading.Event()
+    self._lock = threading.Lock()
+
+  def send(self, line):
+    with self._lock:
+      sys.stdout.write(line + "\n")
+      sys.stdout.flush()
+
+  def handle(self, line):
+    """Act on one command line. Return False after quit."""
+    tokens = line.split()
+    command = tokens[0] if tokens else ""
+    if command == "uci":
+      self.send("id name FakeEngine")
+      self.send("option name Hash type spin default 1 min 1 max 1")
+      self.send("uciok")
+    elif command == "isready":
+      self.send("readyok")
+    elif command == "position":
+      self.finish()
+      end = tokens.index("moves") if "moves" in tokens else len(tokens)
+      self.game = Game.from_fen(START_FEN if tokens[1] == "startpos" else " ".join(tokens[2:end]))
+      for text in tokens[end + 1:]:
+        self.game.make_move(self.game.parse_uci(text))
+    elif command == "go":
+      self.finish()
+      self._stop.clear()
+      self._release.clear()
+      self._thread = threading.Thread(target=self._search, args=(tokens[1:],), daemon=True)
+      self._thread.start()
+    elif command == "stop":
+      self.finish()
+    elif command == "ponderhit":
+      self._release.set()
+    elif command == "quit":
+      self.finish()
+      return False
+    return True
+
+  def finish(self):
+    """Stop a running search and wait for its bestmove."""
+    if self._thread is not None:
+      self._stop.set()
+      self._release.set()
+      self._thread.join()
+      self._thread = None
+
+  def _search(self, args):
+    depth = int(args[args.index("depth") + 1]) if "depth" in args else self.depth
+    waiting = "infinite" in args or "ponder" in args
+    if "movetime" in args:
+      depth = min(depth, max(1, int(int(args[args.index("movetime") + 1]) / 1000 / self.delay)))
+    moves = sorted(self.game.legal_moves(), key=move_uci)
+    for d in range(1, depth + 1):
+      if not moves or self._stop.wait(self.delay):
+        break
+      self.send("info depth %d score cp %d nodes %d nps %d time %d pv %s" % (d, 10 * d, 1000 * d,
+        int(1000 / self.delay), int(d * self.delay * 1000), move_uci(moves[0])))
+    if waiting:
+      self._release.wait()
+    self.send("bestmove %s" % (move_uci(moves[0]) if moves else "(none)"))
+
+def main():
+  parser = argparse.ArgumentParser(description="A stand-in UCI engine for tests.")
+  parser.add_argument("--delay", type=float, default=0.05, help="seconds between info lines")
+  parser.add_argument("--depth", type=int, default=5, help="depth searched without a depth limit")
+  args = parser.parse_args()
+  engine = FakeEngine(args.delay, args.depth)
+  for line in sys.stdin:
+    if not engine.handle(line):
+      break
+
+if __name__ == '__main__':
+  main()
@@ -1,26 +1,424 @@
 from enum import Enum
+import random
+
+from Chess import Tables
+
+# Piece kinds. Together with the colour they index the bitboards: the set of
+# squares holding a piece is Game._bitboards[colour.value * 6 + kind].
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# A move is a 16 bit integer: the from square in bits 0-5, the to square in
+# bits 6-11 and one of these flags in bits 12-15. Promotions are
+# PROMOTION | (kind - KNIGHT), or'd with CAPTURE when they also capture.
+QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT = range(6)
+PROMOTION = 8
+
+def encode_move(frm, to, flag=QUIET):
+  return frm | to << 6 | flag << 12
+
+def move_from(move):
+  return move & 63
+
+def move_to(move):
+  return (move >> 6) & 63
+
+def move_flag(move):
+  return move >> 12
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# Material values in centipawns
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def square(rank, file):
+  """Return the bitboard index (a1 = 0 ... h8 = 63) of a board position.
+
+  Positions use the view's coordinates: rank is the column (0 is the a-file)
+  and file is the row counted from black's side (0 is the 8th rank).
+  """
+  return (7 - file) * 8 + rank
+
+def square_name(sq):
+  """Return the algebraic name of a square, e.g. 'e4'."""
+  return "abcdefgh"[sq & 7] + str((sq >> 3) + 1)
+
+def move_uci(move):
+  """Return a move in UCI long algebraic notation, e.g. 'e7e8q'."""
+  result = square_name(move & 63) + square_name((move >> 6) & 63)
+  if move >> 12 & PROMOTION:
+    result += "nbrq"[(move >> 12) & 3]
+  return result
+
+# bitboard square of each square name
+_SQUARES = {square_name(sq): sq for sq in range(64)}
+
+_FEN_PIECES = "PNBRQKpnbrqk"
+_FEN_CASTLING = {"K": WHITE_KINGSIDE, "Q": WHITE_QUEENSIDE, "k": BLACK_KINGSIDE, "q": BLACK_QUEENSIDE}
+
+# Attack tables, memory mapped from a cache file built on first use. The
+# small per-square tables are copied into lists, which index faster; the
+# magic indexed slider tables stay mapped, shared by every process.
+_tables = Tables.load()
+KNIGHT_ATTACKS = _tables["knight"].tolist()
+KING_ATTACKS = _tables["king"].tolist()
+# squares attacked by a pawn of each colour standing on a square
+PAWN_ATTACKS = [_tables["pawn"][:64].tolist(), _tables["pawn"][64:].tolist()]
+# BETWEEN[a * 64 + b] holds the squares strictly between two aligned squares
+BETWEEN = _tables["between"].tolist()
+
+_ROOK_MASKS, _ROOK_MAGICS = _tables["rook_masks"].tolist(), _tables["rook_magics"].tolist()
+_ROOK_SHIFTS, _ROOK_OFFSETS = _tables["rook_shifts"].tolist(), _tables["rook_offsets"].tolist()
+_ROOK_ATTACKS = _tables["rook_attacks"]
+_BISHOP_MASKS, _BISHOP_MAGICS = _tables["bishop_masks"].tolist(), _tables["bishop_magics"].tolist()
+_BISHOP_SHIFTS, _BISHOP_OFFSETS = _tables["bishop_shifts"].tolist(), _tables["bishop_offsets"].tolist()
+_BISHOP_ATTACKS = _tables["bishop_attacks"]
+
+def rook_attacks(sq, occupied):
+  """Return the squares a rook on sq attacks given the occupied squares."""
+  return _ROOK_ATTACKS[_ROOK_OFFSETS[sq]
+    + (((occupied & _ROOK_MASKS[sq]) * _ROOK_MAGICS[sq] & 0xFFFFFFFFFFFFFFFF) >> _ROOK_SHIFTS[sq])]
+
+def bishop_attacks(sq, occupied):
+  """Return the squares a bishop on sq attacks given the occupied squares."""
+  return _BISHOP_ATTACKS[_BISHOP_OFFSETS[sq]
+    + (((occupied & _BISHOP_MASKS[sq]) * _BISHOP_MAGICS[sq] & 0xFFFFFFFFFFFFFFFF) >> _BISHOP_SHIFTS[sq])]
+
+# Castling rights that survive a piece moving from or to each square
+_CASTLING_MASK = [15] * 64
+_CASTLING_MASK[0] = 15 ^ WHITE_QUEENSIDE
+_CASTLING_MASK[7] = 15 ^ WHITE_KINGSIDE
+_CASTLING_MASK[4] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+_CASTLING_MASK[56] = 15 ^ BLACK_QUEENSIDE
+_CASTLING_MASK[63] = 15 ^ BLACK_KINGSIDE
+_CASTLING_MASK[60] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+
+# Zobrist keys: one per piece code and square (code * 64 + sq), one per set
+# of castling rights, one per en passant file and one for black to move.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [_zobrist_random.getrandbits(64) for _ in range(12 * 64)]
+ZOBRIST_CASTLING = [0] + [_zobrist_random.getrandbits(64) for _ in range(15)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+# Piece-square tables from white's side, a8 first so they read like a
+# board. Black uses the same tables mirrored.
+_PAWN_TABLE = (
+    0,   0,   0,   0,   0,   0,   0,   0,
+   50,  50,  50,  50,  50,  50,  50,  50,
+   10,  10,  20,  30,  30,  20,  10,  10,
+    5,   5,  10,  25,  25,  10,   5,   5,
+    0,   0,   0,  20,  20,   0,   0,   0,
+    5,  -5, -10,   0,   0, -10,  -5,   5,
+    5,  10,  10, -20, -20,  10,  10,   5,
+    0,   0,   0,   0,   0,   0,   0,   0)
+_KNIGHT_TABLE = (
+  -50, -40, -30, -30, -30, -30, -40, -50,
+  -40, -20,   0,   0,   0,   0, -20, -40,
+  -30,   0,  10,  15,  15,  10,   0, -30,
+  -30,   5,  15,  20,  20,  15,   5, -30,
+  -30,   0,  15,  20,  20,  15,   0, -30,
+  -30,   5,  10,  15,  15,  10,   5, -30,
+  -40, -20,   0,   5,   5,   0, -20, -40,
+  -50, -40, -30, -30, -30, -30, -40, -50)
+_BISHOP_TABLE = (
+  -20, -10, -10, -10, -10, -10, -10, -20,
+  -10,   0,   0,   0,   0,   0,   0, -10,
+  -10,   0,   5,  10,  10,   5,   0, -10,
+  -10,   5,   5,  10,  10,   5,   5, -10,
+  -10,   0,  10,  10,  10,  10,   0, -10,
+  -10,  10,  10,  10,  10,  10,  10, -10,
+  -10,   5,   0,   0,   0,   0,   5, -10,
+  -20, -10, -10, -10, -10, -10, -10, -20)
+_ROOK_TABLE = (
+    0,   0,   0,   0,   0,   0,   0,   0,
+    5,  10,  10,  10,  10,  10,  10,   5,
+   -5,   0,   0,   0,   0,   0,   0,  -5,
+   -5,   0,   0,   0,   0,   0,   0,  -5,
+   -5,   0,   0,   0,   0,   0,   0,  -5,
+   -5,   0,   0,   0,   0,   0,   0,  -5,
+   -5,   0,   0,   0,   0,   0,   0,  -5,
+    0,   0,   0,   5,   5,   0,   0,   0)
+_QUEEN_TABLE = (
+  -20, -10, -10,  -5,  -5, -10, -10, -20,
+  -10,   0,   0,   0,   0,   0,   0, -10,
+  -10,   0,   5,   5,   5,   5,   0, -10,
+   -5,   0,   5,   5,   5,   5,   0,  -5,
+    0,   0,   5,   5,   5,   5,   0,  -5,
+  -10,   5,   5,   5,   5,   5,   0, -10,
+  -10,   0,   5,   0,   0,   0,   0, -10,
+  -20, -10, -10,  -5,  -5, -10, -10, -20)
+# the king hides while queens and rooks are about and walks to the centre later
+_KING_MIDDLE_TABLE = (
+  -30, -40, -40, -50, -50, -40, -40, -30,
+  -30, -40, -40, -50, -50, -40, -40, -30,
+  -30, -40, -40, -50, -50, -40, -40, -30,
+  -30, -40, -40, -50, -50, -40, -40, -30,
+  -20, -30, -30, -40, -40, -30, -30, -20,
+  -10, -20, -20, -20, -20, -20, -20, -10,
+   20,  20,   0,   0,   0,   0,  20,  20,
+   20,  30,  10,   0,   0,  10,  30,  20)
+_KING_END_TABLE = (
+  -50, -40, -30, -20, -20, -30, -40, -50,
+  -30, -20, -10,   0,   0, -10, -20, -30,
+  -30, -10,  20,  30,  30,  20, -10, -30,
+  -30, -10,  30,  40,  40,  30, -10, -30,
+  -30, -10,  30,  40,  40,  30, -10, -30,
+  -30, -10,  20,  30,  30,  20, -10, -30,
+  -30, -30,   0,   0,   0,   0, -30, -30,
+  -50, -30, -30, -30, -30, -30, -30, -50)
+
+def _signed_table(tables, values):
+  """Return [code * 64 + sq] entries of value + table bonus, negative for black."""
+  entries = []
+  for colour, sign in ((0, 1), (1, -1)):
+    for table, value in zip(tables, values):
+      # the tables are laid out a8 first, which is white's a1 flipped
+      entries += [sign * (value + table[sq ^ 56 if colour == 0 else sq]) for sq in range(64)]
+  return entries
+
+# material plus position of every piece but the kings, from white's side
+PIECE_SQUARE = _signed_table((_PAWN_TABLE, _KNIGHT_TABLE, _BISHOP_TABLE, _ROOK_TABLE, _QUEEN_TABLE, (0,) * 64),
+  PIECE_VALUES)
+# [colour * 64 + sq] king bonuses from each side's own view
+_KING_MIDDLE = [_KING_MIDDLE_TABLE[sq ^ 56] for sq in range(64)] + list(_KING_MIDDLE_TABLE)
+_KING_END = [_KING_END_TABLE[sq ^ 56] for sq in range(64)] + list(_KING_END_TABLE)
+# how much each piece code counts towards the middle game, 24 with all on the board
+GAME_PHASE = (0, 1, 1, 2, 4, 0) * 2
+_MIDDLE_GAME = 24
+
+# The undo stack holds, per ply: move, captured piece, castling rights,
+# en passant square, halfmove clock, Zobrist key, evaluation score and game
+# phase before the move. It is allocated with room for this many plies and
+# doubles when a game outgrows it.
+UNDO_STACK_SIZE = 256
+_UNDO_FIELDS = 8
+
+# Parsed FEN ranks, one dictionary per rank keyed on the rank's text. Most
+# ranks in a database of positions repeat, so parsing one is usually a
+# dictionary lookup.
+_fen_rows = [{} for _ in range(8)]
+
+def _fen_row(text, rank):
+  """Parse one FEN rank into (mailbox entries, [(piece code, bits)], Zobrist key,
+  piece-square score, game phase).
+  """
+  row_mailbox = []
+  bits = {}
+  key = 0
+  score = 0
+  phase = 0
+  for char in text:
+    if char in "12345678":
+      row_mailbox += [-1] * int(char)
+      continue
+    code = _FEN_PIECES.find(char)
+    if code < 0:
+      raise ValueError("invalid FEN piece %r" % char)
+    sq = rank * 8 + len(row_mailbox)
+    bits[code] = bits.get(code, 0) | 1 << sq
+    key ^= ZOBRIST_PIECES[code * 64 + sq]
+    score += PIECE_SQUARE[code * 64 + sq]
+    phase += GAME_PHASE[code]
+    row_mailbox.append(code)
+  if len(row_mailbox) != 8:
+    raise ValueError("invalid FEN rank %r" % text)
+  entry = (row_mailbox, tuple(bits.items()), key, score, phase)
+  cache = _fen_rows[rank]
+  if len(cache) > 50000:
+    cache.clear()
+  cache[text] = entry
+  return entry
+
+_FULL = (1 << 64) - 1
+_RANK_1, _RANK_8 = 0xFF, 0xFF << 56
 
 class Game:
-  """A chess game with game state information."""
+  """A chess game with game state information.
+
+  The board is held as twelve 64-bit piece sets (one per colour and kind)
+  plus occupancy sets for each colour and both, with a 64 entry mailbox of
+  piece codes (colour * 6 + kind, -1 when empty) for square lookups. Piece
+  objects are only a view of this state for the UI and are kept in a second
+  square table so lookups never scan the piece list.
+  """
 
   def __init__(self, positions=None):
-    """Create a new game with default starting positions."""
+    """Create a new game from a list of pieces, the default starting positions if None.
+    White moves first and castling rights are given where king and rook are home.
+    """
     if positions is None:
-      self._positions = self._init_positions()
-    else:
-      self._position = positions
+      positions = self._init_positions()
+    self._set_pieces(positions)
 
     # true if white's turn
     self.turn = True
     self.playing = True
     self.focused = None
 
+    # castling rights are kept only where king and rook are still home
+    self._castling = 0
+    for right, king, rook in ((WHITE_KINGSIDE, 4, 7), (WHITE_QUEENSIDE, 4, 0), (BLACK_KINGSIDE, 60, 63), (BLACK_QUEENSIDE, 60, 56)):
+      colour = 0 if king == 4 else 1
+      if self._mailbox[king] == colour * 6 + KING and self._mailbox[rook] == colour * 6 + ROOK:
+        self._castling |= right
+    # square a pawn may capture en passant onto, -1 if none
+    self._ep = -1
+    self._halfmove = 0
+    self._fullmove = 1
+    self._reset_undo()
+    self._key = self._compute_key()
+    self._score, self._phase = self._compute_score()
+
+  @classmethod
+  def from_fen(cls, fen):
+    """Create a game from a FEN string.
+    Raises ValueError if the string is not a valid FEN.
+    """
+    game = cls.__new__(cls)
+    game._set_fen(fen)
+    return game
+
+  def to_fen(self):
+    """Return the FEN string of the current position."""
+    mailbox = self._mailbox
+    rows = []
+    for rank in range(7, -1, -1):
+      row = ""
+      empty = 0
+      for code in mailbox[rank * 8:rank * 8 + 8]:
+        if code < 0:
+          empty += 1
+          continue
+        if empty:
+          row += str(empty)
+          empty = 0
+        row += _FEN_PIECES[code]
+      rows.append(row + str(empty) if empty else row)
+    castling = "".join(char for char, right in _FEN_CASTLING.items() if self._castling & right) or "-"
+    ep = square_name(self._ep) if self._ep >= 0 else "-"
+    return "%s %s %s %s %d %d" % ("/".join(rows), "w" if self.turn else "b", castling, ep, self._halfmove, self._fullmove)
+
   def is_playing(self):
     return self.playing
 
+  def is_repetition(self, count=1):
+    """Return True if the current position occurred count times before.
+    The keys are read from the undo stack, and only positions since the
+    last capture or pawn move, with the same side to move, can match.
+    """
+    key = self._key
+    undo = self._undo
+    stop = self._ply - self._halfmove
+    # two plies back cannot repeat, each side has moved once since
+    i = (self._ply - 4) * _UNDO_FIELDS + 5
+    end = max(stop, 0) * _UNDO_FIELDS
+    while i >= end:
+      if undo[i] == key:
+        count -= 1
+        if count == 0:
+          return True
+      i -= 2 * _UNDO_FIELDS
+    return False
+
+  def is_fifty_moves(self):
+    """Return True if fifty moves each have passed without a capture or pawn move."""
+    return self._halfmove >= 100
+
+  def is_draw(self):
+    """Return True if the position repeats an earlier one or the fifty-move
+    rule applies. A single repetition is enough, as search scores it; the
+    game itself only ends at the third occurrence, see outcome().
+    """
+    if self._halfmove >= 100:
+      # checkmate on the last move still wins
+      return not self.in_check() or bool(self.legal_moves())
+    return self.is_repetition()
+
+  def outcome(self):
+    """Return None while the game goes on, else (result, reason) with result
+    one of '1-0', '0-1' or '1/2-1/2'.
+    """
+    if not self.legal_moves():
+      if self.in_check():
+        return ("0-1" if self.turn else "1-0"), "checkmate"
+      return "1/2-1/2", "stalemate"
+    if self.is_repetition(2):
+      return "1/2-1/2", "threefold repetition"
+    if self.is_fifty_moves():
+      return "1/2-1/2", "fifty-move rule"
+    return None
+
   def move(self, rank, file):
-    print(rank, file)
-    return self.focused.move(Position(rank, file))
+    """Move the focused piece to the given position if that is legal.
+    Pawns reaching the last rank are promoted to queens.
+
+    Return True if a valid move and False otherwise.
+    """
+    frm = self.focused.get_square()
+    to = square(rank, file)
+    for move in self.legal_moves():
+      if move & 63 == frm and (move >> 6) & 63 == to:
+        if move >> 12 & PROMOTION and (move >> 12) & 3 != QUEEN - KNIGHT:
+          continue
+        self.play(move)
+        return True
+    return False
+
+  def play(self, move):
+    """Play a legal move, updating the Piece views to match.
+    playing is cleared once the game is over.
+    """
+    if self._squares is not None:
+      self._update_views(move)
+    else:
+      self._view_undo.append(None)
+    self.make_move(move)
+    self.playing = self.outcome() is None
+
+  def takeback(self):
+    """Take back the last move made with play().
+
+    Return True if a move was taken back and False if there is none.
+    """
+    if not self._view_undo:
+      return False
+    record = self._view_undo.pop()
+    self.unmake_move()
+    self.playing = True
+    if record is None:
+      # played before the views existed, rebuild them when next needed
+      self._squares = None
+      self.focused = None
+      return True
+    move, captured, cap_sq, pawn = record
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+
+    self._move_view(to, frm)
+    if pawn is not None:
+      self._replace_view(self._squares[frm], pawn)
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+      rook_from, rook_to = (to + 1, to - 1) if flag == KING_CASTLE else (to - 2, to + 1)
+      self._move_view(rook_to, rook_from)
+    if captured is not None:
+      self._captured.pop()
+      self._positions.append(captured)
+      self._squares[cap_sq] = captured
+    self.focused = None
+    return True
+
+  def get_ply(self):
+    """Return the number of moves made on the undo stack."""
+    return self._ply
+
+  def get_moves(self):
+    """Return the moves on the undo stack, oldest first."""
+    undo = self._undo
+    return [undo[i * _UNDO_FIELDS] for i in range(self._ply)]
 
   def get_focused(self):
     return self.focused
@@ -31,52 +429,847 @@ class Game:
   def get_model(self):
     return self.focused.get_model_idx()
 
+  def get_zobrist_key(self):
+    """Return the 64-bit Zobrist key of the current position."""
+    return self._key
+
+  def get_bitboards(self):
+    """Return the twelve piece sets, indexed by colour * 6 + kind."""
+    return tuple(self._bitboards)
+
+  def get_castling_rights(self):
+    """Return the castling rights as WHITE_KINGSIDE | ... bits."""
+    return self._castling
+
+  def get_ep_square(self):
+    """Return the square a pawn may capture en passant onto, -1 if none."""
+    return self._ep
+
+  def ep_capture_legal(self):
+    """Return whether the side to move has a legal en passant capture."""
+    if self._ep < 0:
+      return False
+    us = 0 if self.turn else 1
+    ksq = self._bitboards[us * 6 + KING].bit_length() - 1
+    pawns = PAWN_ATTACKS[us ^ 1][self._ep] & self._bitboards[us * 6 + PAWN]
+    while pawns:
+      pbit = pawns & -pawns
+      pawns ^= pbit
+      if self._ep_is_legal(us, ksq, pbit.bit_length() - 1):
+        return True
+    return False
+
+  def get_piece(self, rank, file):
+    """Return the piece at the given position or None if it is empty."""
+    if self._squares is None:
+      self._build_views()
+    return self._squares[square(rank, file)]
+
+  def get_pieces(self):
+    """Return the pieces still on the board."""
+    if self._squares is None:
+      self._build_views()
+    return self._positions
+
+  def get_captured(self):
+    """Return the captured pieces in the order they were taken."""
+    return self._captured
+
   def set_focused(self, position):
-      for piece in self._positions:
-          if piece.get_position().get_rank() == position[0] and piece.get_position().get_file() == position[1]:
-              self.focused = piece 
-              return
+    piece = self.get_piece(position[0], position[1])
+    if piece is not None:
+      self.focused = piece
 
   def unfocus(self):
     self.focused = None
 
+  def in_check(self):
+    """Return True if the side to move is in check."""
+    us = 0 if self.turn else 1
+    king = self._bitboards[us * 6 + KING]
+    return bool(self._attacked(king.bit_length() - 1, us ^ 1, self._occupancy[2]))
+
+  def is_checkmate(self):
+    return self.in_check() and not self.legal_moves()
+
+  def is_stalemate(self):
+    return not self.in_check() and not self.legal_moves()
+
+  def parse_uci(self, text):
+    """Return the legal move written in UCI long algebraic notation, e.g. 'e7e8q'.
+    Raises ValueError if it is not a legal move.
+    """
+    for move in self.legal_moves():
+      if move_uci(move) == text:
+        return move
+    raise ValueError("illegal move %r in %s" % (text, self.to_fen()))
+
+  def parse_san(self, san):
+    """Return the legal move written in standard algebraic notation, e.g. 'Nbd7'.
+    Raises ValueError if no legal move, or more than one, matches.
+    """
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+      flag = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+      for move in self.legal_moves():
+        if move >> 12 == flag:
+          return move
+      raise ValueError("illegal move %r" % san)
+
+    promotion = -1
+    if len(text) > 2 and text[-1] in "NBRQ":
+      promotion = "NBRQ".index(text[-1])
+      text = text[:-2] if text[-2] == "=" else text[:-1]
+    kind = PAWN
+    if text and text[0] in "NBRQK":
+      kind = "PNBRQK".index(text[0])
+      text = text[1:]
+    to = _SQUARES.get(text[-2:])
+    if to is None:
+      raise ValueError("invalid move %r" % san)
+    hint = text[:-2].replace("x", "")
+    file = "abcdefgh".find(hint[0]) if hint and hint[0] in "abcdefgh" else -1
+    rank = int(hint[-1]) - 1 if hint and hint[-1] in "12345678" else -1
+
+    found = 0
+    mailbox = self._mailbox
+    for move in self.legal_moves():
+      frm = move & 63
+      if (move >> 6) & 63 != to or mailbox[frm] % 6 != kind:
+        continue
+      if (file >= 0 and frm & 7 != file) or (rank >= 0 and frm >> 3 != rank):
+        continue
+      if move >> 12 & PROMOTION:
+        if (move >> 12) & 3 != promotion:
+          continue
+      elif promotion >= 0:
+        continue
+      if found:
+        raise ValueError("ambiguous move %r" % san)
+      found = move
+    if not found:
+      raise ValueError("illegal move %r" % san)
+    return found
+
+  def san(self, move):
+    """Return a legal move in standard algebraic notation, e.g. 'Nbd7+'."""
+    flag = move >> 12
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+      text = "O-O" if flag == KING_CASTLE else "O-O-O"
+    else:
+      frm = move & 63
+      to = (move >> 6) & 63
+      mailbox = self._mailbox
+      kind = mailbox[frm] % 6
+      capture = "x" if flag & CAPTURE else ""
+      if kind == PAWN:
+        text = ("abcdefgh"[frm & 7] + capture if capture else "") + square_name(to)
+        if flag & PROMOTION:
+          text += "=" + "NBRQ"[flag & 3]
+      else:
+        # name the file, else the rank, else both when another such piece can go there
+        others = [m & 63 for m in self.legal_moves()
+          if (m >> 6) & 63 == to and m & 63 != frm and mailbox[m & 63] == mailbox[frm]]
+        hint = ""
+        if others:
+          if all(other & 7 != frm & 7 for other in others):
+            hint = "abcdefgh"[frm & 7]
+          elif all(other >> 3 != frm >> 3 for other in others):
+            hint = str((frm >> 3) + 1)
+          else:
+            hint = square_name(frm)
+        text = "PNBRQK"[kind] + hint + capture + square_name(to)
+    self.make_move(move)
+    if self.in_check():
+      text += "+" if self.legal_moves() else "#"
+    self.unmake_move()
+    return text
+
+  def piece_count(self):
+    """Return the number of pieces on the board, kings included."""
+    return bin(self._occupancy[2]).count("1")
+
+  def piece_on(self, sq):
+    """Return the piece code (colour * 6 + kind) on a square, -1 if empty."""
+    return self._mailbox[sq]
+
+  def evaluate(self):
+    """Return the static evaluation in centipawns from the side to move's view.
+
+    Material and piece-square scores are kept up to date by make_move, so
+    this only adds the kings, whose tables blend from middle game to
+    endgame as pieces come off.
+    """
+    bbs = self._bitboards
+    white = bbs[KING].bit_length() - 1
+    # black's entries follow white's 64
+    black = bbs[6 + KING].bit_length() + 63
+    phase = self._phase if self._phase < _MIDDLE_GAME else _MIDDLE_GAME
+    # blended per side so mirrored positions round the same way
+    score = self._score \
+      + (_KING_MIDDLE[white] * phase + _KING_END[white] * (_MIDDLE_GAME - phase)) // _MIDDLE_GAME \
+      - (_KING_MIDDLE[black] * phase + _KING_END[black] * (_MIDDLE_GAME - phase)) // _MIDDLE_GAME
+    return score if self.turn else -score
+
+  def legal_moves(self):
+    """Return the legal moves for the side to move as encoded integers."""
+    moves = []
+    append = moves.append
+    us = 0 if self.turn else 1
+    them = us ^ 1
+    bbs = self._bitboards
+    occ = self._occupancy[2]
+    own = self._occupancy[us]
+    enemy = self._occupancy[them]
+    base, ebase = us * 6, them * 6
+    enemy_rq = bbs[ebase + ROOK] | bbs[ebase + QUEEN]
+    enemy_bq = bbs[ebase + BISHOP] | bbs[ebase + QUEEN]
+
+    king = bbs[base + KING]
+    ksq = king.bit_length() - 1
+    checkers = (KNIGHT_ATTACKS[ksq] & bbs[ebase + KNIGHT]) | (PAWN_ATTACKS[us][ksq] & bbs[ebase + PAWN]) \
+      | (rook_attacks(ksq, occ) & enemy_rq) | (bishop_attacks(ksq, occ) & enemy_bq)
+
+    # The king may not step along a checking ray, so test its targets with
+    # the king itself taken off the board.
+    without_king = occ ^ king
+    targets = KING_ATTACKS[ksq] & ~own
+    while targets:
+      bit = targets & -targets
+      targets ^= bit
+      to = bit.bit_length() - 1
+      if not self._attacked(to, them, without_king):
+        append(ksq | to << 6 | (CAPTURE << 12 if bit & enemy else 0))
+    if checkers & (checkers - 1):
+      return moves
+
+    if checkers:
+      allowed = checkers | BETWEEN[ksq * 64 + checkers.bit_length() - 1]
+    else:
+      allowed = _FULL
+      self._castling_moves(us, them, occ, append)
+
+    # A piece is pinned when it is the only one between its king and an
+    # enemy slider; it may then only move along that line.
+    pinned = 0
+    pins = None
+    snipers = (rook_attacks(ksq, enemy) & enemy_rq) | (bishop_attacks(ksq, enemy) & enemy_bq)
+    while snipers:
+      bit = snipers & -snipers
+      snipers ^= bit
+      line = BETWEEN[ksq * 64 + bit.bit_length() - 1]
+      blockers = line & occ
+      if blockers & own and not blockers & (blockers - 1):
+        pinned |= blockers
+        if pins is None:
+          pins = {}
+        pins[blockers.bit_length() - 1] = line | bit
+
+    targets_mask = ~own & allowed
+    pieces = bbs[base + KNIGHT] & ~pinned
+    while pieces:
+      bit = pieces & -pieces
+      pieces ^= bit
+      frm = bit.bit_length() - 1
+      self._add_moves(frm, KNIGHT_ATTACKS[frm] & targets_mask, enemy, append)
+    for kind, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, None)):
+      pieces = bbs[base + kind]
+      while pieces:
+        bit = pieces & -pieces
+        pieces ^= bit
+        frm = bit.bit_length() - 1
+        if attacks is None:
+          targets = (rook_attacks(frm, occ) | bishop_attacks(frm, occ)) & targets_mask
+        else:
+          targets = attacks(frm, occ) & targets_mask
+        if bit & pinned:
+          targets &= pins[frm]
+        self._add_moves(frm, targets, enemy, append)
+
+    self._pawn_moves(us, ksq, occ, enemy, allowed, pinned, pins, append)
+    return moves
+
+  def perft(self, depth):
+    """Count the leaf nodes of the legal move tree depth plies deep."""
+    moves = self.legal_moves()
+    if depth <= 1:
+      return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+      self.make_move(move)
+      nodes += self.perft(depth - 1)
+      self.unmake_move()
+    return nodes
+
+  def _add_moves(self, frm, targets, enemy, append):
+    while targets:
+      bit = targets & -targets
+      targets ^= bit
+      append(frm | (bit.bit_length() - 1) << 6 | (CAPTURE << 12 if bit & enemy else 0))
+
+  def _pawn_moves(self, us, ksq, occ, enemy, allowed, pinned, pins, append):
+    bbs = self._bitboards
+    forward = 8 if us == 0 else -8
+    start = 1 if us == 0 else 6
+    last = _RANK_8 if us == 0 else _RANK_1
+    pawns = bbs[us * 6 + PAWN]
+    while pawns:
+      bit = pawns & -pawns
+      pawns ^= bit
+      frm = bit.bit_length() - 1
+      mask = allowed
+      if bit & pinned:
+        mask &= pins[frm]
+
+      to = frm + forward
+      if not occ >> to & 1:
+        if mask >> to & 1:
+          if last >> to & 1:
+            for promotion in (PROMOTION | 3, PROMOTION | 2, PROMOTION | 1, PROMOTION):
+              append(frm | to << 6 | promotion << 12)
+          else:
+            append(frm | to << 6)
+        two = to + forward
+        if frm >> 3 == start and not occ >> two & 1 and mask >> two & 1:
+          append(frm | two << 6 | DOUBLE_PUSH << 12)
+
+      targets = PAWN_ATTACKS[us][frm] & enemy & mask
+      while targets:
+        tbit = targets & -targets
+        targets ^= tbit
+        to = tbit.bit_length() - 1
+        if tbit & last:
+          for promotion in (PROMOTION | 3, PROMOTION | 2, PROMOTION | 1, PROMOTION):
+            append(frm | to << 6 | (promotion | CAPTURE) << 12)
+        else:
+          append(frm | to << 6 | CAPTURE << 12)
+
+      if self._ep >= 0 and PAWN_ATTACKS[us][frm] >> self._ep & 1 and self._ep_is_legal(us, ksq, frm):
+        append(frm | self._ep << 6 | EN_PASSANT << 12)
+
+  def _ep_is_legal(self, us, ksq, frm):
+    """En passant moves two pawns at once, so test it on the resulting board."""
+    bbs = self._bitboards
+    ebase = (us ^ 1) * 6
+    captured = 1 << (self._ep - 8 if us == 0 else self._ep + 8)
+    occ = self._occupancy[2] ^ (1 << frm) ^ captured | (1 << self._ep)
+    return not ((rook_attacks(ksq, occ) & (bbs[ebase + ROOK] | bbs[ebase + QUEEN]))
+      or (bishop_attacks(ksq, occ) & (bbs[ebase + BISHOP] | bbs[ebase + QUEEN]))
+      or (KNIGHT_ATTACKS[ksq] & bbs[ebase + KNIGHT])
+      or (PAWN_ATTACKS[us][ksq] & bbs[ebase + PAWN] & ~captured))
+
+  def _castling_moves(self, us, them, occ, append):
+    """Add castling moves; the caller has checked we are not in check."""
+    if us == 0:
+      if self._castling & WHITE_KINGSIDE and not occ & 0x60 \
+          and not self._attacked(5, them, occ) and not self._attacked(6, them, occ):
+        append(4 | 6 << 6 | KING_CASTLE << 12)
+      if self._castling & WHITE_QUEENSIDE and not occ & 0x0E \
+          and not self._attacked(3, them, occ) and not self._attacked(2, them, occ):
+        append(4 | 2 << 6 | QUEEN_CASTLE << 12)
+    else:
+      if self._castling & BLACK_KINGSIDE and not occ & (0x60 << 56) \
+          and not self._attacked(61, them, occ) and not self._attacked(62, them, occ):
+        append(60 | 62 << 6 | KING_CASTLE << 12)
+      if self._castling & BLACK_QUEENSIDE and not occ & (0x0E << 56) \
+          and not self._attacked(59, them, occ) and not self._attacked(58, them, occ):
+        append(60 | 58 << 6 | QUEEN_CASTLE << 12)
+
+  def _attacked(self, sq, by, occ):
+    """Return a truthy value if colour by attacks sq given the occupancy."""
+    bbs = self._bitboards
+    base = by * 6
+    return (KNIGHT_ATTACKS[sq] & bbs[base + KNIGHT]) \
+      or (PAWN_ATTACKS[by ^ 1][sq] & bbs[base + PAWN]) \
+      or (KING_ATTACKS[sq] & bbs[base + KING]) \
+      or (bishop_attacks(sq, occ) & (bbs[base + BISHOP] | bbs[base + QUEEN])) \
+      or (rook_attacks(sq, occ) & (bbs[base + ROOK] | bbs[base + QUEEN]))
+
+  def make_move(self, move):
+    """Apply a legal encoded move to the board state.
+
+    What the move overwrites is saved on the undo stack so unmake_move can
+    restore it; nothing is allocated unless the stack has to grow. The
+    Piece views are left alone, use play() for moves the UI should show.
+    """
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+    us = 0 if self.turn else 1
+    bbs = self._bitboards
+    mailbox = self._mailbox
+    occupancy = self._occupancy
+    piece = mailbox[frm]
+    key = self._key
+    score = self._score
+    phase = self._phase
+    if self._ep >= 0 and PAWN_ATTACKS[us ^ 1][self._ep] & bbs[us * 6 + PAWN]:
+      key ^= ZOBRIST_EP[self._ep & 7]
+
+    captured = -1
+    if flag == EN_PASSANT:
+      cap_sq = to - 8 if us == 0 else to + 8
+      captured = mailbox[cap_sq]
+      bbs[captured] ^= 1 << cap_sq
+      occupancy[us ^ 1] ^= 1 << cap_sq
+      mailbox[cap_sq] = -1
+      key ^= ZOBRIST_PIECES[captured * 64 + cap_sq]
+      score -= PIECE_SQUARE[captured * 64 + cap_sq]
+    elif flag & CAPTURE:
+      captured = mailbox[to]
+      bbs[captured] ^= 1 << to
+      occupancy[us ^ 1] ^= 1 << to
+      key ^= ZOBRIST_PIECES[captured * 64 + to]
+      score -= PIECE_SQUARE[captured * 64 + to]
+      phase -= GAME_PHASE[captured]
+    i = self._ply * _UNDO_FIELDS
+    undo = self._undo
+    if i == len(undo):
+      undo.extend([0] * (len(undo) or _UNDO_FIELDS * UNDO_STACK_SIZE))
+    undo[i] = move
+    undo[i + 1] = captured
+    undo[i + 2] = self._castling
+    undo[i + 3] = self._ep
+    undo[i + 4] = self._halfmove
+    undo[i + 5] = self._key
+    undo[i + 6] = self._score
+    undo[i + 7] = self._phase
+    self._ply += 1
+
+    from_to = (1 << frm) | (1 << to)
+    bbs[piece] ^= from_to
+    occupancy[us] ^= from_to
+    mailbox[frm] = -1
+    mailbox[to] = piece
+    key ^= ZOBRIST_PIECES[piece * 64 + frm]
+    score -= PIECE_SQUARE[piece * 64 + frm]
+    if flag & PROMOTION:
+      promoted = us * 6 + (flag & 3) + KNIGHT
+      bbs[piece] ^= 1 << to
+      bbs[promoted] |= 1 << to
+      mailbox[to] = promoted
+      key ^= ZOBRIST_PIECES[promoted * 64 + to]
+      score += PIECE_SQUARE[promoted * 64 + to]
+      phase += GAME_PHASE[promoted]
+    else:
+      key ^= ZOBRIST_PIECES[piece * 64 + to]
+      score += PIECE_SQUARE[piece * 64 + to]
+      if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+        rook_from, rook_to = (to + 1, to - 1) if flag == KING_CASTLE else (to - 2, to + 1)
+        rook = mailbox[rook_from]
+        rook_bits = (1 << rook_from) | (1 << rook_to)
+        bbs[rook] ^= rook_bits
+        occupancy[us] ^= rook_bits
+        mailbox[rook_from] = -1
+        mailbox[rook_to] = rook
+        key ^= ZOBRIST_PIECES[rook * 64 + rook_from] ^ ZOBRIST_PIECES[rook * 64 + rook_to]
+        score += PIECE_SQUARE[rook * 64 + rook_to] - PIECE_SQUARE[rook * 64 + rook_from]
+    occupancy[2] = occupancy[0] | occupancy[1]
+
+    castling = self._castling & _CASTLING_MASK[frm] & _CASTLING_MASK[to]
+    key ^= ZOBRIST_CASTLING[self._castling] ^ ZOBRIST_CASTLING[castling]
+    self._castling = castling
+    if flag == DOUBLE_PUSH:
+      self._ep = (frm + to) >> 1
+      # only hash en passant squares that can really be captured on
+      if PAWN_ATTACKS[us][self._ep] & bbs[(us ^ 1) * 6 + PAWN]:
+        key ^= ZOBRIST_EP[self._ep & 7]
+    else:
+      self._ep = -1
+    self._halfmove = 0 if captured >= 0 or piece == us * 6 + PAWN else self._halfmove + 1
+    if us == 1:
+      self._fullmove += 1
+    self.turn = not self.turn
+    self._key = key ^ ZOBRIST_BLACK
+    self._score = score
+    self._phase = phase
+
+  def unmake_move(self):
+    """Take back the last move applied with make_move."""
+    self._ply -= 1
+    i = self._ply * _UNDO_FIELDS
+    undo = self._undo
+    move = undo[i]
+    captured = undo[i + 1]
+    self._castling = undo[i + 2]
+    self._ep = undo[i + 3]
+    self._halfmove = undo[i + 4]
+    self._key = undo[i + 5]
+    self._score = undo[i + 6]
+    self._phase = undo[i + 7]
+    self.turn = not self.turn
+    us = 0 if self.turn else 1
+    if us == 1:
+      self._fullmove -= 1
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+    bbs = self._bitboards
+    mailbox = self._mailbox
+    occupancy = self._occupancy
+
+    piece = mailbox[to]
+    if flag & PROMOTION:
+      bbs[piece] ^= 1 << to
+      piece = us * 6 + PAWN
+      bbs[piece] |= 1 << to
+    elif flag == KING_CASTLE or flag == QUEEN_CASTLE:
+      rook_from, rook_to = (to + 1, to - 1) if flag == KING_CASTLE else (to - 2, to + 1)
+      rook = mailbox[rook_to]
+      rook_bits = (1 << rook_from) | (1 << rook_to)
+      bbs[rook] ^= rook_bits
+      occupancy[us] ^= rook_bits
+      mailbox[rook_to] = -1
+      mailbox[rook_from] = rook
+    from_to = (1 << frm) | (1 << to)
+    bbs[piece] ^= from_to
+    occupancy[us] ^= from_to
+    mailbox[to] = -1
+    mailbox[frm] = piece
+
+    if captured >= 0:
+      cap_sq = to
+      if flag == EN_PASSANT:
+        cap_sq = to - 8 if us == 0 else to + 8
+      bbs[captured] |= 1 << cap_sq
+      occupancy[us ^ 1] |= 1 << cap_sq
+      mailbox[cap_sq] = captured
+    occupancy[2] = occupancy[0] | occupancy[1]
+
+  def _update_views(self, move):
+    """Move the Piece views to match a move about to be made."""
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+    squares = self._squares
+    piece = squares[frm]
+
+    captured, cap_sq = None, to
+    if flag & CAPTURE:
+      if flag == EN_PASSANT:
+        cap_sq = to - 8 if piece.get_colour() == Colour.WHITE else to + 8
+      captured = squares[cap_sq]
+      squares[cap_sq] = None
+      self._positions.remove(captured)
+      self._captured.append(captured)
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+      rook_from, rook_to = (to + 1, to - 1) if flag == KING_CASTLE else (to - 2, to + 1)
+      self._move_view(rook_from, rook_to)
+    pawn = None
+    if flag & PROMOTION:
+      # the promoted piece keeps the pawn's model
+      pawn = piece
+      piece = _PIECE_CLASSES[(flag & 3) + KNIGHT](pawn.get_position(), pawn.get_colour(), *pawn.get_model_idx())
+      self._replace_view(pawn, piece)
+    self._move_view(frm, to)
+    self._view_undo.append((move, captured, cap_sq, pawn))
+
+  def _move_view(self, frm, to):
+    piece = self._squares[frm]
+    self._squares[frm] = None
+    self._squares[to] = piece
+    piece._square = to
+
+  def _replace_view(self, old, new):
+    self._positions[self._positions.index(old)] = new
+    self._squares[old.get_square()] = new
+    if self.focused is old:
+      self.focused = new
+
+  def _reset_undo(self):
+    # allocated by the first make_move, positions loaded in bulk may never move
+    self._undo = []
+    self._ply = 0
+    self._view_undo = []
+
+  def _set_pieces(self, pieces):
+    """Set up the board from a list of pieces."""
+    self._positions = pieces
+    self._captured = []
+    self._bitboards = [0] * 12
+    # white, black and all pieces
+    self._occupancy = [0, 0, 0]
+    self._mailbox = [-1] * 64
+    self._squares = [None] * 64
+    for piece in pieces:
+      sq = piece.get_square()
+      colour = piece.get_colour().value
+      code = colour * 6 + piece.KIND
+      self._bitboards[code] |= 1 << sq
+      self._occupancy[colour] |= 1 << sq
+      self._mailbox[sq] = code
+      self._squares[sq] = piece
+    self._occupancy[2] = self._occupancy[0] | self._occupancy[1]
+
+  def _set_fen(self, fen):
+    """Set up the whole game state from a FEN string.
+
+    Only the bitboards are built here; the Piece views are created the
+    first time something asks for them.
+    """
+    fields = fen.split()
+    rows = fields[0].split("/") if fields else ()
+    if len(rows) != 8 or len(fields) < 4 or fields[1] not in ("w", "b"):
+      raise ValueError("invalid FEN: %r" % fen)
+
+    bbs = [0] * 12
+    mailbox = []
+    key = 0
+    score = 0
+    phase = 0
+    rank = 0
+    for text in reversed(rows):
+      entry = _fen_rows[rank].get(text)
+      if entry is None:
+        entry = _fen_row(text, rank)
+      mailbox += entry[0]
+      for code, bits in entry[1]:
+        bbs[code] |= bits
+      key ^= entry[2]
+      score += entry[3]
+      phase += entry[4]
+      rank += 1
+    if not bbs[KING] or not bbs[6 + KING]:
+      raise ValueError("invalid FEN, missing king: %r" % fen)
+    self._bitboards = bbs
+    white = bbs[0] | bbs[1] | bbs[2] | bbs[3] | bbs[4] | bbs[5]
+    black = bbs[6] | bbs[7] | bbs[8] | bbs[9] | bbs[10] | bbs[11]
+    self._occupancy = [white, black, white | black]
+    self._mailbox = mailbox
+    self._score = score
+    self._phase = phase
+    self._squares = None
+    self._positions = None
+    self._captured = []
+
+    self.turn = fields[1] == "w"
+    self.playing = True
+    self.focused = None
+    castling = 0
+    try:
+      if fields[2] != "-":
+        for char in fields[2]:
+          castling |= _FEN_CASTLING[char]
+      self._ep = -1 if fields[3] == "-" else _SQUARES[fields[3]]
+    except KeyError:
+      raise ValueError("invalid FEN: %r" % fen) from None
+    self._castling = castling
+    self._halfmove = int(fields[4]) if len(fields) > 4 else 0
+    self._fullmove = int(fields[5]) if len(fields) > 5 else 1
+    self._reset_undo()
+
+    key ^= ZOBRIST_CASTLING[castling]
+    if not self.turn:
+      key ^= ZOBRIST_BLACK
+    us = 0 if self.turn else 1
+    if self._ep >= 0 and PAWN_ATTACKS[us ^ 1][self._ep] & bbs[us * 6 + PAWN]:
+      key ^= ZOBRIST_EP[self._ep & 7]
+    self._key = key
+
+  def _build_views(self):
+    """Create Piece views for a board set up without them."""
+    pieces = []
+    counts = {}
+    for sq, code in enumerate(self._mailbox):
+      if code < 0:
+        continue
+      kind = code % 6
+      colour = Colour.WHITE if code < 6 else Colour.BLACK
+      model, idx = _model_name(colour, kind), None
+      if kind not in (QUEEN, KING):
+        idx = counts.get(model, 0)
+        counts[model] = idx + 1
+      pieces.append(_PIECE_CLASSES[kind](Position.of_square(sq), colour, model, idx))
+    self._positions = pieces
+    self._squares = [None] * 64
+    for piece in pieces:
+      self._squares[piece.get_square()] = piece
+
+  def _compute_key(self):
+    """Compute the Zobrist key of the position from scratch."""
+    key = ZOBRIST_CASTLING[self._castling]
+    for sq, code in enumerate(self._mailbox):
+      if code >= 0:
+        key ^= ZOBRIST_PIECES[code * 64 + sq]
+    us = 0 if self.turn else 1
+    if self._ep >= 0 and PAWN_ATTACKS[us ^ 1][self._ep] & self._bitboards[us * 6 + PAWN]:
+      key ^= ZOBRIST_EP[self._ep & 7]
+    if not self.turn:
+      key ^= ZOBRIST_BLACK
+    return key
+
+  def _compute_score(self):
+    """Compute the piece-square score and game phase from scratch."""
+    score = phase = 0
+    for sq, code in enumerate(self._mailbox):
+      if code >= 0:
+        score += PIECE_SQUARE[code * 64 + sq]
+        phase += GAME_PHASE[code]
+    return score, phase
+
   def _init_positions(self):
     """Default starting positions."""
     result = []
     for file in range(8):
-      result.append(Pawn(Position(7-file, 1), Colour.BLACK, False, "blackPawnModels", file))
-      result.append(Pawn(Position(7-file, 6), Colour.WHITE, False, "whitePawnModels", file))
+      result.append(Pawn(Position.of(7-file, 1), Colour.BLACK, "blackPawnModels", file))
+      result.append(Pawn(Position.of(7-file, 6), Colour.WHITE, "whitePawnModels", file))
 
-    result.append(Rook(Position(0, 0), Colour.BLACK, "blackRookModels", 0))
-    result.append(Rook(Position(7, 0), Colour.BLACK, "blackRookModels", 1))
-    result.append(Rook(Position(0, 7), Colour.WHITE, "whiteRookModels", 0))
-    result.append(Rook(Position(7, 7), Colour.WHITE, "whiteRookModels", 1))
+    result.append(Rook(Position.of(0, 0), Colour.BLACK, "blackRookModels", 0))
+    result.append(Rook(Position.of(7, 0), Colour.BLACK, "blackRookModels", 1))
+    result.append(Rook(Position.of(0, 7), Colour.WHITE, "whiteRookModels", 0))
+    result.append(Rook(Position.of(7, 7), Colour.WHITE, "whiteRookModels", 1))
 
-    result.append(Knight(Position(1, 0), Colour.BLACK, "blackKnightModels", 0))
-    result.append(Knight(Position(6, 0), Colour.BLACK, "blackKnightModels", 1))
-    result.append(Knight(Position(1, 7), Colour.WHITE, "whiteKnightModels", 0))
-    result.append(Knight(Position(6, 7), Colour.WHITE, "whiteKnightModels",1))
+    result.append(Knight(Position.of(1, 0), Colour.BLACK, "blackKnightModels", 0))
+    result.append(Knight(Position.of(6, 0), Colour.BLACK, "blackKnightModels", 1))
+    result.append(Knight(Position.of(1, 7), Colour.WHITE, "whiteKnightModels", 0))
+    result.append(Knight(Position.of(6, 7), Colour.WHITE, "whiteKnightModels",1))
 
-    result.append(Bishop(Position(2, 0), Colour.BLACK, "blackBishopModels", 0))
-    result.append(Bishop(Position(5, 0), Colour.BLACK, "blackBishopModels", 1))
-    result.append(Bishop(Position(2, 7), Colour.WHITE, "whiteBishopModels", 0))
-    result.append(Bishop(Position(5, 7), Colour.WHITE, "whiteBishopModels",1))
+    result.append(Bishop(Position.of(2, 0), Colour.BLACK, "blackBishopModels", 0))
+    result.append(Bishop(Position.of(5, 0), Colour.BLACK, "blackBishopModels", 1))
+    result.append(Bishop(Position.of(2, 7), Colour.WHITE, "whiteBishopModels", 0))
+    result.append(Bishop(Position.of(5, 7), Colour.WHITE, "whiteBishopModels",1))
 
-    result.append(Queen(Position(3, 0), Colour.BLACK, "blackQueenModel"))
-    result.append(Queen(Position(3, 7), Colour.WHITE, "whiteQueenModel"))
+    result.append(Queen(Position.of(3, 0), Colour.BLACK, "blackQueenModel"))
+    result.append(Queen(Position.of(3, 7), Colour.WHITE, "whiteQueenModel"))
 
-    result.append(King(Position(4, 0), Colour.BLACK, "blackKingModel"))
-    result.append(King(Position(4, 7), Colour.WHITE, "whiteKingModel"))
+    result.append(King(Position.of(4, 0), Colour.BLACK, "blackKingModel"))
+    result.append(King(Position.of(4, 7), Colour.WHITE, "whiteKingModel"))
 
     return result
 
+# Bound types stored in the transposition table
+EXACT_BOUND, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+class TranspositionTable:
+  """A fixed-size hash table of search results keyed on Zobrist keys.
+
+  The table is one preallocated buffer of 64-bit words split into buckets of
+  four entries (64 bytes). Each entry is a key word and a data word packing
+  the move (16 bits), score (16 bits), depth (8 bits), bound (2 bits) and
+  the search generation it was written in (6 bits). The key word is stored
+  XOR'd with the data so a torn write reads back as a miss.
+
+  A new entry replaces the same position if present, otherwise an empty
+  slot, otherwise the entry with the lowest depth, older generations first.
+  """
+  BUCKET_SIZE = 4
+  ENTRY_BYTES = 16
+
+  def __init__(self, size_mb=16, buffer=None):
+    """Create a table using at most size_mb megabytes.
+    Parameters:
+      size_mb:  the memory budget, rounded down to a power of two buckets
+      buffer:   optional writable buffer to use instead of allocating one
+    """
+    size = self.table_bytes(size_mb)
+    self._buckets = size // (self.BUCKET_SIZE * self.ENTRY_BYTES)
+    if buffer is None:
+      buffer = bytearray(size)
+    self._table = memoryview(buffer).cast("B")[:size].cast("Q")
+    self._generation = 0
+    self.hits = 0
+    self.misses = 0
+    self.overwrites = 0
+
+  @classmethod
+  def table_bytes(cls, size_mb):
+    """Return the bytes a table with a budget of size_mb megabytes uses."""
+    bucket_bytes = cls.BUCKET_SIZE * cls.ENTRY_BYTES
+    buckets = max(1, int(size_mb * 1024 * 1024) // bucket_bytes)
+    return (1 << (buckets.bit_length() - 1)) * bucket_bytes
+
+  def size_bytes(self):
+    return self._buckets * self.BUCKET_SIZE * self.ENTRY_BYTES
+
+  def close(self):
+    """Release the table's view of its buffer, e.g. before closing shared memory."""
+    self._table.release()
+
+  def probe(self, key):
+    """Return (move, score, depth, bound) stored for a key, or None."""
+    table = self._table
+    index = (key & (self._buckets - 1)) << 3
+    for slot in range(index, index + 8, 2):
+      data = table[slot + 1]
+      if table[slot] ^ data == key and data:
+        self.hits += 1
+        return data & 0xFFFF, ((data >> 16) & 0xFFFF) - 0x8000, (data >> 32) & 0xFF, (data >> 40) & 3
+    self.misses += 1
+    return None
+
+  def store(self, key, move, score, depth, bound):
+    """Record a search result for a position."""
+    table = self._table
+    generation = self._generation
+    index = (key & (self._buckets - 1)) << 3
+    data = move | (score + 0x8000) << 16 | depth << 32 | bound << 40 | generation << 42
+
+    replace = index
+    worst = None
+    for slot in range(index, index + 8, 2):
+      old = table[slot + 1]
+      if not old:
+        replace = slot
+        break
+      if table[slot] ^ old == key:
+        # keep the old best move if this search did not find one
+        if not move:
+          data |= old & 0xFFFF
+        replace = slot
+        break
+      age = (generation - (old >> 42)) & 63
+      value = ((old >> 32) & 0xFF) - 8 * age
+      if worst is None or value < worst:
+        worst = value
+        replace = slot
+    else:
+      self.overwrites += 1
+    table[replace] = key ^ data
+    table[replace + 1] = data
+
+  def new_search(self):
+    """Start a new search generation so older entries are replaced first."""
+    self._generation = (self._generation + 1) & 63
+
+  def clear(self):
+    table = self._table
+    for i in range(len(table)):
+      table[i] = 0
+    self._generation = 0
+    self.hits = self.misses = self.overwrites = 0
+
+  def hashfull(self):
+    """Return how full the table is in permille, sampled from the first buckets."""
+    sample = min(self._buckets, 250) * 8
+    used = sum(1 for slot in range(1, sample, 2) if self._table[slot])
+    return used * 1000 // (sample // 2)
+
+  def stats(self):
+    return {"hits": self.hits, "misses": self.misses, "overwrites": self.overwrites, "bytes": self.size_bytes()}
+
 class Position:
-  """Represent a position on the board."""
+  """Represent a position on the board.
+
+  There are only 64 positions, so use Position.of to get the shared
+  instance rather than creating new ones.
+  """
+  __slots__ = ("_rank", "_file")
+
   def __init__(self, rank, file):
     """Create a new position with the given rank and file."""
     self._rank = rank
     self._file = file
 
+  @staticmethod
+  def of(rank, file):
+    """Return the shared position with the given rank and file."""
+    return _POSITIONS[(7 - file) * 8 + rank]
+
+  @staticmethod
+  def of_square(sq):
+    """Return the shared position of a bitboard square."""
+    return _POSITIONS[sq]
+
   def get_rank(self):
     """Return this position's rank."""
     return self._rank
@@ -85,11 +1278,21 @@ class Position:
     """Return this position's file."""
     return self._file
 
+  def get_square(self):
+    """Return this position's bitboard square."""
+    return (7 - self._file) * 8 + self._rank
+
+# the shared positions, indexed by bitboard square
+_POSITIONS = tuple(Position(sq & 7, 7 - (sq >> 3)) for sq in range(64))
+
 class Piece:
   """Represent a piece on the board."""
+  __slots__ = ("_square", "_colour", "_model", "_idx")
+  KIND = None
+
   def __init__(self, position, colour, model, idx=None):
     """Initialise a new piece with the given position."""
-    self._position = position
+    self._square = position.get_square()
     self._colour = colour
     self._model = model
     self._idx = idx
@@ -98,49 +1301,47 @@ class Piece:
       return self._model, self._idx
 
   def get_position(self):
-    return self._position
+    return _POSITIONS[self._square]
 
-  def move(self, position: Position):
-    """(Abstract) move the piece to the new position.
-    Parameters:
-      position:  the position to move to
+  def get_square(self):
+    """Return the bitboard square of this piece."""
+    return self._square
 
-    Return True if a valid move and False otherwise.
-    """
-    pass
+  def get_colour(self):
+    return self._colour
 
 class Pawn(Piece):
   """A pawn piece."""
-  def __init__(self, position: Position, colour, en_passant: bool, model, idx):
-    """Initialise a new pawn piece."""
-    super().__init__(position, colour, model, idx)
-    self._en_passant = en_passant
-
-  def move(self, position):
-    # Check the given move is valid
-    mult = 1 if self._colour == Colour.WHITE else -1
-    if mult * (self._position.get_file() - position.get_file()) not in [1, 2]:
-      return False # too far vertically
-    # TODO
-    self._position = position 
-    return True
+  __slots__ = ()
+  KIND = PAWN
 
 class Rook(Piece):
-  pass
+  __slots__ = ()
+  KIND = ROOK
 
 class Knight(Piece):
-  pass
+  __slots__ = ()
+  KIND = KNIGHT
 
 class Bishop(Piece):
-  pass
+  __slots__ = ()
+  KIND = BISHOP
 
 class Queen(Piece):
-  pass
+  __slots__ = ()
+  KIND = QUEEN
 
 class King(Piece):
-  pass
+  __slots__ = ()
+  KIND = KING
+
+_PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
+
+def _model_name(colour, kind):
+  """Return the name of the view model drawn for a piece."""
+  name = ("white" if colour == Colour.WHITE else "black") + _PIECE_CLASSES[kind].__name__
+  return name + ("Model" if kind in (QUEEN, KING) else "Models")
 
 class Colour(Enum):
   WHITE = 0
   BLACK = 1
-
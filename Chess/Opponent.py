@@ -0,0 +1,167 @@
+"""A computer opponent that thinks in a background process.
+
+The render loop must never wait on a search, so Opponent hands positions to
+a worker process and collects its moves through queues it only polls:
+
+  opponent = Opponent(movetime=2.0)
+  opponent.start(game)         # returns at once
+  ...
+  result = opponent.poll()     # a SearchResult once the move is ready, else None
+  opponent.force()             # play the best move found so far
+  opponent.cancel()            # throw the search away
+  opponent.ponder(game, result)  # think on the predicted reply meanwhile
+  opponent.close()
+
+A process rather than a thread keeps the search off the GIL the render loop
+needs, so frames are not slowed while the computer thinks.
+
+While the human is choosing a move the worker can ponder: search the
+position after the reply its last search predicted. If that reply is played
+the same search carries on with its tables and iterations intact, and the
+time it has already spent counts towards the move, so the answer usually
+comes at once.
+"""
+import multiprocessing
+import pickle
+import queue
+
+from Chess.Search import Searcher, SearchLimits, best_move
+
+def _worker_main(requests, results, stop_event, ponderhit_event, wanted, forced, hit, hash_mb, book_path,
+    tablebase_dir):
+  """Search each (id, pickled game, limits) request until told to exit with None."""
+  from Chess.Book import OpeningBook
+  from Chess.Tablebase import Tablebase
+  searcher = Searcher(hash_mb=hash_mb, stop_event=stop_event, ponderhit_event=ponderhit_event,
+    tablebase=Tablebase(tablebase_dir) if tablebase_dir else None)
+  book = OpeningBook(book_path) if book_path else None
+  while True:
+    request = requests.get()
+    if request is None:
+      break
+    ident, game, limits = request
+    game = pickle.loads(game)
+    stop_event.clear()
+    ponderhit_event.clear()
+    # cancelled before it was picked up; wanted is changed before stop_event
+    # is set, so a cancel is never missed between the two checks
+    if wanted.value != ident:
+      continue
+    if forced.value == ident:
+      stop_event.set()
+    if hit.value == ident:
+      ponderhit_event.set()
+    result = best_move(game, limits, searcher, book)
+    results.put((ident, result))
+  if book is not None:
+    book.close()
+
+class Opponent:
+  """A searcher in a worker process that the caller polls for moves."""
+
+  def __init__(self, movetime=1.0, hash_mb=16, book=None, tablebases=None):
+    """Start the worker process.
+    Parameters:
+      movetime:    seconds the worker may think per move
+      hash_mb:     size of the worker's transposition table
+      book:        path of a Polyglot book to play openings from
+      tablebases:  directory of endgame tables
+    """
+    self.movetime = movetime
+    self._requests = multiprocessing.Queue()
+    self._results = multiprocessing.Queue()
+    self._stop_event = multiprocessing.Event()
+    self._ponderhit_event = multiprocessing.Event()
+    self._wanted = multiprocessing.Value('q', 0, lock=False)
+    self._forced = multiprocessing.Value('q', 0, lock=False)
+    self._hit = multiprocessing.Value('q', 0, lock=False)
+    self._ident = 0
+    # Zobrist key of the position being pondered, None when not pondering
+    self._ponder_key = None
+    self._process = multiprocessing.Process(target=_worker_main, args=(self._requests, self._results,
+      self._stop_event, self._ponderhit_event, self._wanted, self._forced, self._hit, hash_mb, book,
+      tablebases), daemon=True)
+    self._process.start()
+
+  @property
+  def thinking(self):
+    """True from start() until its move has been returned by poll() or it is cancelled."""
+    return self._wanted.value != 0 and self._ponder_key is None
+
+  @property
+  def pondering(self):
+    """True while searching the predicted reply on the human's time."""
+    return self._ponder_key is not None
+
+  def start(self, game, limits=None):
+    """Start searching a copy of the game, cancelling any search under way.
+    If the game reached the position being pondered, that search becomes
+    the search for this move instead.
+    """
+    if self._ponder_key is not None and self._ponder_key == game.get_zobrist_key():
+      self._ponder_key = None
+      self._hit.value = self._wanted.value
+      self._ponderhit_event.set()
+      return
+    self.cancel()
+    self._send(game, limits or SearchLimits(movetime=self.movetime))
+
+  def ponder(self, game, result):
+    """Search the reply result predicts to the move just played in game.
+    Does nothing when result has no predicted reply.
+    """
+    self.cancel()
+    if len(result.pv) < 2 or result.pv[1] not in game.legal_moves():
+      return
+    game.make_move(result.pv[1])
+    try:
+      self._send(game, SearchLimits(movetime=self.movetime, ponder=True))
+      self._ponder_key = game.get_zobrist_key()
+    finally:
+      game.unmake_move()
+
+  def _send(self, game, limits):
+    self._ident += 1
+    self._wanted.value = self._ident
+    # pickled now, the queue would pickle it later from another thread
+    self._requests.put((self._ident, pickle.dumps(game), limits))
+
+  def poll(self):
+    """Return the SearchResult of the current search if it is done, else None.
+    Never blocks.
+    """
+    while self.thinking:
+      try:
+        ident, result = self._results.get_nowait()
+      except queue.Empty:
+        return None
+      # results of cancelled searches are dropped as they arrive
+      if ident == self._wanted.value:
+        self._wanted.value = 0
+        return result
+    return None
+
+  def force(self):
+    """Make the current search return its best move so far."""
+    if self.thinking:
+      self._forced.value = self._wanted.value
+      self._stop_event.set()
+
+  def cancel(self):
+    """Stop the current search or ponder and discard its result."""
+    self._ponder_key = None
+    if self._wanted.value != 0:
+      self._wanted.value = 0
+      self._stop_event.set()
+
+  def close(self):
+    """Stop the worker process."""
+    self.cancel()
+    self._requests.put(None)
+    self._process.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
@@ -0,0 +1,147 @@
+"""Multi-core search for analysis.
+
+ParallelSearcher runs a lazy SMP search: the main process and a pool of
+helper processes search the same position at the same time and share one
+transposition table in shared memory, so each process cuts off on work the
+others have already done. Python threads cannot do this because of the GIL.
+
+The speedup from 1 to N workers can be measured with
+
+  python -m Chess.Parallel --workers 8 --depth 5
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import queue
+from multiprocessing import shared_memory
+
+from Chess.Model import Game, TranspositionTable
+from Chess.Perft import REFERENCE_POSITIONS
+from Chess.Search import Searcher, SearchLimits, MAX_PLY
+
+def _helper_main(shm_name, hash_mb, tasks, results, stop_event):
+  """Search every (pickled game, depth) task given until told to exit with None."""
+  shm = shared_memory.SharedMemory(name=shm_name)
+  tt = TranspositionTable(hash_mb, buffer=shm.buf)
+  searcher = Searcher(tt, stop_event=stop_event)
+  while True:
+    task = tasks.get()
+    if task is None:
+      break
+    game, depth = task
+    searcher.search(pickle.loads(game), SearchLimits(depth=depth))
+    results.put(searcher.nodes)
+  tt.close()
+  shm.close()
+
+class ParallelSearcher:
+  """A lazy SMP searcher using one process per worker."""
+
+  def __init__(self, workers=None, hash_mb=64, ponderhit_event=None):
+    """Start workers - 1 helper processes, all cores when workers is None.
+    A ponderhit_event is passed on to the main process's Searcher.
+    """
+    self.workers = workers or os.cpu_count() or 1
+    self._shm = shared_memory.SharedMemory(create=True, size=TranspositionTable.table_bytes(hash_mb))
+    self.tt = TranspositionTable(hash_mb, buffer=self._shm.buf)
+    self._stop_event = multiprocessing.Event()
+    self._results = multiprocessing.Queue()
+    self._searcher = Searcher(self.tt, ponderhit_event=ponderhit_event)
+    self._helpers = []
+    for _ in range(self.workers - 1):
+      tasks = multiprocessing.Queue()
+      process = multiprocessing.Process(target=_helper_main,
+        args=(self._shm.name, hash_mb, tasks, self._results, self._stop_event), daemon=True)
+      process.start()
+      self._helpers.append((process, tasks))
+
+  def search(self, game, limits=None, info=None):
+    """Search like Searcher.search with the helpers running alongside.
+    The limits apply to the main process; the nodes reported are the total.
+    """
+    limits = limits or SearchLimits()
+    self._stop_event.clear()
+    # pickled now, the queue would pickle it later from its feeder thread
+    # while the main search below has moves made on it
+    position = pickle.dumps(game)
+    sent = 0
+    for i, (process, tasks) in enumerate(self._helpers):
+      if process.is_alive():
+        # half the helpers aim one ply deeper so they do not all move in step
+        tasks.put((position, min(limits.depth + i % 2, MAX_PLY)))
+        sent += 1
+    try:
+      result = self._searcher.search(game, limits, info)
+    finally:
+      self._stop_event.set()
+      helper_nodes = self._collect(sent)
+    result.nodes += helper_nodes
+    result.nps = int(result.nodes / result.seconds) if result.seconds > 0 else result.nodes
+    return result
+
+  def _collect(self, pending):
+    """Return the nodes the helpers searched, waiting for pending answers
+    but not for helpers that have died.
+    """
+    nodes = 0
+    while pending:
+      try:
+        nodes += self._results.get(timeout=0.1)
+        pending -= 1
+      except queue.Empty:
+        pending = min(pending, sum(process.is_alive() for process, _ in self._helpers))
+    return nodes
+
+  def stop(self):
+    self._searcher.stop()
+    self._stop_event.set()
+
+  def close(self):
+    """Stop the helpers and free the shared table."""
+    for _, tasks in self._helpers:
+      tasks.put(None)
+    for process, _ in self._helpers:
+      process.join()
+    self._helpers = []
+    self.tt.close()
+    self._shm.close()
+    self._shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def speedup_curve(fens, depth, max_workers, hash_mb=64):
+  """Time searching each position to a fixed depth with 1 to max_workers.
+
+  Return a list of (workers, seconds, nodes, speedup over one worker).
+  """
+  curve = []
+  for workers in range(1, max_workers + 1):
+    seconds = nodes = 0
+    with ParallelSearcher(workers, hash_mb) as searcher:
+      for fen in fens:
+        game = Game.from_fen(fen)
+        result = searcher.search(game, SearchLimits(depth=depth))
+        seconds += result.seconds
+        nodes += result.nodes
+    curve.append((workers, seconds, nodes, curve[0][1] / seconds if curve else 1.0))
+  return curve
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure the parallel search speedup from 1 to N workers.")
+  parser.add_argument("--workers", type=int, default=os.cpu_count())
+  parser.add_argument("--depth", type=int, default=4)
+  parser.add_argument("--hash", type=int, default=64, help="transposition table size in MB")
+  args = parser.parse_args()
+
+  fens = [fen for _, fen, _ in REFERENCE_POSITIONS]
+  print("workers   seconds       nodes        nps  speedup")
+  for workers, seconds, nodes, speedup in speedup_curve(fens, args.depth, args.workers, args.hash):
+    print("%7d %9.2f %11d %10.0f %8.2f" % (workers, seconds, nodes, nodes / max(seconds, 1e-9), speedup))
+
+if __name__ == '__main__':
+  main()
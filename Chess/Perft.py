@@ -0,0 +1,97 @@
+"""Perft benchmark for the move generator.
+
+Counts the leaf nodes of the legal move tree and reports nodes per second.
+The standard reference positions double as a correctness check:
+
+  python -m Chess.Perft 5
+  python -m Chess.Perft 4 --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1" --divide
+  python -m Chess.Perft --check
+
+--evaluate times the static evaluation instead, on every position a few
+plies into the reference positions.
+"""
+import argparse
+import time
+
+from Chess.Model import Game, START_FEN, move_uci
+
+# (name, fen, node counts from depth 1)
+REFERENCE_POSITIONS = [
+  ("start", START_FEN, [20, 400, 8902, 197281, 4865609]),
+  ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+  ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+  ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+  ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+  ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+def run(fen, depth, divide=False):
+  """Run perft on a position and return (nodes, seconds)."""
+  game = Game.from_fen(fen)
+  start = time.perf_counter()
+  if divide:
+    nodes = 0
+    for move in game.legal_moves():
+      game.make_move(move)
+      count = game.perft(depth - 1)
+      game.unmake_move()
+      print("%s: %d" % (move_uci(move), count))
+      nodes += count
+  else:
+    nodes = game.perft(depth)
+  return nodes, time.perf_counter() - start
+
+def check(max_depth):
+  """Compare every reference position up to max_depth. Return True if all match."""
+  ok = True
+  for name, fen, counts in REFERENCE_POSITIONS:
+    for depth, expected in enumerate(counts[:max_depth], 1):
+      nodes, seconds = run(fen, depth)
+      status = "ok" if nodes == expected else "FAILED (expected %d)" % expected
+      print("%-10s depth %d: %10d nodes %8.2fs %10.0f nps  %s" % (name, depth, nodes, seconds, nodes / max(seconds, 1e-9), status))
+      ok = ok and nodes == expected
+  return ok
+
+def evaluation_speed(depth=2, rounds=20):
+  """Time Game.evaluate on every position depth plies into the reference
+  positions. Return (evaluations, seconds).
+  """
+  positions = []
+  def collect(game, depth):
+    if depth == 0:
+      positions.append(Game.from_fen(game.to_fen()))
+      return
+    for move in game.legal_moves():
+      game.make_move(move)
+      collect(game, depth - 1)
+      game.unmake_move()
+  for _, fen, _ in REFERENCE_POSITIONS:
+    collect(Game.from_fen(fen), depth)
+
+  start = time.perf_counter()
+  for _ in range(rounds):
+    for game in positions:
+      game.evaluate()
+  return len(positions) * rounds, time.perf_counter() - start
+
+def main():
+  parser = argparse.ArgumentParser(description="Count legal move tree leaves and report nodes/second.")
+  parser.add_argument("depth", type=int, nargs="?", default=4)
+  parser.add_argument("--fen", default=START_FEN)
+  parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+  parser.add_argument("--check", action="store_true", help="verify the reference positions up to depth")
+  parser.add_argument("--evaluate", action="store_true", help="benchmark the static evaluation instead")
+  args = parser.parse_args()
+
+  if args.evaluate:
+    evaluations, seconds = evaluation_speed()
+    print("evaluations %d time %.3fs %.0f evaluations/s" % (evaluations, seconds, evaluations / max(seconds, 1e-9)))
+    return
+
+  if args.check:
+    raise SystemExit(0 if check(args.depth) else 1)
+  nodes, seconds = run(args.fen, args.depth, args.divide)
+  print("nodes %d time %.3fs nps %.0f" % (nodes, seconds, nodes / max(seconds, 1e-9)))
+
+if __name__ == '__main__':
+  main()
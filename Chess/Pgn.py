@@ -0,0 +1,241 @@
+"""Streaming PGN reader and replayer.
+
+read_games yields the games of a PGN file one at a time from any iterable
+of lines, so a multi-GB archive (or stdin) is read in constant memory.
+replay plays a game's moves through Game, raising ValueError on the first
+illegal one, and format_game writes a game back out. verify_file splits a
+file at game boundaries and checks the pieces in a pool of processes:
+
+  python -m Chess.Pgn archive.pgn --workers 8
+  zcat archive.pgn.gz | python -m Chess.Pgn -
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from Chess.Model import Game, START_FEN
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};]+')
+_RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+class PgnGame:
+  """The tag pairs, SAN moves and result of one game."""
+  def __init__(self, headers, moves, result):
+    self.headers = headers
+    self.moves = moves
+    self.result = result
+
+  def __repr__(self):
+    return "PgnGame(%s vs %s, %d moves, %s)" % (
+      self.headers.get("White", "?"), self.headers.get("Black", "?"), len(self.moves), self.result)
+
+# tags every game starts with, in this order
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+def format_game(pgn):
+  """Return a PgnGame as PGN text, movetext wrapped at 80 columns."""
+  headers = dict(pgn.headers)
+  headers["Result"] = pgn.result
+  lines = []
+  for name in SEVEN_TAG_ROSTER + tuple(name for name in headers if name not in SEVEN_TAG_ROSTER):
+    value = headers.get(name, "????.??.??" if name == "Date" else "?")
+    lines.append('[%s "%s"]' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')))
+  lines.append("")
+
+  fields = headers.get("FEN", START_FEN).split()
+  white = fields[1] == "w"
+  number = int(fields[5]) if len(fields) > 5 else 1
+  tokens = []
+  for i, san in enumerate(pgn.moves):
+    if white:
+      tokens.append("%d." % number)
+    elif i == 0:
+      tokens.append("%d..." % number)
+    tokens.append(san)
+    if not white:
+      number += 1
+    white = not white
+  tokens.append(pgn.result)
+
+  line = ""
+  for token in tokens:
+    if line and len(line) + 1 + len(token) > 80:
+      lines.append(line)
+      line = token
+    else:
+      line = line + " " + token if line else token
+  lines.append(line)
+  return "\n".join(lines) + "\n"
+
+def read_games(lines):
+  """Yield a PgnGame for every game in an iterable of lines."""
+  headers = {}
+  movetext = []
+  for line in lines:
+    line = line.strip()
+    if line.startswith("["):
+      if movetext:
+        yield _parse_game(headers, movetext)
+        headers = {}
+        movetext = []
+      match = _TAG.match(line)
+      if match:
+        headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+    elif line and not line.startswith("%"):
+      movetext.append(line)
+  if headers or movetext:
+    yield _parse_game(headers, movetext)
+
+def _parse_game(headers, movetext):
+  moves = []
+  result = headers.get("Result", "*")
+  variations = 0
+  # joined on newlines, which end ';' comments; a '{' comment is one token
+  # whatever lines it spans and whatever it contains
+  for token in _TOKEN.findall("\n".join(movetext)):
+    first = token[0]
+    if first == "{" or first == ";":
+      continue
+    elif first == "(":
+      variations += 1
+    elif first == ")":
+      variations -= 1
+    elif variations or first == "$" or token[-1] == ".":
+      continue
+    elif token in _RESULTS:
+      result = token
+    else:
+      moves.append(token)
+  return PgnGame(headers, moves, result)
+
+def replay(pgn):
+  """Play a PgnGame's moves from its starting position and return the Game.
+  Raises ValueError naming the first illegal move.
+  """
+  game = Game.from_fen(pgn.headers.get("FEN", START_FEN))
+  for ply, san in enumerate(pgn.moves):
+    try:
+      move = game.parse_san(san)
+    except ValueError as error:
+      raise ValueError("move %d%s %s: %s" % (ply // 2 + 1, "." if ply % 2 == 0 else "...", san, error)) from None
+    game.make_move(move)
+  return game
+
+class VerifyStats:
+  """Totals from replaying a set of games."""
+  # errors kept for reporting, everything past this is only counted
+  MAX_ERRORS = 100
+
+  def __init__(self):
+    self.games = 0
+    self.moves = 0
+    self.failed = 0
+    self.errors = []
+
+  def add(self, other):
+    self.games += other.games
+    self.moves += other.moves
+    self.failed += other.failed
+    self.errors += other.errors[:self.MAX_ERRORS - len(self.errors)]
+
+def verify(lines, stats=None):
+  """Replay every game in an iterable of lines and return the VerifyStats."""
+  stats = stats or VerifyStats()
+  for pgn in read_games(lines):
+    stats.games += 1
+    try:
+      stats.moves += replay(pgn).get_ply()
+    except ValueError as error:
+      stats.failed += 1
+      if len(stats.errors) < stats.MAX_ERRORS:
+        stats.errors.append("%s vs %s (%s): %s" % (pgn.headers.get("White", "?"),
+          pgn.headers.get("Black", "?"), pgn.headers.get("Date", "?"), error))
+  return stats
+
+def _is_game_start(previous, raw):
+  """A game starts at its first tag, whichever tag that is: a tag line
+  after a line that is not one.
+  """
+  return raw.lstrip().startswith(b"[") and not previous.lstrip().startswith(b"[")
+
+def shard_bounds(path, shards):
+  """Split a file into byte ranges that each start at a game's first tag.
+  A file without tag pairs has no boundaries to split at and is one shard.
+  """
+  size = os.path.getsize(path)
+  bounds = [0]
+  with open(path, "rb") as f:
+    for k in range(1, shards):
+      f.seek(max(size * k // shards, bounds[-1]))
+      # the line we landed in may be the end of a tag, so the next tag
+      # line only starts a game after some line that is not a tag
+      previous = b"["
+      if f.tell():
+        f.readline()
+      while True:
+        offset = f.tell()
+        raw = f.readline()
+        if not raw or _is_game_start(previous, raw):
+          break
+        previous = raw
+      if bounds[-1] < offset < size:
+        bounds.append(offset)
+  bounds.append(size)
+  return list(zip(bounds, bounds[1:]))
+
+def read_shard(path, start, end):
+  """Yield the decoded lines of the games starting in [start, end)."""
+  with open(path, "rb") as f:
+    f.seek(start)
+    offset = start
+    previous = b""
+    for raw in f:
+      if offset >= end and _is_game_start(previous, raw):
+        break
+      offset += len(raw)
+      previous = raw
+      yield raw.decode("utf-8", "replace")
+
+def _verify_shard(shard):
+  path, start, end = shard
+  return verify(read_shard(path, start, end))
+
+def verify_file(path, workers=None):
+  """Replay every game in a PGN file using a pool of worker processes."""
+  workers = workers or os.cpu_count() or 1
+  stats = VerifyStats()
+  if workers == 1:
+    return verify(read_shard(path, 0, os.path.getsize(path)), stats)
+  # more shards than workers so one slow shard does not hold up the rest
+  shards = [(path, start, end) for start, end in shard_bounds(path, workers * 8)]
+  with multiprocessing.Pool(workers) as pool:
+    for result in pool.imap_unordered(_verify_shard, shards):
+      stats.add(result)
+  return stats
+
+def main():
+  parser = argparse.ArgumentParser(description="Check every move of a PGN file is legal.")
+  parser.add_argument("pgn", help="PGN file, or - for stdin")
+  parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to use for a file")
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  if args.pgn == "-":
+    stats = verify(sys.stdin)
+  else:
+    stats = verify_file(args.pgn, args.workers)
+  seconds = time.perf_counter() - start
+
+  for error in stats.errors:
+    print(error)
+  print("games %d moves %d illegal %d time %.2fs (%.0f games/s, %.0f moves/s)" % (stats.games, stats.moves,
+    stats.failed, seconds, stats.games / max(seconds, 1e-9), stats.moves / max(seconds, 1e-9)))
+  if stats.failed:
+    raise SystemExit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,330 @@
+"""Alpha-beta search for playing against the computer.
+
+best_move(game, SearchLimits(movetime=1.0)) runs an iterative deepening
+negamax search with a transposition table and returns the move together
+with the search statistics.
+"""
+import time
+
+from Chess.Model import TranspositionTable, EXACT_BOUND, LOWER_BOUND, UPPER_BOUND, \
+  CAPTURE, EN_PASSANT, PROMOTION, PIECE_VALUES, PAWN, move_uci
+
+MATE = 30000
+INFINITY = 32000
+MAX_PLY = 64
+
+# scores within this distance of MATE are mates, stored relative to the node
+_MATE_BOUND = MATE - MAX_PLY
+
+class SearchLimits:
+  """When a search has to stop. Unset limits are not applied."""
+  def __init__(self, depth=None, nodes=None, movetime=None, ponder=False):
+    """Create search limits.
+    Parameters:
+      depth:     the deepest iteration to search
+      nodes:     a hard cap on nodes searched
+      movetime:  a hard cap on seconds spent
+      ponder:    search without the movetime until Searcher.ponderhit(), when
+                 the time already spent counts against it
+    """
+    if depth is None and nodes is None and movetime is None and not ponder:
+      depth = 4
+    self.depth = min(depth or MAX_PLY, MAX_PLY)
+    self.nodes = nodes
+    self.movetime = movetime
+    self.ponder = ponder
+
+class SearchResult:
+  """The outcome of a search."""
+  def __init__(self, move, score, depth, nodes, seconds, pv):
+    self.move = move
+    self.score = score
+    self.depth = depth
+    self.nodes = nodes
+    self.seconds = seconds
+    self.nps = int(nodes / seconds) if seconds > 0 else nodes
+    self.pv = pv
+
+  def __repr__(self):
+    return "SearchResult(move=%s, score=%d, depth=%d, nodes=%d, nps=%d, pv=%s)" % (
+      move_uci(self.move) if self.move else None, self.score, self.depth, self.nodes, self.nps,
+      " ".join(move_uci(move) for move in self.pv))
+
+class Searcher:
+  """A negamax alpha-beta searcher that keeps its tables between moves."""
+
+  def __init__(self, tt=None, hash_mb=16, stop_event=None, tablebase=None, ponderhit_event=None):
+    """Create a searcher.
+    Parameters:
+      tt:               the transposition table to use, a new one of hash_mb if None
+      stop_event:       optional threading/multiprocessing Event that stops the search when set
+      tablebase:        optional Tablebase giving exact scores for the endgames it holds
+      ponderhit_event:  optional Event that acts as ponderhit() when set
+    """
+    self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+    self.tablebase = tablebase
+    self.nodes = 0
+    self._stop_event = stop_event
+    self._ponderhit_event = ponderhit_event
+    self._stopped = False
+    self._pondering = False
+    self._ponder_hit = False
+    self._start = 0.0
+    self._movetime = None
+    self._deadline = None
+    self._max_nodes = None
+    self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+    self._history = [0] * 4096
+
+  def stop(self):
+    """Ask a running search to return as soon as possible."""
+    self._stopped = True
+
+  def ponderhit(self):
+    """Tell a pondering search the predicted move was played, so its movetime
+    now applies, counted from when the search started.
+    """
+    self._ponder_hit = True
+
+  def search(self, game, limits=None, info=None):
+    """Search the position and return a SearchResult.
+    Parameters:
+      game:    the position to search, left unchanged on return
+      limits:  a SearchLimits, depth 4 when not given
+      info:    optional callable given the SearchResult of every iteration
+    """
+    limits = limits or SearchLimits()
+    start = time.perf_counter()
+    self.nodes = 0
+    self._stopped = False
+    self._start = start
+    self._movetime = limits.movetime
+    self._pondering = limits.ponder
+    self._ponder_hit = False
+    self._deadline = start + limits.movetime if limits.movetime is not None and not limits.ponder else None
+    self._max_nodes = limits.nodes
+    self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+    self._history = [0] * 4096
+    self.tt.new_search()
+
+    moves = game.legal_moves()
+    result = SearchResult(moves[0] if moves else 0, 0, 0, 0, 0.0, moves[:1])
+    if len(moves) <= 1:
+      return result
+
+    for depth in range(1, limits.depth + 1):
+      move, score = self._root(game, moves, depth)
+      if move:
+        # previous best first, so a partial iteration is still sound
+        moves.remove(move)
+        moves.insert(0, move)
+        result = SearchResult(move, score, depth if not self._stopped else result.depth,
+          self.nodes, time.perf_counter() - start, self._pv(game, move, depth))
+      if self._stopped:
+        break
+      if info is not None:
+        info(result)
+      if abs(score) >= _MATE_BOUND:
+        break
+      # an iteration takes longer than everything before it
+      if self._deadline is not None and time.perf_counter() - start > (self._deadline - start) / 2:
+        break
+    result.nodes = self.nodes
+    result.seconds = time.perf_counter() - start
+    result.nps = int(result.nodes / result.seconds) if result.seconds > 0 else result.nodes
+    return result
+
+  def _root(self, game, moves, depth):
+    alpha, beta = -INFINITY, INFINITY
+    best_move = 0
+    for i, move in enumerate(moves):
+      game.make_move(move)
+      if i == 0:
+        score = -self._negamax(game, depth - 1, -beta, -alpha, 1)
+      else:
+        score = -self._negamax(game, depth - 1, -alpha - 1, -alpha, 1)
+        if alpha < score and not self._stopped:
+          score = -self._negamax(game, depth - 1, -beta, -alpha, 1)
+      game.unmake_move()
+      if self._stopped:
+        break
+      if score > alpha:
+        alpha = score
+        best_move = move
+    if best_move:
+      self.tt.store(game.get_zobrist_key(), best_move, alpha, depth, EXACT_BOUND)
+    return best_move, alpha
+
+  def _negamax(self, game, depth, alpha, beta, ply):
+    if game.is_draw():
+      self.nodes += 1
+      return 0
+
+    tablebase = self.tablebase
+    if tablebase is not None and game.piece_count() <= tablebase.max_men:
+      entry = tablebase.probe(game)
+      if entry is not None:
+        self.nodes += 1
+        wdl, plies = entry
+        return wdl * (MATE - ply - plies)
+
+    in_check = game.in_check()
+    if in_check:
+      depth += 1
+    if depth <= 0 or ply >= MAX_PLY:
+      return self._quiesce(game, alpha, beta, ply)
+
+    self.nodes += 1
+    if self._out_of_budget():
+      return 0
+
+    tt = self.tt
+    key = game.get_zobrist_key()
+    tt_move = 0
+    entry = tt.probe(key)
+    if entry is not None:
+      tt_move, score, entry_depth, bound = entry
+      if entry_depth >= depth:
+        if score >= _MATE_BOUND:
+          score -= ply
+        elif score <= -_MATE_BOUND:
+          score += ply
+        if bound == EXACT_BOUND or (bound == LOWER_BOUND and score >= beta) or (bound == UPPER_BOUND and score <= alpha):
+          return score
+
+    moves = game.legal_moves()
+    if not moves:
+      return -MATE + ply if in_check else 0
+    self._order(game, moves, tt_move, ply)
+
+    original_alpha = alpha
+    best_score = -INFINITY
+    best_move = 0
+    for i, move in enumerate(moves):
+      game.make_move(move)
+      if i == 0:
+        score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+      else:
+        score = -self._negamax(game, depth - 1, -alpha - 1, -alpha, ply + 1)
+        if alpha < score < beta and not self._stopped:
+          score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+      game.unmake_move()
+      if self._stopped:
+        return 0
+      if score > best_score:
+        best_score = score
+        best_move = move
+        if score > alpha:
+          alpha = score
+          if alpha >= beta:
+            if not move >> 12 & (CAPTURE | PROMOTION):
+              killers = self._killers[ply]
+              if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+              self._history[move & 4095] += depth * depth
+            break
+
+    if best_score >= beta:
+      bound = LOWER_BOUND
+    elif best_score > original_alpha:
+      bound = EXACT_BOUND
+    else:
+      bound = UPPER_BOUND
+    stored = best_score
+    if stored >= _MATE_BOUND:
+      stored += ply
+    elif stored <= -_MATE_BOUND:
+      stored -= ply
+    tt.store(key, best_move, stored, depth, bound)
+    return best_score
+
+  def _quiesce(self, game, alpha, beta, ply):
+    """Search captures and promotions only until the position is quiet."""
+    self.nodes += 1
+    if self._out_of_budget():
+      return 0
+    stand_pat = game.evaluate()
+    if stand_pat >= beta or ply >= MAX_PLY:
+      return stand_pat
+    if stand_pat > alpha:
+      alpha = stand_pat
+
+    moves = [move for move in game.legal_moves() if move >> 12 & (CAPTURE | PROMOTION)]
+    self._order(game, moves, 0, ply)
+    for move in moves:
+      game.make_move(move)
+      score = -self._quiesce(game, -beta, -alpha, ply + 1)
+      game.unmake_move()
+      if self._stopped:
+        return 0
+      if score > alpha:
+        alpha = score
+        if alpha >= beta:
+          break
+    return alpha
+
+  def _order(self, game, moves, tt_move, ply):
+    """Sort moves best first: hash move, captures by MVV-LVA, killers, history."""
+    killers = self._killers[ply]
+    history = self._history
+    piece_on = game.piece_on
+
+    def score(move):
+      if move == tt_move:
+        return 1 << 30
+      flag = move >> 12
+      if flag & CAPTURE:
+        victim = PAWN if flag == EN_PASSANT else piece_on((move >> 6) & 63) % 6
+        return (1 << 28) + PIECE_VALUES[victim] * 8 - piece_on(move & 63) % 6
+      if flag & PROMOTION:
+        return (1 << 27) + (flag & 3)
+      if move == killers[0] or move == killers[1]:
+        return 1 << 26
+      return history[move & 4095]
+    moves.sort(key=score, reverse=True)
+
+  def _out_of_budget(self):
+    if self._stopped:
+      return True
+    if self._max_nodes is not None and self.nodes >= self._max_nodes:
+      self._stopped = True
+    elif self.nodes & 255 == 0:
+      if self._pondering and (self._ponder_hit or
+          self._ponderhit_event is not None and self._ponderhit_event.is_set()):
+        self._pondering = False
+        if self._movetime is not None:
+          self._deadline = self._start + self._movetime
+      if self._deadline is not None and time.perf_counter() >= self._deadline:
+        self._stopped = True
+      elif self._stop_event is not None and self._stop_event.is_set():
+        self._stopped = True
+    return self._stopped
+
+  def _pv(self, game, move, depth):
+    """Follow the best moves stored in the transposition table."""
+    pv = [move]
+    game.make_move(move)
+    while len(pv) < depth:
+      entry = self.tt.probe(game.get_zobrist_key())
+      if entry is None or entry[0] not in game.legal_moves():
+        break
+      pv.append(entry[0])
+      game.make_move(entry[0])
+    for _ in pv:
+      game.unmake_move()
+    return pv
+
+def best_move(game, limits=None, searcher=None, book=None):
+  """Return the SearchResult of searching a game within the given limits.
+  When an OpeningBook is given and has the position, its move is returned
+  without searching.
+  """
+  if book is not None:
+    start = time.perf_counter()
+    move = book.choose(game)
+    if move:
+      return SearchResult(move, 0, 0, 0, time.perf_counter() - start, [move])
+  if searcher is None:
+    searcher = Searcher()
+  return searcher.search(game, limits)
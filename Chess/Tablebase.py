@@ -0,0 +1,465 @@
+"""Endgame tablebases.
+
+generate(name) solves an endgame such as "KQK", "KRK", "KPK" or a four man
+ending like "KQKR" by retrograde analysis: mates are found first, then every
+round marks the positions that can move into a position lost the round
+before as won, and the positions whose every move reaches a won position as
+lost. All positions of the table are handled at once with NumPy; captures
+and promotions leave the table and are valued from the smaller tables, which
+are solved first.
+
+A table holds a distance to mate in plies for both sides to move and every
+placement of the pieces (64 ** men squares, no symmetry reduction), packed
+into as few bits as the longest mate needs: 0 for draws and impossible
+positions, otherwise the distance + 1, an odd distance being a win for the
+side to move. Tablebase.probe reads one entry straight out of the memory
+mapped file.
+
+  python -m Chess.Tablebase KQK KRK KPK
+  python -m Chess.Tablebase --probe "8/8/8/4k3/8/8/3QK3/8 w - - 0 1"
+
+Positions with castling rights or a legal en passant capture are not
+probed, and en passant is ignored while solving.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from Chess.Model import Game, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_VALUES, \
+  KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, rook_attacks, bishop_attacks
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+DEFAULT_ENDGAMES = ("KQK", "KRK", "KPK")
+
+_LETTERS = "PNBRQK"
+# tag, endgame name, bits per entry, entry count
+_HEADER = struct.Struct("<8s8sIQ")
+_TAG = b"CHESSEGT"
+# positions handled per NumPy pass, to bound memory on four man tables
+_CHUNK = 1 << 20
+
+def _pair_table(attacks):
+  table = np.zeros(4096, dtype=bool)
+  for a in range(64):
+    bb = attacks(a)
+    for b in range(64):
+      table[a * 64 + b] = bb >> b & 1
+  return table
+
+# [from * 64 + to]: does a piece on from attack to on an empty board
+_KNIGHT = _pair_table(lambda sq: KNIGHT_ATTACKS[sq])
+_KING = _pair_table(lambda sq: KING_ATTACKS[sq])
+_PAWN = (_pair_table(lambda sq: PAWN_ATTACKS[0][sq]), _pair_table(lambda sq: PAWN_ATTACKS[1][sq]))
+_LINES = {BISHOP: _pair_table(lambda sq: bishop_attacks(sq, 0)), ROOK: _pair_table(lambda sq: rook_attacks(sq, 0))}
+_LINES[QUEEN] = _LINES[BISHOP] | _LINES[ROOK]
+# [(from * 64 + to) * 64 + sq]: is sq strictly between from and to
+_BETWEEN = np.array([BETWEEN[pair] >> sq & 1 for pair in range(4096) for sq in range(64)], dtype=bool)
+
+_DIRECTIONS = {
+  KNIGHT: ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)),
+  BISHOP: ((1, 1), (1, -1), (-1, -1), (-1, 1)),
+  ROOK: ((1, 0), (0, 1), (-1, 0), (0, -1)),
+}
+_DIRECTIONS[KING] = _DIRECTIONS[QUEEN] = _DIRECTIONS[BISHOP] + _DIRECTIONS[ROOK]
+
+def parse_endgame(name):
+  """Return the (colour, kind) pieces of an endgame name such as "KQKR",
+  white's pieces before black's.
+  """
+  name = name.upper()
+  split = name.find("K", 1)
+  if not name.startswith("K") or split < 0 or "K" in name[split + 1:] or any(c not in _LETTERS for c in name):
+    raise ValueError("invalid endgame %r" % name)
+  return [(0, _LETTERS.index(c)) for c in name[:split]] + [(1, _LETTERS.index(c)) for c in name[split:]]
+
+def _side_name(pieces, colour):
+  return "K" + "".join(sorted((_LETTERS[kind] for c, kind in pieces if c == colour and kind != KING),
+    key=_LETTERS.index, reverse=True))
+
+def _canonical(pieces):
+  """Return (name of the stored table, whether colours must be swapped to use it).
+  Tables are stored with the stronger side as white.
+  """
+  white, black = _side_name(pieces, 0), _side_name(pieces, 1)
+  strength = lambda side: (len(side), sorted((PIECE_VALUES[_LETTERS.index(c)] for c in side), reverse=True))
+  if strength(black) > strength(white):
+    return black + white, True
+  return white + black, False
+
+def _order(piece):
+  colour, kind = piece
+  # the kings first, then white's pieces and black's, strongest first
+  return (kind != KING, colour, -kind)
+
+def table_index(pieces, squares, side):
+  """Return (table name, entry index) of a position. Squares and side may be
+  ints or NumPy arrays of them.
+  """
+  name, flip = _canonical(pieces)
+  if flip:
+    pieces = [(colour ^ 1, kind) for colour, kind in pieces]
+    squares = [sq ^ 56 for sq in squares]
+    side = side ^ 1
+  men = len(pieces)
+  index = side << (6 * men)
+  for slot, i in enumerate(sorted(range(men), key=lambda i: _order(pieces[i]))):
+    index = index + (squares[i] << (6 * (men - 1 - slot)))
+  return name, index
+
+def _attacks(kind, colour, frm, to, blockers):
+  """Return whether a piece on frm attacks to with pieces on blockers."""
+  pair = frm * 64 + to
+  if kind == KNIGHT:
+    return _KNIGHT[pair]
+  if kind == KING:
+    return _KING[pair]
+  if kind == PAWN:
+    return _PAWN[colour][pair]
+  hit = _LINES[kind][pair]
+  for sq in blockers:
+    hit = hit & ~_BETWEEN[pair * 64 + sq]
+  return hit
+
+def _quiet_moves(kind, colour, i, squares, backward=False):
+  """Yield (to squares, mask) for the moves of piece i onto empty squares,
+  or with backward the squares it could have come from.
+  """
+  frm = squares[i]
+  others = [sq for j, sq in enumerate(squares) if j != i]
+  def empty(to):
+    mask = (to >= 0) & (to < 64)
+    for sq in others:
+      mask &= sq != to
+    return mask
+  if kind == PAWN:
+    step = 8 if (colour == 0) != backward else -8
+    to = frm + step
+    single = empty(to)
+    yield to, single
+    # a double push starts on the second rank and lands on the fourth
+    rank = [[1, 3], [6, 4]][colour][backward]
+    double = frm + 2 * step
+    yield double, single & ((frm >> 3) == rank) & empty(double)
+    return
+  rank, file = frm >> 3, frm & 7
+  for dr, df in _DIRECTIONS[kind]:
+    alive = np.ones(len(frm), dtype=bool)
+    r, f = rank, file
+    for _ in range(7 if kind in (BISHOP, ROOK, QUEEN) else 1):
+      r, f = r + dr, f + df
+      to = r * 8 + f
+      alive = alive & (r >= 0) & (r < 8) & (f >= 0) & (f < 8) & empty(to)
+      yield to, alive
+      if not alive.any():
+        break
+
+class _Solver:
+  """Retrograde analysis of one endgame."""
+  UNKNOWN, WIN, LOSS, DRAW, INVALID = range(5)
+
+  def __init__(self, name, solved):
+    self.name = name
+    self.pieces = sorted(parse_endgame(name), key=_order)
+    self.men = len(self.pieces)
+    self.size = 64 ** self.men
+    self.solved = solved
+
+  def _decode(self, positions):
+    return [(positions >> (6 * (self.men - 1 - i))) & 63 for i in range(self.men)]
+
+  def _chunks(self):
+    for start in range(0, self.size, _CHUNK):
+      positions = np.arange(start, min(start + _CHUNK, self.size), dtype=np.int32)
+      yield positions, self._decode(positions)
+
+  def _in_check(self, squares, colour):
+    """Return whether colour's king is attacked."""
+    pieces = self.pieces
+    king = pieces.index((colour, KING))
+    check = np.zeros(len(squares[0]), dtype=bool)
+    for i, (c, kind) in enumerate(pieces):
+      if c != colour:
+        blockers = [sq for j, sq in enumerate(squares) if j != i and j != king]
+        check |= _attacks(kind, c, squares[i], squares[king], blockers)
+    return check
+
+  def _legal_placement(self, squares):
+    ok = np.ones(len(squares[0]), dtype=bool)
+    for i in range(self.men):
+      for j in range(i):
+        ok &= squares[i] != squares[j]
+      if self.pieces[i][1] == PAWN:
+        ok &= (squares[i] >= 8) & (squares[i] < 56)
+    return ok
+
+  def _exit(self, pieces, squares, side, selected):
+    """Return (code, legal) for positions of a smaller table reached by a capture or promotion."""
+    name, index = table_index(pieces, [sq[selected] for sq in squares], side)
+    codes, valid = self.solved[name]
+    return codes[index], valid[index]
+
+  def solve(self):
+    """Return (codes, valid): the code of every entry and whether the position can occur."""
+    size, men, pieces = self.size, self.men, self.pieces
+    state = np.full(2 * size, self.UNKNOWN, dtype=np.int8)
+    in_check = np.zeros(2 * size, dtype=bool)
+    for positions, squares in self._chunks():
+      placed = self._legal_placement(squares)
+      for side in (0, 1):
+        # the side that just moved must not be left in check
+        index = side * size + positions
+        state[index[~placed | self._in_check(squares, side ^ 1)]] = self.INVALID
+        in_check[index] = self._in_check(squares, side)
+    valid = state != self.INVALID
+
+    # count the legal moves that stay in the table, and value those that leave it
+    count = np.zeros(2 * size, dtype=np.int8)
+    exits = np.zeros(2 * size, dtype=np.int8)
+    draw_exit = np.zeros(2 * size, dtype=bool)
+    exit_win = np.full(2 * size, np.iinfo(np.int16).max, dtype=np.int16)
+    exit_loss = np.zeros(2 * size, dtype=np.int16)
+
+    def leave(index, code, legal):
+      # each call has a position at most once, so plain fancy indexing is safe
+      index, code = index[legal], code[legal]
+      exits[index] += 1
+      draw_exit[index[code == 0]] = True
+      won = (code > 0) & (code % 2 == 1)
+      exit_win[index[won]] = np.minimum(exit_win[index[won]], code[won])
+      lost = (code > 0) & (code % 2 == 0)
+      exit_loss[index[lost]] = np.maximum(exit_loss[index[lost]], code[lost])
+
+    for positions, squares in self._chunks():
+      for side in (0, 1):
+        index = side * size + positions
+        live = valid[index]
+        last_rank = 7 if side == 0 else 0
+        for i, (colour, kind) in enumerate(pieces):
+          if colour != side:
+            continue
+          shift = 6 * (men - 1 - i)
+          for to, mask in _quiet_moves(kind, colour, i, squares):
+            mask = mask & live
+            if kind == PAWN:
+              promoting = mask & ((to >> 3) == last_rank)
+              mask = mask & ~promoting
+              moved = [to if k == i else sq for k, sq in enumerate(squares)]
+              for promotion in (KNIGHT, BISHOP, ROOK, QUEEN):
+                after = [(colour, promotion) if k == i else p for k, p in enumerate(pieces)]
+                leave(index[promoting], *self._exit(after, moved, side ^ 1, promoting))
+            successor = ((side ^ 1) * size + positions + ((to - squares[i]) << shift))[mask]
+            count[index[mask]] += valid[successor]
+          for j, (enemy, victim) in enumerate(pieces):
+            if enemy == side or victim == KING:
+              continue
+            blockers = [sq for k, sq in enumerate(squares) if k != i and k != j]
+            mask = _attacks(kind, colour, squares[i], squares[j], blockers) & live
+            rest = pieces[:j] + pieces[j + 1:]
+            moved = [squares[j] if k == i else sq for k, sq in enumerate(squares) if k != j]
+            mover = i - (j < i)
+            if kind == PAWN:
+              promoting = mask & ((squares[j] >> 3) == last_rank)
+              outcomes = [(promotion, promoting) for promotion in (KNIGHT, BISHOP, ROOK, QUEEN)]
+              outcomes.append((PAWN, mask & ~promoting))
+            else:
+              outcomes = [(kind, mask)]
+            for becomes, selected in outcomes:
+              after = [(colour, becomes) if k == mover else p for k, p in enumerate(rest)]
+              leave(index[selected], *self._exit(after, moved, side ^ 1, selected))
+
+    dtm = np.zeros(2 * size, dtype=np.int16)
+    unknown = state == self.UNKNOWN
+    stuck = unknown & (count == 0) & (exits == 0)
+    state[stuck & in_check] = self.LOSS
+    state[stuck & ~in_check] = self.DRAW
+    frontier = np.flatnonzero(stuck & in_check)
+    last_exit = max(int(exit_win[exit_win < np.iinfo(np.int16).max].max(initial=0)), int(exit_loss.max(initial=0)))
+
+    # a capture or promotion that draws or wins means the position is never lost
+    escapeless = ~draw_exit & (exit_win == np.iinfo(np.int16).max)
+    ply = 0
+    quiet = 0
+    while quiet < 2 or ply <= last_exit:
+      ply += 1
+      unknown = state == self.UNKNOWN
+      if ply % 2:
+        # a move into a lost position wins
+        won = np.zeros(2 * size, dtype=bool)
+        predecessors = self._predecessors(frontier, valid)
+        won[predecessors] = True
+        won &= unknown
+        won |= unknown & (exit_win == ply)
+        frontier = np.flatnonzero(won)
+        state[frontier] = self.WIN
+        # each move into a won position is one fewer way out for the loser
+        predecessors = self._predecessors(frontier, valid)
+        np.subtract.at(count, predecessors, 1)
+      else:
+        # every move reaches a won position, the longest of them ply - 1 away
+        lost = unknown & (count == 0) & escapeless & (exit_loss <= ply)
+        frontier = np.flatnonzero(lost)
+        state[frontier] = self.LOSS
+      dtm[frontier] = ply
+      quiet = quiet + 1 if not len(frontier) else 0
+
+    codes = np.where((state == self.WIN) | (state == self.LOSS), dtm + 1, 0).astype(np.int16)
+    return codes, valid
+
+  def _predecessors(self, frontier, valid):
+    """Return the positions with a quiet move into a frontier position."""
+    size, men = self.size, self.men
+    found = []
+    for start in range(0, len(frontier), _CHUNK):
+      chunk = frontier[start:start + _CHUNK]
+      for side in (0, 1):
+        positions = (chunk[chunk // size == side] % size).astype(np.int32)
+        if not len(positions):
+          continue
+        squares = self._decode(positions)
+        mover = side ^ 1
+        for i, (colour, kind) in enumerate(self.pieces):
+          if colour != mover:
+            continue
+          shift = 6 * (men - 1 - i)
+          for frm, mask in _quiet_moves(kind, colour, i, squares, backward=True):
+            found.append((mover * size + positions + ((frm - squares[i]) << shift))[mask])
+    if not found:
+      return np.zeros(0, dtype=np.int64)
+    predecessors = np.concatenate(found).astype(np.int64)
+    return predecessors[valid[predecessors]]
+
+def generate(name, solved=None, log=None):
+  """Solve an endgame and every smaller one it converts into. Return a dict
+  of name -> (codes, valid) arrays.
+  """
+  solved = {} if solved is None else solved
+  name, _ = _canonical(parse_endgame(name))
+  if name in solved:
+    return solved
+  pieces = parse_endgame(name)
+  for j, (colour, kind) in enumerate(pieces):
+    if kind == KING:
+      continue
+    rest = pieces[:j] + pieces[j + 1:]
+    generate(_canonical(rest)[0], solved, log)
+    if kind == PAWN:
+      for promotion in (KNIGHT, BISHOP, ROOK, QUEEN):
+        generate(_canonical(pieces[:j] + [(colour, promotion)] + pieces[j + 1:])[0], solved, log)
+        # a pawn capturing and promoting at once
+        for k, (other, victim) in enumerate(pieces):
+          if other != colour and victim != KING:
+            changed = [(colour, promotion) if m == j else p for m, p in enumerate(pieces)]
+            generate(_canonical(changed[:k] + changed[k + 1:])[0], solved, log)
+  start = time.perf_counter()
+  solved[name] = _Solver(name, solved).solve()
+  if log is not None:
+    log(name, solved[name], time.perf_counter() - start)
+  return solved
+
+def write(path, name, codes):
+  """Write a table's codes bit-packed to a file."""
+  bits = max(int(codes.max()), 1).bit_length()
+  with open(path, "wb") as f:
+    f.write(_HEADER.pack(_TAG, name.encode().ljust(8), bits, len(codes)))
+    for start in range(0, len(codes), _CHUNK * 8):
+      chunk = codes[start:start + _CHUNK * 8].astype(np.uint16)
+      # entry i takes bits i * bits ... (i + 1) * bits - 1, lowest first
+      spread = ((chunk[:, None] >> np.arange(bits, dtype=np.uint16)) & 1).astype(np.uint8)
+      f.write(np.packbits(spread.ravel(), bitorder="little").tobytes())
+    # so a probe can always read three bytes
+    f.write(b"\0" * 3)
+
+def statistics(codes, valid):
+  """Return (positions, wins, draws, losses, longest mate in plies) for a table."""
+  wins = int(np.count_nonzero((codes > 0) & (codes % 2 == 0)))
+  losses = int(np.count_nonzero(codes % 2 == 1))
+  positions = int(np.count_nonzero(valid))
+  return positions, wins, positions - wins - losses, losses, max(int(codes.max()) - 1, 0)
+
+class Tablebase:
+  """Endgame tables memory mapped from a directory of .tb files."""
+
+  def __init__(self, directory=None):
+    self.directory = directory or TABLEBASE_DIR
+    self._tables = {}
+    self.hits = 0
+    names = [f[:-3] for f in os.listdir(self.directory) if f.endswith(".tb")] if os.path.isdir(self.directory) else []
+    # the most pieces any table holds, so search can skip probing larger positions cheaply
+    self.max_men = max((len(name) for name in names), default=0)
+
+  def close(self):
+    for table in self._tables.values():
+      if table is not None:
+        table[0].close()
+    self._tables = {}
+
+  def _open(self, name):
+    try:
+      with open(os.path.join(self.directory, name + ".tb"), "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+      return None
+    tag, stored, bits, count = _HEADER.unpack_from(data)
+    if tag != _TAG or stored.rstrip().decode() != name:
+      data.close()
+      raise ValueError("%s.tb in %s is not a table for %s" % (name, self.directory, name))
+    return data, bits, count
+
+  def probe(self, game):
+    """Return (wdl, plies to mate) for the side to move, wdl being 1 for a
+    win, 0 for a draw and -1 for a loss, or None if no table has the position.
+    """
+    if game.piece_count() > self.max_men or game.get_castling_rights() or game.ep_capture_legal():
+      return None
+    pieces, squares = [], []
+    for sq in range(64):
+      code = game.piece_on(sq)
+      if code >= 0:
+        pieces.append((code // 6, code % 6))
+        squares.append(sq)
+    name, index = table_index(pieces, squares, 0 if game.turn else 1)
+    table = self._tables.get(name, False)
+    if table is False:
+      table = self._tables[name] = self._open(name)
+    if table is None:
+      return None
+    data, bits, _ = table
+    bit = index * bits + _HEADER.size * 8
+    code = int.from_bytes(data[bit >> 3:(bit >> 3) + 3], "little") >> (bit & 7) & ((1 << bits) - 1)
+    self.hits += 1
+    if not code:
+      return 0, 0
+    return (1 if code % 2 == 0 else -1), code - 1
+
+def main():
+  parser = argparse.ArgumentParser(description="Generate endgame tablebases.")
+  parser.add_argument("endgames", nargs="*", default=DEFAULT_ENDGAMES, help="e.g. KQK KRK KPK KQKR")
+  parser.add_argument("--dir", default=TABLEBASE_DIR)
+  parser.add_argument("--probe", metavar="FEN", help="look up a position instead")
+  args = parser.parse_args()
+
+  if args.probe:
+    result = Tablebase(args.dir).probe(Game.from_fen(args.probe))
+    if result is None:
+      print("not in the tablebase")
+    else:
+      wdl, plies = result
+      print(("draw", "win", "loss")[wdl] + ("" if not wdl else " in %d plies" % plies))
+    return
+
+  os.makedirs(args.dir, exist_ok=True)
+  def log(name, table, seconds):
+    path = os.path.join(args.dir, name + ".tb")
+    write(path, name, table[0])
+    print("%-6s %10d positions %10d won %10d drawn %10d lost  longest mate %3d plies  %6.1fs  %9d bytes"
+      % ((name,) + statistics(*table) + (seconds, os.path.getsize(path))))
+  solved = {}
+  for name in args.endgames:
+    generate(name, solved, log)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,286 @@
+"""Precomputed attack tables for move generation.
+
+Knight, king and pawn attacks are indexed by square. Rook and bishop attacks
+are indexed by square and the blockers on their lines using magic numbers:
+multiplying the relevant occupied squares by a per-square magic packs them
+into the top bits of the product, which index that square's slice of one
+shared attack table.
+
+Filling the tables takes under a second, so they are written once to a
+cache file next to this module and memory mapped by every later import. The
+file is rebuilt when missing or invalid:
+
+  python -m Chess.Tables           rebuild the cache file
+  python -m Chess.Tables --search  search for a new set of magics (slow)
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import random
+import struct
+import tempfile
+
+_FULL = (1 << 64) - 1
+
+# the cache file starts with this tag, the number of 64 bit words after it
+# and _magics_hash() of the magics it was built with
+_TAG = b"CHESSTB2"
+_HEADER = struct.Struct("<8sQQ")
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables.bin")
+
+# Found by --search; any magic that maps every blocker set of its square
+# without destructive collisions works.
+ROOK_MAGICS = (
+  0x0900110080004020, 0x20C0001000200040, 0x0200108200204008, 0x0080080080100006,
+  0x0200020008201004, 0x1080040080010200, 0x0880088011000200, 0x2180018018204100,
+  0x2020800080204001, 0x1000C00040201001, 0x0102802002809004, 0x0020800804100081,
+  0x2A41800C00810800, 0x1021000208040100, 0xC002004200240128, 0x221600008045020C,
+  0x258000C010200144, 0x1010094040002004, 0x8000808010002001, 0x0011010020081000,
+  0x0088808008000400, 0x9900880110400420, 0x4000840022104881, 0x0020420001004084,
+  0xC102822280004008, 0x1840002100410080, 0x0200150100200440, 0x0801002100081000,
+  0x2054000480800800, 0x7204040080800200, 0x00D8110400102288, 0x8000004A00010894,
+  0x1080002000400047, 0x000040A001401000, 0x4450080400200020, 0x0100090021001000,
+  0x0408810401801800, 0x048A000402001008, 0x1001800200800100, 0x4000004082001124,
+  0x000100C280030020, 0x0A00402010024002, 0x0289002008410010, 0x0000100842020020,
+  0x00020020100A0004, 0x04020008140E0011, 0x0080080241040030, 0x2410006081020004,
+  0x5840400020800080, 0x0000400480200880, 0x0020088420100080, 0x02461022000A4200,
+  0x4218000401288180, 0x0054008002000480, 0x1016000804010200, 0x04000C2300508200,
+  0x0480042010804101, 0x0002008020184302, 0x900820820042100A, 0x4000041001210009,
+  0x1401000210480005, 0x0C42001011081462, 0x408800882A01100C, 0x4000889100402C02)
+BISHOP_MAGICS = (
+  0x0908010800810202, 0x05283800A4004400, 0x2808224402200084, 0x3804041088240200,
+  0x0104030880010424, 0x004424200808000A, 0x4000820110410001, 0x1401044208844022,
+  0x4000121401480601, 0x40400208012C0082, 0x0240104100510A20, 0x400508A082000520,
+  0xA820040420000C00, 0x02A0021210440222, 0x0000014118203000, 0x0502660282015102,
+  0x0060221002300140, 0x020400D050520042, 0x0002008108020084, 0x800200142022009C,
+  0x0014000200944004, 0x1000400988084000, 0x5021000884100200, 0x0219A80282280203,
+  0x8002108109111000, 0x0018044002900A02, 0x0024100007090120, 0x0A10040000440088,
+  0x0281001081004000, 0x0000840802010400, 0x0A10950042191021, 0x0C00A08002004400,
+  0x2044024103285100, 0x8002019004A00220, 0x0804020100080040, 0x0000202020080080,
+  0x0008160400121100, 0x2224004C80041000, 0x08010901082C0C10, 0x3009041420010100,
+  0x0208440404002020, 0x08004C0404962040, 0x4000840401000200, 0x0804004200898800,
+  0x0000200411102400, 0x05440810010020B0, 0x00040104240A0100, 0x8401090402881100,
+  0x0005080210460000, 0x00028E0821142880, 0x020884404C500000, 0x0420842020884400,
+  0x0480092004242014, 0x0083040810010800, 0x02041024012C0000, 0x0121020202002424,
+  0x504014480C100810, 0x00891C8088211017, 0x1040002A2A011000, 0x100C000000840400,
+  0x8020000204608201, 0x880000C40408020C, 0x0100A0090908208A, 0x4041084812404140)
+
+_ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+_BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+
+def _step_table(steps):
+  table = []
+  for sq in range(64):
+    rank, file = sq >> 3, sq & 7
+    bb = 0
+    for dr, df in steps:
+      if 0 <= rank + dr < 8 and 0 <= file + df < 8:
+        bb |= 1 << ((rank + dr) * 8 + file + df)
+    table.append(bb)
+  return table
+
+def _slide(sq, occupied, directions):
+  """Return sliding attacks by walking each direction to the first blocker."""
+  bb = 0
+  for dr, df in directions:
+    rank, file = (sq >> 3) + dr, (sq & 7) + df
+    while 0 <= rank < 8 and 0 <= file < 8:
+      bit = 1 << (rank * 8 + file)
+      bb |= bit
+      if occupied & bit:
+        break
+      rank, file = rank + dr, file + df
+  return bb
+
+def _relevant(sq, directions):
+  """Return the squares whose occupancy changes a slider's attacks: its
+  lines without the board edge each line runs into.
+  """
+  bb = 0
+  for dr, df in directions:
+    rank, file = (sq >> 3) + dr, (sq & 7) + df
+    while 0 <= rank + dr < 8 and 0 <= file + df < 8:
+      bb |= 1 << (rank * 8 + file)
+      rank, file = rank + dr, file + df
+  return bb
+
+def _magics_hash():
+  """Return a 64 bit hash of the magics and shifts, so a cache built with
+  other ones is rebuilt even though its size matches.
+  """
+  digest = hashlib.blake2b(digest_size=8)
+  for magics, directions in ((ROOK_MAGICS, _ROOK_DIRECTIONS), (BISHOP_MAGICS, _BISHOP_DIRECTIONS)):
+    shifts = [64 - bin(_relevant(sq, directions)).count("1") for sq in range(64)]
+    digest.update(struct.pack("<64Q64B", *magics, *shifts))
+  return struct.unpack("<Q", digest.digest())[0]
+
+def _subsets(mask):
+  """Yield every subset of a set of squares (carry-rippler)."""
+  subset = 0
+  while True:
+    yield subset
+    subset = (subset - mask) & mask
+    if not subset:
+      return
+
+def _between_table():
+  table = [0] * 4096
+  for a in range(64):
+    for dr, df in _ROOK_DIRECTIONS + _BISHOP_DIRECTIONS:
+      rank, file = (a >> 3) + dr, (a & 7) + df
+      between = 0
+      while 0 <= rank < 8 and 0 <= file < 8:
+        b = rank * 8 + file
+        table[a * 64 + b] = between
+        between |= 1 << b
+        rank, file = rank + dr, file + df
+  return table
+
+def _fill(sq, directions, magic):
+  """Return (mask, shift, attacks) for a slider on sq, attacks indexed by
+  ((occupied & mask) * magic & 2**64-1) >> shift. Raises ValueError if the
+  magic sends two blocker sets with different attacks to one index.
+  """
+  mask = _relevant(sq, directions)
+  shift = 64 - bin(mask).count("1")
+  table = [None] * (1 << (64 - shift))
+  for occupied in _subsets(mask):
+    attacks = _slide(sq, occupied, directions)
+    index = (occupied * magic & _FULL) >> shift
+    if table[index] is None:
+      table[index] = attacks
+    elif table[index] != attacks:
+      raise ValueError("magic 0x%016X does not work for square %d" % (magic, sq))
+  return mask, shift, [attacks or 0 for attacks in table]
+
+def find_magic(sq, directions, rng):
+  """Search for a magic for a slider on sq by trying random sparse numbers."""
+  import numpy as np
+  mask = _relevant(sq, directions)
+  bits = bin(mask).count("1")
+  occupancies = list(_subsets(mask))
+  occupied = np.array(occupancies, dtype=np.uint64)
+  expected = np.array([_slide(sq, occ, directions) for occ in occupancies], dtype=np.uint64)
+  shift = np.uint64(64 - bits)
+  table = np.zeros(1 << bits, dtype=np.uint64)
+  while True:
+    magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+    if bin((mask * magic & _FULL) >> 56).count("1") < 6:
+      continue
+    # uint64 products wrap, which is the & 2**64-1
+    index = (occupied * np.uint64(magic)) >> shift
+    table[:] = 0
+    table[index] = expected
+    # any collision between different attack sets leaves a mismatch
+    if (table[index] == expected).all():
+      return magic
+
+def build():
+  """Compute every table and return them as a dictionary of lists."""
+  tables = {
+    "knight": _step_table(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))),
+    "king": _step_table(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))),
+    "pawn": _step_table(((1, -1), (1, 1))) + _step_table(((-1, -1), (-1, 1))),
+    "between": _between_table(),
+  }
+  for name, directions, magics in (("rook", _ROOK_DIRECTIONS, ROOK_MAGICS), ("bishop", _BISHOP_DIRECTIONS, BISHOP_MAGICS)):
+    masks, shifts, offsets, attacks = [], [], [], []
+    for sq in range(64):
+      mask, shift, table = _fill(sq, directions, magics[sq])
+      masks.append(mask)
+      shifts.append(shift)
+      offsets.append(len(attacks))
+      attacks += table
+    tables[name + "_masks"] = masks
+    tables[name + "_magics"] = list(magics)
+    tables[name + "_shifts"] = shifts
+    tables[name + "_offsets"] = offsets
+    tables[name + "_attacks"] = attacks
+  return tables
+
+# (name, number of 64 bit words) in file order. The magic attack tables are
+# as large as the sum over squares of 2 ** (relevant squares).
+_LAYOUT = (("knight", 64), ("king", 64), ("pawn", 128), ("between", 4096),
+  ("rook_masks", 64), ("rook_magics", 64), ("rook_shifts", 64), ("rook_offsets", 64),
+  ("bishop_masks", 64), ("bishop_magics", 64), ("bishop_shifts", 64), ("bishop_offsets", 64),
+  ("rook_attacks", 102400), ("bishop_attacks", 5248))
+_WORDS = sum(length for _, length in _LAYOUT)
+
+def write(path, tables):
+  """Write tables to path, replacing any existing file atomically."""
+  words = []
+  for name, length in _LAYOUT:
+    if len(tables[name]) != length:
+      raise ValueError("table %s has %d entries, expected %d" % (name, len(tables[name]), length))
+    words += tables[name]
+  directory = os.path.dirname(path) or "."
+  fd, temp = tempfile.mkstemp(dir=directory, prefix=".tables")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(_HEADER.pack(_TAG, _WORDS, _magics_hash()))
+      f.write(struct.pack("<%dQ" % _WORDS, *words))
+    os.replace(temp, path)
+  except BaseException:
+    os.unlink(temp)
+    raise
+
+def _map(path):
+  """Memory map a cache file and return its tables as memoryviews, or None
+  when the file is missing or not a table file of this version.
+  """
+  try:
+    with open(path, "rb") as f:
+      if os.fstat(f.fileno()).st_size != _HEADER.size + _WORDS * 8:
+        return None
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except OSError:
+    return None
+  if _HEADER.unpack_from(buffer) != (_TAG, _WORDS, _magics_hash()):
+    buffer.close()
+    return None
+  # the 24 byte header keeps the words 8 byte aligned
+  words = memoryview(buffer)[_HEADER.size:].cast("Q")
+  tables = {}
+  offset = 0
+  for name, length in _LAYOUT:
+    tables[name] = words[offset:offset + length]
+    offset += length
+  return tables
+
+def load(path=None):
+  """Return the tables from the cache file, building and writing it first if
+  needed. Each table is a sequence of ints indexed like the lists build()
+  returns. A cache that cannot be written next to this module goes to the
+  temporary directory, and failing that the built tables are used as is.
+  """
+  path = path or CACHE_PATH
+  fallback = os.path.join(tempfile.gettempdir(), "chess-" + os.path.basename(path))
+  tables = _map(path) or _map(fallback)
+  if tables is None:
+    tables = build()
+    for target in (path, fallback):
+      try:
+        write(target, tables)
+      except OSError:
+        continue
+      return _map(target) or tables
+  return tables
+
+def main():
+  parser = argparse.ArgumentParser(description="Build the attack table cache file.")
+  parser.add_argument("--search", action="store_true", help="search for new magics and print them")
+  parser.add_argument("--seed", type=int, default=0x3A61C)
+  args = parser.parse_args()
+
+  if args.search:
+    rng = random.Random(args.seed)
+    for name, directions in (("ROOK_MAGICS", _ROOK_DIRECTIONS), ("BISHOP_MAGICS", _BISHOP_DIRECTIONS)):
+      magics = ["0x%016X" % find_magic(sq, directions, rng) for sq in range(64)]
+      print("%s = (\n%s)" % (name, ",\n".join("  " + ", ".join(magics[i:i + 4]) for i in range(0, 64, 4))))
+    return
+  write(CACHE_PATH, build())
+  print("wrote %s (%d bytes)" % (CACHE_PATH, _HEADER.size + _WORDS * 8))
+
+if __name__ == '__main__':
+  main()
@@ -5,7 +5,7 @@ from time import sleep
 import glfw
 
 from OpenGL.GL import *
-from ObjModel import ObjModel
+from ObjModel import ObjModel, acquireShader, releaseShader
 import magic
 
 import sys
@@ -21,6 +21,8 @@ class View:
         self.lighting = Lighting()
         self.camera = Camera()
         self.shader = None
+        # the sources self.shader was built from, which key it in the asset registry
+        self.shaderSources = None
 
         self.vertexShaderSource = ObjModel.defaultVertexShader
         self.fragmentShaderSource = ObjModel.defaultFragmentShader
@@ -81,6 +83,7 @@ class View:
 
         # Build with default first since that really should work, so then we have some fallback
         self.shader = buildShader(self.vertexShaderSource, self.fragmentShaderSource)
+        self.shaderSources = (self.vertexShaderSource, self.fragmentShaderSource)
 
         self.reLoadShader()
 
@@ -232,6 +235,17 @@ class View:
         model.render(self.shader, ObjModel.RF_Transparent| ObjModel.RF_AlphaTested, transforms)
         glDisable(GL_BLEND)
 
+    def releaseResources(self):
+        """Give the models and the shader back to the asset registry, which deletes them; needs the GL context."""
+        for model in self.models.values():
+            for m in (model if isinstance(model, list) else [model]):
+                m.release()
+        self.models = {}
+        if self.shaderSources is not None:
+            releaseShader(*self.shaderSources)
+            self.shader = None
+            self.shaderSources = None
+
     def reLoadShader(self):        
         vertexShader = ""
         with open('vertexShader.glsl') as f:
@@ -243,12 +257,13 @@ class View:
         if self.vertexShaderSource != vertexShader or fragmentShader != self.fragmentShaderSource:
             newShader = buildShader(vertexShader, fragmentShader)
             if newShader:
-                if self.shader:
-                    glDeleteProgram(self.shader)
+                # the old program may be shared, so only the registry deletes it
+                releaseShader(*self.shaderSources)
                 self.shader = newShader
+                self.shaderSources = (vertexShader, fragmentShader)
                 print("Reloaded shader, ok!")
             else:
-                pass
+                releaseShader(vertexShader, fragmentShader)
             self.vertexShaderSource = vertexShader
             self.fragmentShaderSource = fragmentShader
 
@@ -304,12 +319,8 @@ class Lighting:
         self.ambientLightColourAndIntensity = lu.vec3(0.1)
 
 def buildShader(vertexShaderSource, fragmentShaderSource):
-    shader = lu.buildShader(vertexShaderSource, fragmentShaderSource, ObjModel.getDefaultAttributeBindings())
-    if shader:
-        glUseProgram(shader)
-        ObjModel.setDefaultUniformBindings(shader)
-        glUseProgram(0)
-    return shader
+    # shared with any ObjModel or earlier build of the same sources
+    return acquireShader(vertexShaderSource, fragmentShaderSource)
 
 def initGlFwAndResources(title, startWidth, startHeight, view):
     #glfw.window_hint(glfw.OPENGL_DEBUG_CONTEXT, 1)
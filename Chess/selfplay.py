@@ -0,0 +1,237 @@
+"""Self-play matches between computer player configurations.
+
+  python -m Chess.selfplay --games 200 --workers 8 --player depth=3 --player depth=4
+    --book book.bin --pgn match.pgn --json match.json
+
+plays the games across a pool of processes. Each opening is played twice
+with colours swapped; openings come from a Polyglot book, an EPD file or
+random moves. Every game goes to the PGN file as it finishes, and a JSON
+summary gives the first player's Elo difference, games per hour and the
+nodes per second each worker searched.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from Chess.Model import Game, START_FEN
+from Chess.Search import Searcher, SearchLimits
+from Chess.Pgn import PgnGame, format_game
+
+# plies after which a game is scored a draw
+MAX_PLIES = 400
+
+class PlayerConfig:
+  """A computer player: its search limits and transposition table size."""
+
+  def __init__(self, name, depth=None, nodes=None, movetime=None, hash_mb=16):
+    self.name = name
+    self.depth = depth
+    self.nodes = nodes
+    self.movetime = movetime
+    self.hash_mb = hash_mb
+
+  @classmethod
+  def parse(cls, spec):
+    """Return a config from e.g. 'name=deep,depth=5,movetime=0.5,nodes=20000,hash=32'.
+    Raises ValueError on an unknown or malformed field.
+    """
+    fields = {}
+    for part in spec.split(","):
+      key, _, value = part.partition("=")
+      if key not in ("name", "depth", "nodes", "movetime", "hash") or not value:
+        raise ValueError("bad player field %r in %r" % (part, spec))
+      fields[key] = value
+    return cls(fields.get("name", spec),
+      depth=int(fields["depth"]) if "depth" in fields else None,
+      nodes=int(fields["nodes"]) if "nodes" in fields else None,
+      movetime=float(fields["movetime"]) if "movetime" in fields else None,
+      hash_mb=int(fields.get("hash", 16)))
+
+  def limits(self):
+    return SearchLimits(depth=self.depth, nodes=self.nodes, movetime=self.movetime)
+
+def read_epd(path):
+  """Return the positions of an EPD file as FENs."""
+  fens = []
+  with open(path) as f:
+    for line in f:
+      fields = line.split()
+      if len(fields) >= 4:
+        fens.append(" ".join(fields[:4]) + " 0 1")
+  return fens
+
+# the book of the worker process, opened once by _init_worker
+_book = None
+
+def _init_worker(book_path):
+  global _book
+  if book_path:
+    from Chess.Book import OpeningBook
+    _book = OpeningBook(book_path)
+
+def opening(seed, epd, book_plies, random_plies):
+  """Return (fen, moves) of the opening for a seed, the same in every process."""
+  rng = random.Random(seed)
+  fen = rng.choice(epd) if epd else START_FEN
+  game = Game.from_fen(fen)
+  moves = []
+  if _book is not None:
+    while len(moves) < book_plies:
+      move = _book.choose(game, rng)
+      if not move:
+        break
+      game.make_move(move)
+      moves.append(move)
+  for _ in range(random_plies):
+    legal = game.legal_moves()
+    if not legal:
+      break
+    move = rng.choice(legal)
+    game.make_move(move)
+    # an opening must leave a game to play
+    if game.outcome() is not None:
+      game.unmake_move()
+      break
+    moves.append(move)
+  return fen, moves
+
+def play_game(task):
+  """Play one game and return its record as a dict."""
+  index, seed, white, black, epd, book_plies, random_plies = task
+  fen, moves = opening(seed, epd, book_plies, random_plies)
+  game = Game.from_fen(fen)
+  sans = []
+  for move in moves:
+    sans.append(game.san(move))
+    game.make_move(move)
+
+  players = (white, black)
+  searchers = [Searcher(hash_mb=player.hash_mb) for player in players]
+  nodes = [0, 0]
+  seconds = [0.0, 0.0]
+  while True:
+    outcome = game.outcome()
+    if outcome is not None:
+      break
+    if len(sans) >= MAX_PLIES:
+      outcome = ("1/2-1/2", "adjudicated after %d plies" % MAX_PLIES)
+      break
+    side = 0 if game.turn else 1
+    result = searchers[side].search(game, players[side].limits())
+    nodes[side] += result.nodes
+    seconds[side] += result.seconds
+    sans.append(game.san(result.move))
+    game.make_move(result.move)
+
+  headers = {"Event": "Self-play", "Site": "Chess.selfplay", "Date": time.strftime("%Y.%m.%d"),
+    "Round": str(index + 1), "White": white.name, "Black": black.name, "Termination": outcome[1]}
+  if fen != START_FEN:
+    headers["SetUp"] = "1"
+    headers["FEN"] = fen
+  for tt in (searcher.tt for searcher in searchers):
+    tt.close()
+  return {"index": index, "pid": os.getpid(), "result": outcome[0], "termination": outcome[1],
+    "white": white.name, "black": black.name, "nodes": nodes, "seconds": seconds,
+    "pgn": format_game(PgnGame(headers, sans, outcome[0]))}
+
+def elo(score):
+  """Return the Elo difference implied by a score fraction strictly between 0 and 1."""
+  return -400 * math.log10(1 / score - 1)
+
+def summarise(records, first, seconds):
+  """Return the JSON summary of a match from its game records."""
+  wins = draws = losses = 0
+  scores = []
+  workers = {}
+  terminations = {}
+  for record in records:
+    if record["result"] == "1/2-1/2":
+      score = 0.5
+    else:
+      first_white = record["white"] == first.name
+      score = 1.0 if (record["result"] == "1-0") == first_white else 0.0
+    scores.append(score)
+    wins += score == 1.0
+    draws += score == 0.5
+    losses += score == 0.0
+    terminations[record["termination"]] = terminations.get(record["termination"], 0) + 1
+    worker = workers.setdefault(str(record["pid"]), {"games": 0, "nodes": 0, "search_seconds": 0.0})
+    worker["games"] += 1
+    worker["nodes"] += sum(record["nodes"])
+    worker["search_seconds"] += sum(record["seconds"])
+  for worker in workers.values():
+    worker["nps"] = int(worker["nodes"] / worker["search_seconds"]) if worker["search_seconds"] else 0
+
+  games = len(scores)
+  summary = {"games": games, "player": first.name, "wins": wins, "draws": draws, "losses": losses,
+    "score": sum(scores) / games if games else None, "elo": None, "elo_margin": None,
+    "seconds": seconds, "games_per_hour": games * 3600 / seconds if seconds else None,
+    "terminations": terminations, "workers": workers}
+  if games and 0 < sum(scores) < games:
+    mean = sum(scores) / games
+    deviation = math.sqrt(sum((s - mean) ** 2 for s in scores) / games)
+    summary["elo"] = elo(mean)
+    # 95% interval of the mean score mapped through the Elo curve
+    spread = 1.96 * deviation / math.sqrt(games)
+    low, high = max(mean - spread, 1e-6), min(mean + spread, 1 - 1e-6)
+    summary["elo_margin"] = (elo(high) - elo(low)) / 2
+  return summary
+
+def main():
+  parser = argparse.ArgumentParser(description="Play computer players against each other.")
+  parser.add_argument("--player", action="append", default=[],
+    help="player config, e.g. depth=4 or name=fast,movetime=0.1; give two")
+  parser.add_argument("--games", type=int, default=100, help="games to play")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes to play in")
+  parser.add_argument("--book", help="Polyglot book to take opening moves from")
+  parser.add_argument("--book-plies", type=int, default=8, help="most book moves per opening")
+  parser.add_argument("--epd", help="EPD file of opening positions")
+  parser.add_argument("--random-plies", type=int, default=None,
+    help="random moves after the book or EPD opening, 4 without either")
+  parser.add_argument("--seed", type=int, default=1, help="seed the openings are chosen from")
+  parser.add_argument("--pgn", default="selfplay.pgn", help="file to write the games to")
+  parser.add_argument("--json", default="selfplay.json", help="file to write the summary to")
+  args = parser.parse_args()
+
+  specs = args.player or ["name=depth2,depth=2", "name=depth3,depth=3"]
+  if len(specs) != 2:
+    parser.error("give two --player configs")
+  players = [PlayerConfig.parse(spec) for spec in specs]
+  if players[0].name == players[1].name:
+    players[1].name += " (2)"
+  epd = read_epd(args.epd) if args.epd else None
+  random_plies = args.random_plies
+  if random_plies is None:
+    random_plies = 0 if args.book or epd else 4
+
+  # each opening is played twice, with each player as white once
+  tasks = [(i, args.seed * 1000003 + i // 2, players[i % 2], players[1 - i % 2], epd, args.book_plies,
+    random_plies) for i in range(args.games)]
+  records = []
+  points = 0.0
+  start = time.perf_counter()
+  with open(args.pgn, "w") as pgn, multiprocessing.Pool(args.workers, _init_worker, (args.book,)) as pool:
+    for record in pool.imap_unordered(play_game, tasks):
+      records.append(record)
+      pgn.write(record["pgn"] + "\n")
+      pgn.flush()
+      result = record["result"]
+      points += 0.5 if result == "1/2-1/2" else float((result == "1-0") == (record["white"] == players[0].name))
+      print("game %d/%d  %s - %s  %s (%s)  %s %.1f/%d" % (len(records), args.games, record["white"],
+        record["black"], result, record["termination"], players[0].name, points, len(records)))
+  seconds = time.perf_counter() - start
+
+  summary = summarise(records, players[0], seconds)
+  summary["players"] = specs
+  with open(args.json, "w") as f:
+    json.dump(summary, f, indent=2)
+  print(json.dumps({key: summary[key] for key in ("score", "elo", "elo_margin", "games_per_hour")}))
+  for pid, worker in sorted(summary["workers"].items()):
+    print("worker %s: %d games, %d nps" % (pid, worker["games"], worker["nps"]))
+
+if __name__ == '__main__':
+  main()
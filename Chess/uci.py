@@ -0,0 +1,234 @@
+"""The engine behind the Universal Chess Interface, for GUIs and match runners.
+
+  python -m Chess.uci
+
+reads UCI commands on stdin and answers on stdout. The search runs on its
+own thread so stop, ponderhit and isready are answered while it thinks.
+Supported: uci, isready, setoption (Hash, Threads, Ponder), ucinewgame,
+position, go (wtime btime winc binc movestogo movetime depth nodes
+infinite ponder, searchmoves being ignored), stop, ponderhit and quit.
+"""
+import os
+import re
+import sys
+import threading
+
+from Chess.Model import Game, START_FEN, move_uci
+from Chess.Search import Searcher, SearchLimits, MATE, MAX_PLY
+from Chess.Parallel import ParallelSearcher
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "the Chess authors"
+
+# seconds kept back for the GUI and process overhead on every move
+MOVE_OVERHEAD = 0.05
+# moves the remaining clock is assumed to be shared over without movestogo
+DEFAULT_MOVES_TO_GO = 30
+
+_MOVE_TOKEN = re.compile(r"[a-h][1-8][a-h][1-8][nbrq]?")
+
+def move_time(clock, increment, moves_to_go=None):
+  """Return the seconds to think given the clock and increment in seconds."""
+  budget = clock / (moves_to_go or DEFAULT_MOVES_TO_GO) + increment * 0.8
+  return max(0.01, min(budget, clock / 2) - MOVE_OVERHEAD)
+
+def format_score(score):
+  """Return a score as a UCI 'cp x' or 'mate n' string."""
+  if abs(score) >= MATE - MAX_PLY:
+    plies = MATE - abs(score)
+    return "mate %d" % ((plies + 1) // 2 if score > 0 else -(plies // 2))
+  return "cp %d" % score
+
+class UciEngine:
+  """The state of one UCI session. Output goes through the write callable."""
+
+  def __init__(self, write=None):
+    self.write = write or self._print
+    self.hash_mb = 16
+    self.threads = 1
+    self.game = Game.from_fen(START_FEN)
+    self._searcher = None
+    self._thread = None
+    self._ponderhit = threading.Event()
+    # set by stop or ponderhit; an infinite or pondering search that has
+    # finished early waits for it before giving its move
+    self._release = threading.Event()
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _print(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+  def _send(self, line):
+    with self._lock:
+      self.write(line)
+
+  @property
+  def searcher(self):
+    """The searcher, made on first use so Hash and Threads can be set before."""
+    if self._searcher is None:
+      if self.threads > 1:
+        self._searcher = ParallelSearcher(self.threads, self.hash_mb, ponderhit_event=self._ponderhit)
+      else:
+        self._searcher = Searcher(hash_mb=self.hash_mb, ponderhit_event=self._ponderhit)
+    return self._searcher
+
+  def _close_searcher(self):
+    if isinstance(self._searcher, ParallelSearcher):
+      self._searcher.close()
+    self._searcher = None
+
+  def handle(self, line):
+    """Act on one command line. Return False after quit."""
+    tokens = line.split()
+    if not tokens:
+      return True
+    command, args = tokens[0], tokens[1:]
+    if command == "quit":
+      self._stop()
+      self._close_searcher()
+      return False
+    handler = getattr(self, "_cmd_" + command, None)
+    if handler is not None:
+      try:
+        handler(args)
+      except ValueError as e:
+        self._send("info string error: %s" % e)
+    return True
+
+  def _cmd_uci(self, args):
+    self._send("id name %s" % ENGINE_NAME)
+    self._send("id author %s" % ENGINE_AUTHOR)
+    self._send("option name Hash type spin default 16 min 1 max 4096")
+    self._send("option name Threads type spin default 1 min 1 max %d" % max(os.cpu_count() or 1, 1))
+    self._send("option name Ponder type check default false")
+    self._send("uciok")
+
+  def _cmd_isready(self, args):
+    self._send("readyok")
+
+  def _cmd_setoption(self, args):
+    # setoption name <id> [value <x>], where the name may contain spaces
+    if "value" in args:
+      i = args.index("value")
+      name, value = " ".join(args[1:i]), " ".join(args[i + 1:])
+    else:
+      name, value = " ".join(args[1:]), ""
+    name = name.lower()
+    if name == "hash":
+      self.hash_mb = max(1, int(value))
+    elif name == "threads":
+      self.threads = max(1, int(value))
+    elif name == "ponder":
+      return
+    else:
+      raise ValueError("unknown option %r" % name)
+    self._stop()
+    self._close_searcher()
+
+  def _cmd_ucinewgame(self, args):
+    self._stop()
+    self._close_searcher()
+    self.game = Game.from_fen(START_FEN)
+
+  def _cmd_position(self, args):
+    self._stop()
+    if args[:1] == ["startpos"]:
+      game, rest = Game.from_fen(START_FEN), args[1:]
+    elif args[:1] == ["fen"]:
+      end = args.index("moves") if "moves" in args else len(args)
+      game, rest = Game.from_fen(" ".join(args[1:end])), args[end:]
+    else:
+      raise ValueError("position needs startpos or fen")
+    for text in rest[1:]:
+      game.make_move(game.parse_uci(text))
+    self.game = game
+
+  def _cmd_go(self, args):
+    self._stop()
+    options = {}
+    flags = set()
+    i = 0
+    while i < len(args):
+      if args[i] in ("infinite", "ponder"):
+        flags.add(args[i])
+        i += 1
+      elif args[i] == "searchmoves":
+        # searching a subset of moves is not supported, search them all
+        i += 1
+        while i < len(args) and _MOVE_TOKEN.fullmatch(args[i]):
+          i += 1
+      elif i + 1 < len(args):
+        options[args[i]] = int(args[i + 1])
+        i += 2
+      else:
+        raise ValueError("go %s needs a value" % args[i])
+
+    movetime = None
+    if "movetime" in options:
+      movetime = max(0.01, options["movetime"] / 1000 - MOVE_OVERHEAD)
+    else:
+      side = "w" if self.game.turn else "b"
+      if side + "time" in options:
+        movetime = move_time(options[side + "time"] / 1000, options.get(side + "inc", 0) / 1000,
+          options.get("movestogo"))
+    depth = options.get("depth")
+    nodes = options.get("nodes")
+    infinite = "infinite" in flags
+    if infinite:
+      movetime = None
+    if depth is None and (infinite or movetime is not None or nodes is not None or "ponder" in flags):
+      depth = MAX_PLY
+    limits = SearchLimits(depth=depth, nodes=nodes, movetime=movetime, ponder="ponder" in flags)
+
+    self._ponderhit.clear()
+    self._release.clear()
+    searcher = self.searcher
+    game = self.game
+    self._thread = threading.Thread(target=self._search, args=(searcher, game, limits, infinite), daemon=True)
+    self._thread.start()
+
+  def _search(self, searcher, game, limits, infinite):
+    result = searcher.search(game, limits, self._info)
+    # UCI forbids answering an infinite or pondering search before stop or ponderhit
+    if infinite or (limits.ponder and not self._ponderhit.is_set()):
+      self._release.wait()
+    line = "bestmove %s" % (move_uci(result.move) if result.move else "0000")
+    if len(result.pv) > 1:
+      line += " ponder %s" % move_uci(result.pv[1])
+    self._send(line)
+
+  def _info(self, result):
+    self._send("info depth %d score %s nodes %d nps %d time %d pv %s" % (result.depth,
+      format_score(result.score), result.nodes, result.nps, int(result.seconds * 1000),
+      " ".join(move_uci(move) for move in result.pv)))
+
+  def _cmd_stop(self, args):
+    self._stop()
+
+  def _cmd_ponderhit(self, args):
+    self._ponderhit.set()
+    self._release.set()
+
+  def _stop(self):
+    """Stop a running search and wait for its bestmove to be sent."""
+    if self._thread is None:
+      return
+    self._release.set()
+    # a stop before the thread reaches search() is reset by it, so repeat it
+    while self._thread.is_alive():
+      self._searcher.stop()
+      self._thread.join(0.01)
+    self._thread = None
+
+def main():
+  engine = UciEngine()
+  for line in sys.stdin:
+    if not engine.handle(line):
+      break
+  else:
+    engine.handle("quit")
+
+if __name__ == '__main__':
+  main()
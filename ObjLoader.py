@@ -0,0 +1,612 @@
+"""Parsing Wavefront OBJ files into the vertex streams ObjModel draws.
+
+loadMesh parses an OBJ file and its MTL file once, welds identical corners
+into an index buffer ordered for the post-transform vertex cache, and writes
+the result to a binary cache file next to it, keyed on the path, size and
+modification time of both. Later loads memory map the cache, so the streams
+go to the GPU without being parsed or copied.
+
+    python ObjLoader.py [model/*.obj]
+
+times the NumPy parser, parseObj, against the original line by line parser,
+parseObjLines, on every file (model/*.obj by default), including building the
+float32 buffers each one uploads, checks both give the same data and times
+loading from the cache. It then reports the vertices, memory and vertex
+cache misses per triangle of each mesh before and after indexing.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from ctypes import c_float
+
+import numpy as np
+
+# a cache file starts with this tag, the length of the JSON metadata after
+# it, the number of vertices and of indices and the bytes per index; the
+# interleaved float32 vertices follow the metadata and the indices follow them
+_CACHE_TAG = b"OBJMESH3"
+_CACHE_HEADER = struct.Struct("<8sQQQQ")
+
+# floats per vertex of every stream a mesh gives; the OBJ files have no
+# tangent frames, so tangents and bitangents are constant placeholders
+STREAM_WIDTHS = {"positions" : 3, "normals" : 3, "uvs" : 2, "tangents" : 3, "bitangents" : 3}
+_PLACEHOLDERS = {"tangents" : [0.0, 1.0, 0.0], "bitangents" : [1.0, 0.0, 0.0]}
+# the streams interleaved in MeshData.vertices and cache files, in order
+VERTEX_STREAMS = ("positions", "normals", "uvs")
+
+# the post-transform vertex cache triangles are ordered for, in vertices
+VERTEX_CACHE_SIZE = 16
+
+
+class MeshData:
+    """The triangles of an OBJ file.
+
+    positions, normals and uvs hold one float32 row per vertex. Without
+    indices every triangle corner is a vertex of its own; otherwise indices
+    holds three per triangle. chunks is a list of (materialName, offset, count)
+    in corners, one per run of faces using a material, and materialLib the
+    name of the MTL file or None.
+    materials holds the materials parseMtl read from it, once loaded.
+    aabbMin and aabbMax bound every position in the file, used or not.
+    vertices, when not None, is the VERTEX_STREAMS interleaved in one array
+    of which positions, normals and uvs are views.
+    """
+    def __init__(self, positions, normals, uvs, chunks, materialLib, aabbMin, aabbMax, materials=None, indices=None,
+            vertices=None):
+        self.positions = positions
+        self.normals = normals
+        self.uvs = uvs
+        self.chunks = chunks
+        self.materialLib = materialLib
+        self.aabbMin = aabbMin
+        self.aabbMax = aabbMax
+        self.materials = materials if materials is not None else {}
+        self.indices = indices
+        self.vertices = vertices
+
+    def interleave(self, streams):
+        """Return the named streams side by side in one (n, floats) float32
+        array, in the order given. For VERTEX_STREAMS this is vertices itself,
+        which for a cached mesh is the memory mapped file, so nothing is copied."""
+        if self.vertices is not None and tuple(streams) == VERTEX_STREAMS:
+            return self.vertices
+        vertices = np.empty((len(self.positions), sum(STREAM_WIDTHS[name] for name in streams)), dtype=np.float32)
+        offset = 0
+        for name in streams:
+            width = STREAM_WIDTHS[name]
+            vertices[:, offset:offset + width] = _PLACEHOLDERS[name] if name in _PLACEHOLDERS else getattr(self, name)
+            offset += width
+        return vertices
+
+
+def parseFaceIndexSet(s):
+    inds = s.split('/')
+    assert len(inds) == 3
+    return [int(ind) - 1 if ind != '' else -1 for ind in inds]
+
+
+def parseFace(tokens):
+    assert len(tokens) >= 3
+    result = []
+    v0 = parseFaceIndexSet(tokens[0])
+    v1 = parseFaceIndexSet(tokens[1])
+    for t in tokens[2:]:
+        v2 = parseFaceIndexSet(t)
+        result += [v0, v1, v2]
+        v1 = v2
+    return result
+
+
+def parseObjLines(objLines):
+    """Parse the lines of an OBJ file one token at a time, as ObjModel always
+    did. Slow, but it takes anything the NumPy parser does not."""
+    positions = []
+    normals = []
+    uvs = []
+    materialChunks = []
+    materialLib = None
+
+    for l in objLines:
+        if len(l) > 0 and l[:1] != "#":
+            tokens = l.split()
+            if len(tokens):
+                if tokens[0] == "mtllib":
+                    assert len(tokens) >= 2
+                    materialLib = " ".join(tokens[1:])
+                if tokens[0] == "usemtl":
+                    assert len(tokens) >= 2
+                    materialName = " ".join(tokens[1:])
+                    if len(materialChunks) == 0 or materialChunks[-1][0] != materialName:
+                        materialChunks.append([materialName, []])
+                elif tokens[0] == "v":
+                    assert len(tokens[1:]) >= 3
+                    positions.append([float(v) for v in tokens[1:4]])
+                elif tokens[0] == "vn":
+                    assert len(tokens[1:]) >= 3
+                    normals.append([float(v) for v in tokens[1:4]])
+                elif tokens[0] == "vt":
+                    assert len(tokens[1:]) >= 2
+                    uvs.append([float(v) for v in tokens[1:3]])
+                elif tokens[0] == "f":
+                    materialChunks[-1][1] += parseFace(tokens[1:])
+
+    numVerts = sum(len(tris) for _, tris in materialChunks)
+    outPositions = [None] * numVerts
+    outNormals = [None] * numVerts
+    outUvs = [[0.0, 0.0]] * numVerts
+    chunks = []
+    offset = 0
+    for materialName, tris in materialChunks:
+        for k, (p, t, n) in enumerate(tris):
+            outPositions[offset + k] = positions[p]
+            if t != -1:
+                outUvs[offset + k] = uvs[t]
+            outNormals[offset + k] = normals[n]
+        chunks.append((materialName, offset, len(tris)))
+        offset += len(tris)
+
+    npPos = np.array(positions)
+    return MeshData(np.array(outPositions, dtype=np.float32).reshape(-1, 3),
+        np.array(outNormals, dtype=np.float32).reshape(-1, 3),
+        np.array(outUvs, dtype=np.float32).reshape(-1, 2),
+        chunks, materialLib, npPos.min(0), npPos.max(0))
+
+
+def _parseFloatBlock(lines, width):
+    """Return the first width numbers after the keyword of each line as an
+    (n, width) float64 array, converted in one go when every line has exactly
+    width of them."""
+    if not lines:
+        return np.zeros((0, width))
+    skip = lines[0].index(" ") + 1
+    values = np.fromstring(" ".join([l[skip:] for l in lines]), sep=" ")
+    if values.size == len(lines) * width:
+        return values.reshape(-1, width)
+    return np.array([[float(v) for v in l.split()[1:width + 1]] for l in lines]).reshape(-1, width)
+
+
+class _IrregularFaces(Exception):
+    pass
+
+
+def _parseFaces(lines):
+    """Return the v/vt/vn corners of the face lines as an (n, 3) array of
+    0-based indices, -1 for a missing uv, and the number of corners of each
+    face. Raises _IrregularFaces unless every corner has all three fields."""
+    if not lines:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    text = " ".join(lines).replace("//", "/0/")
+    slashes = text.count("/")
+    # every face keyword becomes a 0/0/0 corner, which no real corner can be,
+    # so the faces can be found again after converting the whole block
+    values = np.fromstring(text.replace("f", "0/0/0").replace("/", " "), dtype=np.int64, sep=" ")
+    if values.size % 3:
+        raise _IrregularFaces()
+    corners = values.reshape(-1, 3)
+    isStart = corners[:, 0] == 0
+    starts = np.flatnonzero(isStart)
+    if len(starts) != len(lines) or starts[0] != 0 or slashes != 2 * (len(corners) - len(lines)):
+        raise _IrregularFaces()
+    counts = np.diff(np.append(starts, len(corners))) - 1
+    if counts.min() < 3:
+        raise _IrregularFaces()
+    return corners[~isStart] - 1, counts
+
+
+def parseObj(text):
+    """Parse the text of an OBJ file into a MeshData.
+
+    Each kind of line is gathered into one block that NumPy converts in a
+    single call; faces are fan triangulated and de-indexed with fancy
+    indexing. Files laid out in ways this does not handle are given to
+    parseObjLines, so the result is always the same as that of the old parser.
+    """
+    lines = text.replace("\t", " ").splitlines()
+    faceLineNos = [i for i, l in enumerate(lines) if l.startswith("f ")]
+    try:
+        corners, counts = _parseFaces([lines[i] for i in faceLineNos])
+    except _IrregularFaces:
+        return parseObjLines(lines)
+    vertexLines = [l for l in lines if l.startswith("v")]
+    positions = _parseFloatBlock([l for l in vertexLines if l.startswith("v ")], 3)
+    normals = _parseFloatBlock([l for l in vertexLines if l.startswith("vn ")], 3)
+    uvs = _parseFloatBlock([l for l in vertexLines if l.startswith("vt ")], 2)
+
+    # a usemtl naming the material already in use continues its chunk
+    materialLib = None
+    materialStarts = []
+    for lineNo, l in [(i, l) for i, l in enumerate(lines) if l.startswith(("mtllib ", "usemtl "))]:
+        keyword, name = l.split(None, 1)
+        name = name.strip()
+        if keyword == "mtllib":
+            materialLib = name
+        elif not materialStarts or materialStarts[-1][0] != name:
+            materialStarts.append((name, lineNo))
+    if faceLineNos and (not materialStarts or materialStarts[0][1] > faceLineNos[0]):
+        raise ValueError("face before the first usemtl")
+
+    # face f with c corners gives triangles (0, k + 1, k + 2) for k < c - 2
+    triCounts = counts - 2
+    triStarts = np.concatenate(([0], np.cumsum(triCounts)))
+    triFaces = np.repeat(np.arange(len(counts)), triCounts)
+    k = np.arange(triStarts[-1]) - triStarts[triFaces]
+    first = (np.cumsum(counts) - counts)[triFaces]
+    corners = corners[np.stack((first, first + k + 1, first + k + 2), 1).ravel()]
+
+    chunks = []
+    faceLineNos = np.array(faceLineNos, dtype=np.int64)
+    for i, (materialName, lineNo) in enumerate(materialStarts):
+        endLineNo = materialStarts[i + 1][1] if i + 1 < len(materialStarts) else len(lines)
+        start, end = np.searchsorted(faceLineNos, (lineNo, endLineNo))
+        chunks.append((materialName, int(triStarts[start]) * 3, int(triStarts[end] - triStarts[start]) * 3))
+
+    outUvs = np.zeros((len(corners), 2), dtype=np.float32)
+    hasUv = corners[:, 1] != -1
+    outUvs[hasUv] = uvs[corners[hasUv, 1]]
+    aabbMin = positions.min(0) if len(positions) else np.zeros(3)
+    aabbMax = positions.max(0) if len(positions) else np.zeros(3)
+    return MeshData(positions[corners[:, 0]].astype(np.float32), normals[corners[:, 2]].astype(np.float32),
+        outUvs, chunks, materialLib, aabbMin, aabbMax)
+
+
+def _tipsify(triangles, numVerts, cacheSize):
+    """Return an order of the (n, 3) triangles that keeps the vertices they
+    share in a cache of cacheSize, by Sander, Nehab and Barczak's Tipsify:
+    emit every triangle around a fanning vertex, then fan around the vertex
+    they used that will still be in the cache for all its remaining
+    triangles, or failing that the most recently used one with any left."""
+    corners = triangles.ravel()
+    byVertex = np.argsort(corners, kind="stable")
+    adjacency = (byVertex // 3).tolist()
+    starts = np.searchsorted(corners[byVertex], np.arange(numVerts + 1)).tolist()
+    live = np.bincount(corners, minlength=numVerts).tolist()
+    cacheTime = [0] * numVerts
+    emitted = [False] * len(triangles)
+    triangles = triangles.tolist()
+    deadEnds = []
+    order = []
+    time = cacheSize + 1
+    cursor = 0
+    fanning = int(corners[0]) if len(corners) else -1
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[starts[fanning]:starts[fanning + 1]]:
+            if not emitted[t]:
+                emitted[t] = True
+                order.append(t)
+                for v in triangles[t]:
+                    deadEnds.append(v)
+                    candidates.append(v)
+                    live[v] -= 1
+                    if time - cacheTime[v] > cacheSize:
+                        cacheTime[v] = time
+                        time += 1
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                # how long v has been in the cache, if it stays for all its triangles
+                priority = time - cacheTime[v] if time - cacheTime[v] + 2 * live[v] <= cacheSize else 0
+                if priority > best:
+                    best = priority
+                    fanning = v
+        while fanning < 0 and deadEnds:
+            v = deadEnds.pop()
+            if live[v] > 0:
+                fanning = v
+        while fanning < 0 and cursor < numVerts:
+            if live[cursor] > 0:
+                fanning = cursor
+            cursor += 1
+    return np.array(order, dtype=np.int64)
+
+
+def cacheMissRatio(indices, cacheSize=VERTEX_CACHE_SIZE):
+    """Return the vertices transformed per triangle drawing indices through a
+    FIFO post-transform cache of cacheSize, from 0.5 at best to 3."""
+    cache = []
+    inCache = set()
+    misses = 0
+    for v in indices.tolist():
+        if v not in inCache:
+            misses += 1
+            cache.append(v)
+            inCache.add(v)
+            if len(cache) > cacheSize:
+                inCache.discard(cache.pop(0))
+    return 3.0 * misses / len(indices) if len(indices) else 0.0
+
+
+def indexMesh(mesh, cacheSize=VERTEX_CACHE_SIZE):
+    """Return a de-indexed mesh as an indexed one.
+
+    Corners with bitwise identical position, normal and uv become one vertex.
+    The triangles of each chunk are reordered for a post-transform vertex
+    cache of cacheSize, keeping their winding, and the vertices numbered in
+    the order the triangles first use them. Indices are uint16 when they fit.
+    """
+    rows = np.ascontiguousarray(np.concatenate((mesh.positions, mesh.normals, mesh.uvs), 1), dtype=np.float32)
+    keys = rows.view(np.dtype((np.void, rows.shape[1] * 4))).ravel()
+    _, first, indices = np.unique(keys, return_index=True, return_inverse=True)
+    indices = indices.ravel()
+    numVerts = len(first)
+
+    for _, offset, count in mesh.chunks:
+        triangles = indices[offset:offset + count].reshape(-1, 3)
+        indices[offset:offset + count] = triangles[_tipsify(triangles, numVerts, cacheSize)].ravel()
+
+    firstUse = np.full(numVerts, len(indices), dtype=np.int64)
+    np.minimum.at(firstUse, indices, np.arange(len(indices)))
+    byFirstUse = np.argsort(firstUse, kind="stable")
+    renumber = np.empty(numVerts, dtype=np.int64)
+    renumber[byFirstUse] = np.arange(numVerts)
+    vertices = rows[first[byFirstUse]]
+    indexType = np.uint16 if numVerts <= 1 << 16 else np.uint32
+    return MeshData(vertices[:, 0:3], vertices[:, 3:6], vertices[:, 6:8], list(mesh.chunks), mesh.materialLib,
+        mesh.aabbMin, mesh.aabbMax, mesh.materials, renumber[indices].astype(indexType), vertices)
+
+
+def parseFloats(tokens, minNum):
+    assert len(tokens) >= minNum
+    return [float(v) for v in tokens[0:minNum]]
+
+
+# the MTL keywords naming a texture, and the channel each one sets
+_TEXTURE_KEYWORDS = {
+    "map_Kd" : "diffuse",
+    "map_Ks" : "specular",
+    "map_bump" : "normal",
+    "bump" : "normal",
+    "map_d" : "opacity",
+}
+
+
+def parseMtl(mtlLines):
+    """Parse the lines of an MTL file into a dict of materials by name, laid
+    out as ObjModel's materials but with each texture given by its file name,
+    or None when the material has no such texture."""
+    materials = {}
+    currentMaterial = ""
+    for l in mtlLines:
+        tokens = l.split()
+        if len(tokens):
+            if tokens[0] == "newmtl":
+                assert len(tokens) >= 2
+                currentMaterial = " ".join(tokens[1:])
+                materials[currentMaterial] = {
+                    "color" : {
+                        "diffuse"  : [ 0.5, 0.5, 0.5 ],
+                        "ambient"  : [ 0.5, 0.5, 0.5 ],
+                        "specular" : [ 0.5, 0.5, 0.5 ],
+                        "emissive" : [ 0.0, 0.0, 0.0 ]
+                    },
+                    "texture" : {
+                        "diffuse" : None,
+                        "opacity" : None,
+                        "specular" : None,
+                        "normal" : None,
+                    },
+                    "alpha" : 1.0,
+                    "specularExponent" : 22.0,
+                    "offset" : 0,
+                }
+            elif tokens[0] == "Ka":
+                materials[currentMaterial]["color"]["ambient"] = parseFloats(tokens[1:], 3)
+            elif tokens[0] == "Ns":
+                materials[currentMaterial]["specularExponent"] = float(tokens[1])
+            elif tokens[0] == "Kd":
+                materials[currentMaterial]["color"]["diffuse"] = parseFloats(tokens[1:], 3)
+            elif tokens[0] == "Ks":
+                materials[currentMaterial]["color"]["specular"] = parseFloats(tokens[1:], 3)
+            elif tokens[0] == "Ke":
+                materials[currentMaterial]["color"]["emissive"] = parseFloats(tokens[1:], 3)
+            elif tokens[0] in _TEXTURE_KEYWORDS:
+                materials[currentMaterial]["texture"][_TEXTURE_KEYWORDS[tokens[0]]] = " ".join(tokens[1:])
+            elif tokens[0] == "d":
+                materials[currentMaterial]["alpha"] = float(tokens[1])
+    return materials
+
+
+def _fileKey(fileName):
+    stat = os.stat(fileName)
+    return [os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns]
+
+
+def cachePath(fileName):
+    """The cache file of an OBJ file, next to it."""
+    return fileName + ".mesh"
+
+
+def writeCache(path, mesh, sources):
+    """Write an indexed mesh to a cache file at path, replacing any existing
+    file atomically. sources are the _fileKey of every file it was read from."""
+    metadata = json.dumps({
+        "sources" : sources,
+        "chunks" : mesh.chunks,
+        "materialLib" : mesh.materialLib,
+        "materials" : mesh.materials,
+        "aabbMin" : [float(v) for v in mesh.aabbMin],
+        "aabbMax" : [float(v) for v in mesh.aabbMax],
+    }).encode()
+    # pad so the vertices start 16 byte aligned
+    metadata += b" " * (-(_CACHE_HEADER.size + len(metadata)) % 16)
+    directory = os.path.dirname(path) or "."
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=".mesh")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_CACHE_HEADER.pack(_CACHE_TAG, len(metadata), len(mesh.positions), len(mesh.indices),
+                mesh.indices.itemsize))
+            f.write(metadata)
+            f.write(np.ascontiguousarray(mesh.interleave(VERTEX_STREAMS), dtype="<f4").tobytes())
+            f.write(np.ascontiguousarray(mesh.indices, dtype=mesh.indices.dtype.newbyteorder("<")).tobytes())
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def _mapCache(path):
+    """Memory map a cache file and return its MeshData, whose vertices and
+    indices are views of the file, or None when the file is missing, not a cache file of
+    this version or was written from other versions of its sources."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _CACHE_HEADER.size:
+                return None
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, metadataSize, numVerts, numIndices, indexSize = _CACHE_HEADER.unpack_from(buffer)
+        floats = sum(STREAM_WIDTHS[name] for name in VERTEX_STREAMS)
+        if tag != _CACHE_TAG or indexSize not in (2, 4) or \
+                size != _CACHE_HEADER.size + metadataSize + numVerts * floats * 4 + numIndices * indexSize:
+            return None
+        metadata = json.loads(buffer[_CACHE_HEADER.size:_CACHE_HEADER.size + metadataSize].decode())
+        if any(_fileKey(source[0]) != source for source in metadata["sources"]):
+            return None
+    except (OSError, ValueError):
+        return None
+    offset = _CACHE_HEADER.size + metadataSize
+    vertices = np.frombuffer(buffer, dtype="<f4", count=numVerts * floats, offset=offset).reshape(-1, floats)
+    indices = np.frombuffer(buffer, dtype="<u%d" % indexSize, count=numIndices, offset=offset + vertices.nbytes)
+    streams = {}
+    offset = 0
+    for name in VERTEX_STREAMS:
+        streams[name] = vertices[:, offset:offset + STREAM_WIDTHS[name]]
+        offset += STREAM_WIDTHS[name]
+    return MeshData(streams["positions"], streams["normals"], streams["uvs"],
+        [tuple(chunk) for chunk in metadata["chunks"]], metadata["materialLib"],
+        np.array(metadata["aabbMin"]), np.array(metadata["aabbMax"]), metadata["materials"], indices, vertices)
+
+
+def loadMesh(fileName):
+    """Return the indexed MeshData of an OBJ file with the materials of its
+    MTL file.
+
+    The text is only parsed when the cache file is missing or either file has
+    changed since it was written, and the new cache is written then. A cache
+    that cannot be written next to the OBJ file goes to the temporary
+    directory, and failing that the parsed mesh is used as is.
+    """
+    path = cachePath(fileName)
+    fallback = os.path.join(tempfile.gettempdir(), "chess-" + os.path.basename(path))
+    mesh = _mapCache(path) or _mapCache(fallback)
+    if mesh is None:
+        # the files are keyed before reading, so a change while parsing
+        # leaves a stale key rather than stale data
+        sources = [_fileKey(fileName)]
+        with open(fileName, "r") as inFile:
+            mesh = parseObj(inFile.read())
+        if mesh.materialLib is not None:
+            materialFileName = os.path.join(os.path.dirname(fileName), mesh.materialLib)
+            sources.append(_fileKey(materialFileName))
+            with open(materialFileName, "r") as inFile:
+                mesh.materials = parseMtl(inFile.readlines())
+        mesh = indexMesh(mesh)
+        for target in (path, fallback):
+            try:
+                writeCache(target, mesh, sources)
+            except OSError:
+                continue
+            return _mapCache(target) or mesh
+    return mesh
+
+
+def _oldBuffers(mesh):
+    """Build the ctypes arrays ObjModel used to upload, from nested lists."""
+    flat = lambda rows: [u for row in rows for u in row]
+    buffers = []
+    for data in (mesh.positions, mesh.normals, mesh.uvs):
+        flatData = flat(data)
+        buffers.append((c_float * len(flatData))(*flatData))
+    for constant in ([0.0, 1.0, 0.0], [1.0, 0.0, 0.0]):
+        flatData = flat([constant] * len(mesh.positions))
+        buffers.append((c_float * len(flatData))(*flatData))
+    return buffers
+
+
+def _chunkTriangles(mesh, chunk):
+    """Return the triangles of a chunk as sorted rows of corner data, the
+    same whatever their order or indexing."""
+    _, offset, count = chunk
+    corners = np.arange(offset, offset + count) if mesh.indices is None else mesh.indices[offset:offset + count]
+    rows = np.concatenate((mesh.positions[corners], mesh.normals[corners], mesh.uvs[corners]), 1).reshape(-1, 24)
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def sameTriangles(a, b):
+    """Whether two meshes draw the same triangles with the same materials."""
+    return [chunk[0] for chunk in a.chunks] == [chunk[0] for chunk in b.chunks] and \
+        all(np.array_equal(_chunkTriangles(a, ca), _chunkTriangles(b, cb)) for ca, cb in zip(a.chunks, b.chunks))
+
+
+def main():
+    fileNames = sys.argv[1:] or sorted(glob.glob("model/*.obj"))
+    print("%-28s %8s %10s %10s %8s %10s" % ("file", "corners", "old ms", "new ms", "speedup", "cached ms"))
+    totalOld = totalNew = totalCached = 0.0
+    for fileName in fileNames:
+        with open(fileName, "r") as inFile:
+            text = inFile.read()
+
+        start = time.perf_counter()
+        old = parseObjLines(text.splitlines(True))
+        # the old upload path went through lists of lists
+        old.positions, old.normals, old.uvs = old.positions.tolist(), old.normals.tolist(), old.uvs.tolist()
+        _oldBuffers(old)
+        oldSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = parseObj(text)
+        np.tile(np.array([0.0, 1.0, 0.0], dtype=np.float32), (len(new.positions), 1))
+        np.tile(np.array([1.0, 0.0, 0.0], dtype=np.float32), (len(new.positions), 1))
+        newSeconds = time.perf_counter() - start
+
+        same = (np.array_equal(np.array(old.positions, dtype=np.float32), new.positions)
+            and np.array_equal(np.array(old.normals, dtype=np.float32), new.normals)
+            and np.array_equal(np.array(old.uvs, dtype=np.float32), new.uvs)
+            and old.chunks == new.chunks and old.materialLib == new.materialLib
+            and np.array_equal(old.aabbMin, new.aabbMin) and np.array_equal(old.aabbMax, new.aabbMax))
+        if not same:
+            print("%s: the parsers disagree" % fileName)
+            sys.exit(1)
+
+        # the first load writes the cache if it is missing or stale
+        loadMesh(fileName)
+        start = time.perf_counter()
+        cached = loadMesh(fileName)
+        cachedSeconds = time.perf_counter() - start
+        if not sameTriangles(cached, new):
+            print("%s: the cache disagrees with the parser" % fileName)
+            sys.exit(1)
+
+        totalOld += oldSeconds
+        totalNew += newSeconds
+        totalCached += cachedSeconds
+        print("%-28s %8d %10.1f %10.1f %7.1fx %10.2f" % (fileName, len(new.positions), oldSeconds * 1000,
+            newSeconds * 1000, oldSeconds / newSeconds, cachedSeconds * 1000))
+    if fileNames:
+        print("%-28s %8s %10.1f %10.1f %7.1fx %10.2f" % ("total", "", totalOld * 1000, totalNew * 1000,
+            totalOld / totalNew, totalCached * 1000))
+
+    # before: every corner in the five streams ObjModel used to upload, placeholder tangents and
+    # bitangents included; after: the vertices interleaved in its default layout, and the indices
+    cornerBytes = sum(STREAM_WIDTHS.values()) * 4
+    vertexBytes = sum(STREAM_WIDTHS[name] for name in VERTEX_STREAMS) * 4
+    print()
+    print("%-28s %8s %8s %10s %10s %6s %6s" % ("file", "corners", "vertices", "before KB", "after KB",
+        "ACMR", "after"))
+    for fileName in fileNames:
+        mesh = loadMesh(fileName)
+        corners = len(mesh.indices)
+        before = corners * cornerBytes
+        after = len(mesh.positions) * vertexBytes + mesh.indices.nbytes
+        print("%-28s %8d %8d %10.1f %10.1f %6.2f %6.2f" % (fileName, corners, len(mesh.positions), before / 1024,
+            after / 1024, cacheMissRatio(np.arange(corners)), cacheMissRatio(mesh.indices)))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,22 +4,67 @@ from PIL import Image
 from ctypes import sizeof, c_float, c_void_p, c_uint, string_at
 import magic
 import Util as lu
+import ObjLoader
+import Assets
 import numpy as np
 
 
-def flatten(*lll):
-	return [u for ll in lll for l in ll for u in l]
-
-
-
 def bindTexture(texUnit, textureId, defaultTexture):
 	glActiveTexture(GL_TEXTURE0 + texUnit);
 	glBindTexture(GL_TEXTURE_2D, textureId if textureId != -1 else defaultTexture);
 
 
+def createDefaultTexture(internalFormat, rgba):
+    texId = glGenTextures(1);
+    glBindTexture(GL_TEXTURE_2D, texId);
+    glTexImage2D(GL_TEXTURE_2D, 0, internalFormat, 1, 1, 0, GL_RGBA, GL_FLOAT, rgba);
+    glBindTexture(GL_TEXTURE_2D, 0);
+    return texId
+
+
+def deleteTexture(texId):
+    if texId != -1:
+        glDeleteTextures([texId])
+        size = ObjModel.texturesById.pop(texId, None)
+        # the same file loaded as sRGB and as linear is two textures under one name,
+        # so only forget the name while it still refers to this one
+        if size is not None and ObjModel.texturesByName.get(size[2], (0, 0, -1))[2] == texId:
+            del ObjModel.texturesByName[size[2]]
+
+
+def deleteMesh(mesh):
+    glDeleteVertexArrays(1, [mesh["vertexArrayObject"]])
+    glDeleteBuffers(2, [mesh["vertexBuffer"], mesh["indexBuffer"]])
+    for key in mesh["textureKeys"]:
+        Assets.registry.release(key)
+
+
+def acquireShader(vertexShaderSource, fragmentShaderSource):
+    """Return the program built from the sources with the default ObjModel bindings, shared with everyone
+    who acquired the same sources and None if it does not build. Give it back with releaseShader."""
+    def create():
+        shader = lu.buildShader(vertexShaderSource, fragmentShaderSource, ObjModel.getDefaultAttributeBindings())
+        if shader:
+            glUseProgram(shader)
+            ObjModel.setDefaultUniformBindings(shader)
+            glUseProgram(0)
+        return shader
+    return Assets.registry.acquire(("program", vertexShaderSource, fragmentShaderSource), create,
+        lambda shader: shader and glDeleteProgram(shader))
+
+
+def releaseShader(vertexShaderSource, fragmentShaderSource):
+    Assets.registry.release(("program", vertexShaderSource, fragmentShaderSource))
+
+
 
 
 class ObjModel:
+    """A model loaded from an OBJ file, drawn with the default or a given shader.
+
+    Every ObjModel of the same file and layout shares one loaded mesh: its meshAttributes,
+    the materials and chunks among them, are the same objects in all of them, so changing a material
+    of one changes it for every model of that file. release() gives the mesh back."""
     RF_Transparent = 1
     RF_AlphaTested = 2
     RF_Opaque = 4
@@ -40,76 +85,59 @@ class ObjModel:
     texturesByName = {}
     texturesById = {}
 
-    def __init__(self, fileName):
-        self.defaultTextureOne = glGenTextures(1);
-        glBindTexture(GL_TEXTURE_2D, self.defaultTextureOne);
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_FLOAT, [1.0, 1.0, 1.0, 1.0]);
+    # the streams of ObjLoader.STREAM_WIDTHS uploaded, interleaved in this order, and the attribute
+    # each one feeds. The tangents and bitangents are constant placeholders the default shaders
+    # never read, so they are left out unless a layout asks for them.
+    defaultLayout = (("positions", AA_Position), ("normals", AA_Normal), ("uvs", AA_TexCoord))
+
+    # what loadMesh sets up, shared through Assets.registry by every ObjModel of the same file and layout
+    meshAttributes = ("numVerts", "positions", "normals", "uvs", "indices", "chunks", "materials", "textureKeys",
+        "vertexArrayObject", "vertexBuffer", "indexBuffer", "indexType", "aabbMin", "aabbMax", "centre")
 
-        self.defaultNormalTexture = glGenTextures(1);
-        glBindTexture(GL_TEXTURE_2D, self.defaultNormalTexture);
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA32F, 1, 1, 0, GL_RGBA, GL_FLOAT, [0.5, 0.5, 0.5, 1.0]);
-        glBindTexture(GL_TEXTURE_2D, 0);
+    def __init__(self, fileName, layout = None):
+        self.layout = tuple(layout) if layout is not None else self.defaultLayout
+        # the mesh, its textures, the default textures and the default shader are loaded by the
+        # first ObjModel that needs them and shared by the rest until all are released
+        self.defaultTextureOne = Assets.registry.acquire(("texture", "<one>"),
+            lambda: createDefaultTexture(GL_RGBA, [1.0, 1.0, 1.0, 1.0]), deleteTexture)
+        self.defaultNormalTexture = Assets.registry.acquire(("texture", "<normal>"),
+            lambda: createDefaultTexture(GL_RGBA32F, [0.5, 0.5, 0.5, 1.0]), deleteTexture)
 
         self.overrideDiffuseTextureWithDefault = False
         self.load(fileName)
 
-        self.defaultShader = lu.buildShader(self.defaultVertexShader, self.defaultFragmentShader, ObjModel.getDefaultAttributeBindings())
-        glUseProgram(self.defaultShader)
-        ObjModel.setDefaultUniformBindings(self.defaultShader)
-        glUseProgram(0)
+        self.defaultShader = acquireShader(self.defaultVertexShader, self.defaultFragmentShader)
 
     def load(self, fileName):
-        basePath,_ = os.path.split(fileName)
-        with open(fileName, "r") as inFile:
-            self.loadObj(inFile.readlines(), basePath)
-
-    def loadObj(self, objLines, basePath):
-        positions = []
-        normals = []
-        uvs = []
-        materialChunks = []
-        materials = {}
-        
-        for l in objLines:
-            #1 standardize line
-            if len(l) > 0 and l[:1] != "#":
-                tokens = l.split()
-                if len(tokens):
-                    if tokens[0] == "mtllib":
-                        assert len(tokens) >= 2
-                        materialName = " ".join(tokens[1:])
-                        materials = self.loadMaterials(os.path.join(basePath, materialName), basePath)
-                    if tokens[0] == "usemtl":
-                        assert len(tokens) >= 2
-                        materialName = " ".join(tokens[1:])
-                        if len(materialChunks) == 0 or materialChunks[-1][0]  != materialName:
-                            materialChunks.append([materialName, []])
-                    elif tokens[0] == "v":
-                        assert len(tokens[1:]) >= 3
-                        positions.append([float(v) for v in tokens[1:4]])
-                    elif tokens[0] == "vn":
-                        assert len(tokens[1:]) >= 3
-                        normals.append([float(v) for v in tokens[1:4]])
-                    elif tokens[0] == "vt":
-                        assert len(tokens[1:]) >= 2
-                        uvs.append([float(v) for v in tokens[1:3]])
-                    elif tokens[0] == "f":
-                        materialChunks[-1][1] += self.parseFace(tokens[1:])
-        self.numVerts = 0
-        for mc in materialChunks:
-            self.numVerts += len(mc[1])
-        
-        self.positions = [None]*self.numVerts
-        self.normals = [None]*self.numVerts
-        self.uvs = [[0.0,0.0]]*self.numVerts
-        self.tangents = [[0.0,1.0,0.0]]*self.numVerts
-        self.bitangents = [[1.0,0.0,0.0]]*self.numVerts
+        def create():
+            basePath,_ = os.path.split(fileName)
+            self.loadMesh(ObjLoader.loadMesh(fileName), basePath)
+            return {name : getattr(self, name) for name in self.meshAttributes}
+        self.meshKey = ("mesh", os.path.abspath(fileName), self.layout)
+        self.__dict__.update(Assets.registry.acquire(self.meshKey, create, deleteMesh))
+
+    def release(self):
+        """Give back the shared resources, deleting those no other ObjModel uses."""
+        Assets.registry.release(self.meshKey)
+        Assets.registry.release(("texture", "<one>"))
+        Assets.registry.release(("texture", "<normal>"))
+        releaseShader(self.defaultVertexShader, self.defaultFragmentShader)
+
+    def loadMesh(self, mesh, basePath):
+        if mesh.indices is None:
+            mesh = ObjLoader.indexMesh(mesh)
+        self.textureKeys = []
+        materials = self.loadMaterials(mesh.materials, basePath)
+
+        self.numVerts = len(mesh.positions)
+        self.positions = mesh.positions
+        self.normals = mesh.normals
+        self.uvs = mesh.uvs
+        self.indices = mesh.indices
         self.chunks = []
 
-        start = 0
-        end = 0
         self.materials = materials
-        for matId, tris in materialChunks:
+        for matId, chunkOffset, chunkCount in mesh.chunks:
             material = materials[matId]
             renderFlags = 0
             if material["alpha"] != 1.0:
@@ -118,129 +146,61 @@ class ObjModel:
                 renderFlags |= self.RF_AlphaTested
             else:
                 renderFlags |= self.RF_Opaque
-            start = end
-            end = start + int(len(tris)/3)
-
-            chunkOffset = start * 3
-            chunkCount = len(tris)
-
-            # De-index mesh and (TODO) compute tangent frame
-            for k in range(0,len(tris),3):
-                for j in [0,1,2]:
-                    p = positions[tris[k + j][0]]
-                    oo = chunkOffset + k + j
-                    self.positions[oo]= p
-                    if tris[k + j][1] != -1:
-                        self.uvs[oo] = uvs[tris[k + j][1]]
-                    self.normals[oo] = normals[tris[k + j][2]]
             self.chunks.append((material, chunkOffset, chunkCount, renderFlags))
         
         self.vertexArrayObject = glGenVertexArrays(1)
         glBindVertexArray(self.vertexArrayObject)
 
-        def createBindVertexAttribArrayFloat(data, attribLoc):
-            bufId = glGenBuffers(1)
-            glBindBuffer(GL_ARRAY_BUFFER, bufId)
-            flatData = flatten(data)
-            data_buffer = (c_float * len(flatData))(*flatData)
-            glBufferData(GL_ARRAY_BUFFER, data_buffer, GL_STATIC_DRAW)
-            glVertexAttribPointer(attribLoc, int(len(flatData) / len(data)), GL_FLOAT, GL_FALSE, 0, None)
+        # one buffer with the streams of the layout side by side, straight from the (memory mapped) array
+        vertices = mesh.interleave([stream for stream, attribLoc in self.layout])
+        self.vertexBuffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertexBuffer)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        stride = vertices.shape[1] * 4
+        offset = 0
+        for stream, attribLoc in self.layout:
+            width = ObjLoader.STREAM_WIDTHS[stream]
+            glVertexAttribPointer(attribLoc, width, GL_FLOAT, GL_FALSE, stride, c_void_p(offset))
             glEnableVertexAttribArray(attribLoc)
-            return bufId
+            offset += width * 4
 
-        self.positionBuffer = createBindVertexAttribArrayFloat(self.positions, self.AA_Position)
-        self.normalBuffer = createBindVertexAttribArrayFloat(self.normals, self.AA_Normal)
-        self.uvBuffer = createBindVertexAttribArrayFloat(self.uvs, self.AA_TexCoord)
-        self.tangentBuffer = createBindVertexAttribArrayFloat(self.tangents, self.AA_Tangent)
-        self.biTangentBuffer = createBindVertexAttribArrayFloat(self.bitangents, self.AA_Bitangent)
+        # the element buffer binding is part of the vertex array object
+        self.indexBuffer = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indexBuffer)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
+        self.indexType = GL_UNSIGNED_SHORT if self.indices.itemsize == 2 else GL_UNSIGNED_INT
 
-        npPos = np.array(positions)
-        self.aabbMin = npPos.min(0)
-        self.aabbMax = npPos.max(0)
+        self.aabbMin = mesh.aabbMin
+        self.aabbMax = mesh.aabbMax
         self.centre = (self.aabbMin + self.aabbMax) * 0.5
         
         glBindBuffer(GL_ARRAY_BUFFER, 0)
         glBindVertexArray(0)
 
 
-    def parseFloats(self, tokens, minNum):
-        assert len(tokens) >= minNum
-        return [float(v) for v in tokens[0:minNum]]
-
-    def parseFaceIndexSet(self, s):
-        inds = s.split('/')
-        assert len(inds) == 3
-        return [int(ind) - 1 if ind != '' else -1 for ind in inds]
-
-    def parseFace(self, tokens):
-        assert len(tokens) >= 3
-        result = []
-        v0 = self.parseFaceIndexSet(tokens[0])
-        v1 = self.parseFaceIndexSet(tokens[1])
-        for t in tokens[2:]:
-            v2 = self.parseFaceIndexSet(t)
-            result += [v0, v1, v2]
-            v1 = v2
-        return result
-
-    def loadMaterials(self, materialFileName, basePath):
+    def loadMaterials(self, materialDescs, basePath):
         materials = {}
-        with open(materialFileName, "r") as inFile:
-            currentMaterial = ""
-            for l in inFile.readlines():
-                tokens = l.split()
-                if len(tokens):
-                    if tokens[0] == "newmtl":
-                        assert len(tokens) >= 2
-                        currentMaterial = " ".join(tokens[1:])
-                        materials[currentMaterial] = {
-                            "color" : {
-                                "diffuse"  : [ 0.5, 0.5, 0.5 ],
-                                "ambient"  : [ 0.5, 0.5, 0.5 ],
-                                "specular" : [ 0.5, 0.5, 0.5 ],
-                                "emissive" : [ 0.0, 0.0, 0.0 ]
-                            },
-                            "texture" : {
-                                "diffuse" : -1,
-                                "opacity" : -1,
-                                "specular" : -1,
-                                "normal" : -1,
-                            },
-                            "alpha" : 1.0,
-                            "specularExponent" : 22.0,
-                            "offset" : 0,
-                        }
-                    elif tokens[0] == "Ka":
-                        materials[currentMaterial]["color"]["ambient"] = self.parseFloats(tokens[1:], 3)
-                    elif tokens[0] == "Ns":
-                        materials[currentMaterial]["specularExponent"] = float(tokens[1])
-                    elif tokens[0] == "Kd":
-                        materials[currentMaterial]["color"]["diffuse"] = self.parseFloats(tokens[1:], 3)
-                    elif tokens[0] == "Ks":
-                        materials[currentMaterial]["color"]["specular"] = self.parseFloats(tokens[1:], 3)
-                    elif tokens[0] == "Ke":
-                        materials[currentMaterial]["color"]["emissive"] = self.parseFloats(tokens[1:], 3)
-                    elif tokens[0] == "map_Kd":
-                        materials[currentMaterial]["texture"]["diffuse"] = self.loadTexture(" ".join(tokens[1:]), basePath, True)
-                    elif tokens[0] == "map_Ks":
-                        materials[currentMaterial]["texture"]["specular"] = self.loadTexture(" ".join(tokens[1:]), basePath, True)
-                    elif tokens[0] == "map_bump" or tokens[0] == "bump":
-                        materials[currentMaterial]["texture"]["normal"] = self.loadTexture(" ".join(tokens[1:]), basePath, False)
-                    elif tokens[0] == "map_d":
-                        materials[currentMaterial]["texture"]["opacity"] = self.loadTexture(" ".join(tokens[1:]), basePath, False)
-                    elif tokens[0] == "d":
-                        materials[currentMaterial]["alpha"] = float(tokens[1])
+        for name, desc in materialDescs.items():
+            material = dict(desc, color=dict(desc["color"]), texture={})
+            for ch, fileName in desc["texture"].items():
+                # normal maps and alpha masks are authored in linear space
+                srgb = ch in ("diffuse", "specular")
+                material["texture"][ch] = self.loadTexture(fileName, basePath, srgb) if fileName is not None else -1
+            materials[name] = material
 
         # check of there is a colour texture but the coour is zero and then change it to 1, Maya exporter does this to us...
         for id,m in materials.items():
             for ch in ["diffuse", "specular"]:
                 if m["texture"][ch] != -1 and sum(m["color"][ch]) == 0.0:
                     m["color"][ch] = [1,1,1]
-                if m["texture"][ch] != -1 and sum(m["color"][ch]) == 0.0:
-                    m["color"][ch] = [1,1,1]
         return materials
 
     def loadTexture(self, fileName, basePath, srgb):
+        key = ("texture", os.path.abspath(os.path.join(basePath, fileName)), srgb)
+        self.textureKeys.append(key)
+        return Assets.registry.acquire(key, lambda: self.createTexture(fileName, basePath, srgb), deleteTexture)
+
+    def createTexture(self, fileName, basePath, srgb):
         fullFileName = os.path.join(basePath, fileName)
 
         width = 0;
@@ -337,7 +297,8 @@ class ObjModel:
                 glUniform1f(magic.getUniformLocationDebug(shaderProgram, "material_specular_exponent"), material["specularExponent"])
                 glUniform1f(magic.getUniformLocationDebug(shaderProgram, "material_alpha"), material["alpha"])
     
-            glDrawArrays(GL_TRIANGLES, chunkOffset, chunkCount)
+            # the offset into the index buffer is given in bytes
+            glDrawElements(GL_TRIANGLES, chunkCount, self.indexType, c_void_p(chunkOffset * self.indices.itemsize))
 
         glUseProgram(0);
         # deactivate texture units...
@@ -0,0 +1,77 @@
+"""ExternalOpponent against the stand-in engine of Chess.FakeEngine."""
+import sys
+import time
+import unittest
+
+from Chess.External import ExternalOpponent
+from Chess.Model import Game, START_FEN, move_uci
+
+FAKE_ENGINE = [sys.executable, "-m", "Chess.FakeEngine", "--delay", "0.01", "--depth", "3"]
+
+class ExternalOpponentTest(unittest.TestCase):
+
+  def setUp(self):
+    self.engine = ExternalOpponent(FAKE_ENGINE, movetime=0.05)
+
+  def tearDown(self):
+    self.engine.close()
+
+  def wait_for_result(self):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+      result = self.engine.poll()
+      if result is not None:
+        return result
+      time.sleep(0.005)
+    self.fail("the engine did not answer")
+
+  def first_move(self, game):
+    # the fake engine plays the first legal move in UCI order
+    return min(move_uci(move) for move in game.legal_moves())
+
+  def test_start_returns_a_legal_move(self):
+    game = Game.from_fen(START_FEN)
+    game.make_move(game.parse_uci("e2e4"))
+    self.assertEqual(self.engine.name, "FakeEngine")
+    self.engine.start(game)
+    self.assertTrue(self.engine.thinking)
+    result = self.wait_for_result()
+    self.assertFalse(self.engine.thinking)
+    self.assertEqual(move_uci(result.move), self.first_move(game))
+    self.assertEqual(result.pv[0], result.move)
+
+  def test_cancelled_analysis_is_not_returned(self):
+    game = Game.from_fen(START_FEN)
+    self.engine.analyse(game)
+    time.sleep(0.05)
+    self.assertTrue(self.engine.infos())
+    self.engine.cancel()
+    self.assertFalse(self.engine.analysing)
+    # let the stopped analysis answer; nothing is waiting for it
+    time.sleep(0.1)
+    self.assertIsNone(self.engine.poll())
+
+    # a2a3, the analysis's move, is not legal here
+    play = Game.from_fen(START_FEN)
+    for text in ("a2a4", "a7a5"):
+      play.make_move(play.parse_uci(text))
+    self.engine.start(play)
+    self.assertEqual(move_uci(self.wait_for_result().move), self.first_move(play))
+    self.assertIsNone(self.engine.poll())
+
+  def test_cancelled_search_is_not_returned(self):
+    game = Game.from_fen(START_FEN)
+    for _ in range(3):
+      self.engine.start(game)
+      self.engine.cancel()
+    self.assertFalse(self.engine.thinking)
+    self.assertIsNone(self.engine.poll())
+    game.make_move(game.parse_uci("a2a4"))
+    game.make_move(game.parse_uci("a7a5"))
+    self.engine.start(game)
+    self.assertEqual(move_uci(self.wait_for_result().move), self.first_move(game))
+    time.sleep(0.1)
+    self.assertIsNone(self.engine.poll())
+
+if __name__ == '__main__':
+  unittest.main()
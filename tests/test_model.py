@@ -0,0 +1,216 @@
+"""Game: making and unmaking moves, the Piece views, FEN, and draws by
+repetition and the fifty-move rule.
+"""
+import unittest
+
+from Chess.Model import (Game, Position, START_FEN, UNDO_STACK_SIZE, WHITE_KINGSIDE, BLACK_QUEENSIDE,
+  square_name)
+from Chess.Perft import REFERENCE_POSITIONS
+
+def play(game, moves):
+  for text in moves.split():
+    game.make_move(game.parse_uci(text))
+
+SHUFFLE = "g1f3 g8f6 f3g1 f6g8"
+
+class MakeUnmakeTest(unittest.TestCase):
+
+  def state(self, game):
+    return game.to_fen(), game.get_zobrist_key(), list(game.get_bitboards())
+
+  def test_unmake_restores_every_position(self):
+    # two plies deep into the perft positions, which between them cover
+    # castling, en passant, promotions and captures of castling rooks
+    for name, fen, _ in REFERENCE_POSITIONS:
+      game = Game.from_fen(fen)
+      before = self.state(game)
+      for move in game.legal_moves():
+        game.make_move(move)
+        after = self.state(game)
+        # the incrementally updated key is the one computed from scratch
+        self.assertEqual(game.get_zobrist_key(), Game.from_fen(after[0]).get_zobrist_key(), name)
+        for reply in game.legal_moves():
+          game.make_move(reply)
+          self.assertEqual(game.get_zobrist_key(), Game.from_fen(game.to_fen()).get_zobrist_key(), name)
+          game.unmake_move()
+          self.assertEqual(self.state(game), after, name)
+        game.unmake_move()
+        self.assertEqual(self.state(game), before, name)
+
+  def test_perft(self):
+    for name, fen, counts in REFERENCE_POSITIONS:
+      self.assertEqual(Game.from_fen(fen).perft(2), counts[1], name)
+
+  def test_undo_stack_grows(self):
+    game = Game.from_fen(START_FEN)
+    plies = UNDO_STACK_SIZE * 2 + 4
+    for _ in range(plies // 4):
+      play(game, SHUFFLE)
+    self.assertEqual(game.get_ply(), plies)
+    self.assertEqual(len(game.get_moves()), plies)
+    for _ in range(plies):
+      game.unmake_move()
+    self.assertEqual(game.to_fen(), START_FEN)
+    self.assertEqual(game.get_zobrist_key(), Game.from_fen(START_FEN).get_zobrist_key())
+
+class PieceViewTest(unittest.TestCase):
+
+  def views(self, game):
+    """Return {square name: (piece kind, colour)} from the Piece views."""
+    return {square_name(piece.get_square()): (piece.KIND, piece.get_colour())
+      for piece in game.get_pieces()}
+
+  def test_positions_are_interned(self):
+    for sq in range(64):
+      position = Position.of_square(sq)
+      self.assertIs(Position.of(position.get_rank(), position.get_file()), position)
+      self.assertEqual(position.get_square(), sq)
+
+  def test_views_follow_play_and_takeback(self):
+    game = Game.from_fen("r3k2r/1P6/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    start = self.views(game)
+    for text in ("e1g1", "a8a1", "b7b8q"):
+      game.play(game.parse_uci(text))
+      # the views agree with the board after every move
+      self.assertEqual(self.views(game), self.views(Game.from_fen(game.to_fen())), text)
+    self.assertEqual(len(game.get_captured()), 1)
+    for _ in range(3):
+      self.assertTrue(game.takeback())
+    self.assertFalse(game.takeback())
+    self.assertEqual(self.views(game), start)
+    self.assertEqual(game.get_captured(), [])
+
+class FenTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    fens = [fen for _, fen, _ in REFERENCE_POSITIONS] + [
+      "r3k2r/8/8/8/8/8/8/R3K2R b Kq - 17 42",
+      "r3k2r/8/8/8/8/8/8/R3K2R w Qk - 3 9",
+      "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+      "8/8/8/8/k2pP2R/8/8/4K3 b - e3 0 57",
+    ]
+    for fen in fens:
+      self.assertEqual(Game.from_fen(fen).to_fen(), fen)
+
+  def test_fields(self):
+    game = Game.from_fen("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w Kq f6 4 3")
+    self.assertTrue(game.turn)
+    self.assertEqual(game.get_castling_rights(), WHITE_KINGSIDE | BLACK_QUEENSIDE)
+    self.assertEqual(game.get_ep_square(), 45)
+    self.assertEqual(game.to_fen().split()[4:], ["4", "3"])
+
+  def test_clocks_default_when_missing(self):
+    self.assertEqual(Game.from_fen("4k3/8/8/8/8/8/8/4K3 b - -").to_fen(), "4k3/8/8/8/8/8/8/4K3 b - - 0 1")
+
+  def test_moves_update_the_fields(self):
+    game = Game.from_fen(START_FEN)
+    play(game, "e2e4")
+    self.assertEqual(game.to_fen(), "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+    play(game, "g8f6")
+    self.assertEqual(game.to_fen(), "rnbqkb1r/pppppppp/5n2/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 1 2")
+    play(game, "e1e2")
+    self.assertEqual(game.to_fen().split()[2:], ["kq", "-", "2", "2"])
+    play(game, "h8g8")
+    self.assertEqual(game.to_fen().split()[2:], ["q", "-", "3", "3"])
+
+  def test_capturing_a_rook_removes_its_castling_right(self):
+    game = Game.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    play(game, "h1h8")
+    self.assertEqual(game.to_fen(), "r3k2R/8/8/8/8/8/8/R3K3 b Qq - 0 1")
+
+  def test_invalid(self):
+    for fen in ("", "8/8/8/8/8/8/8/8 w - - 0 1", "4k3/8/8/8/8/8/4K3 w - - 0 1",
+        "4k3/8/8/8/8/8/8/4K3 x - - 0 1", "4k3/8/8/8/8/8/8/4K3 w X - 0 1",
+        "4k3/8/8/8/8/8/8/4K3 w - z9 0 1", "4k3/8/8/8/8/8/8/4K3 w - - a 1", "4k3/8/8/8/8/8/8/4K3 w"):
+      with self.assertRaises(ValueError, msg=fen):
+        Game.from_fen(fen)
+
+class RepetitionTest(unittest.TestCase):
+
+  def test_threefold_repetition(self):
+    game = Game.from_fen(START_FEN)
+    play(game, "g1f3 g8f6 f3g1")
+    self.assertFalse(game.is_repetition())
+    play(game, "f6g8")
+    self.assertTrue(game.is_repetition())
+    self.assertFalse(game.is_repetition(2))
+    self.assertTrue(game.is_draw())
+    self.assertIsNone(game.outcome())
+    play(game, SHUFFLE)
+    self.assertTrue(game.is_repetition(2))
+    self.assertEqual(game.outcome(), ("1/2-1/2", "threefold repetition"))
+
+  def test_side_to_move_matters(self):
+    # the knights return but it is black's move, not white's as before
+    game = Game.from_fen(START_FEN)
+    play(game, "g1f3 g8f6 b1c3 f6g8 c3b1 b8c6 f3g1 c6b8 g1h3")
+    self.assertFalse(game.is_repetition())
+    play(game, "g8f6 h3g1 f6g8")
+    self.assertTrue(game.is_repetition())
+
+  def test_pawn_move_resets_the_window(self):
+    game = Game.from_fen(START_FEN)
+    play(game, SHUFFLE + " e2e4 e7e5")
+    self.assertFalse(game.is_repetition())
+    play(game, SHUFFLE)
+    self.assertTrue(game.is_repetition())
+    self.assertFalse(game.is_repetition(2))
+
+  def test_capture_resets_the_window(self):
+    game = Game.from_fen("4k3/8/8/3p4/8/2N5/8/4K3 w - - 0 1")
+    play(game, "c3b1 e8d8 b1c3 d8e8")
+    self.assertTrue(game.is_repetition())
+    # the same squares as before the capture, but without the pawn
+    play(game, "c3d5 e8d7 d5c3 d7e8")
+    self.assertFalse(game.is_repetition())
+    play(game, "c3d5 e8d7 d5c3 d7e8")
+    self.assertTrue(game.is_repetition())
+    self.assertFalse(game.is_repetition(2))
+
+  def test_window_starts_at_the_loaded_position(self):
+    # the halfmove clock counts moves made before the game was loaded
+    game = Game.from_fen("4k3/8/8/8/8/8/8/4K2R w K - 40 60")
+    self.assertFalse(game.is_repetition())
+    play(game, "h1h2 e8d8 h2h1 d8e8")
+    # the rook moved, so castling is gone and the position is new
+    self.assertFalse(game.is_repetition())
+    play(game, "h1h2 e8d8 h2h1 d8e8")
+    self.assertTrue(game.is_repetition())
+
+  def test_unmake_restores_the_draw_state(self):
+    game = Game.from_fen(START_FEN)
+    play(game, SHUFFLE)
+    game.unmake_move()
+    self.assertFalse(game.is_repetition())
+    play(game, "f6g8")
+    self.assertTrue(game.is_repetition())
+
+class FiftyMoveTest(unittest.TestCase):
+
+  def test_hundredth_quiet_halfmove_draws(self):
+    game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 99 80")
+    self.assertFalse(game.is_fifty_moves())
+    self.assertFalse(game.is_draw())
+    play(game, "a1a2")
+    self.assertTrue(game.is_fifty_moves())
+    self.assertTrue(game.is_draw())
+    self.assertEqual(game.outcome(), ("1/2-1/2", "fifty-move rule"))
+
+  def test_capture_or_pawn_move_resets_the_clock(self):
+    game = Game.from_fen("4k3/8/8/8/8/8/p7/R3K3 w - - 99 80")
+    play(game, "a1a2")
+    self.assertFalse(game.is_fifty_moves())
+    game = Game.from_fen("4k3/p7/8/8/8/8/8/R3K3 b - - 99 80")
+    play(game, "a7a6")
+    self.assertFalse(game.is_fifty_moves())
+
+  def test_mate_on_the_hundredth_halfmove_wins(self):
+    game = Game.from_fen("7k/8/6K1/8/8/8/8/R7 w - - 99 80")
+    play(game, "a1a8")
+    self.assertTrue(game.is_fifty_moves())
+    self.assertTrue(game.is_checkmate())
+    self.assertFalse(game.is_draw())
+    self.assertEqual(game.outcome(), ("1-0", "checkmate"))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,206 @@
+"""ObjLoader: parsing OBJ and MTL files, indexing, interleaving and the mesh
+cache.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import ObjLoader
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MODELS = os.path.join(os.path.dirname(os.path.dirname(DATA)), "model")
+
+def read(fileName):
+  with open(fileName, "r") as inFile:
+    return inFile.read()
+
+class ParseTest(unittest.TestCase):
+
+  def assertSameMesh(self, a, b):
+    for name in ("positions", "normals", "uvs"):
+      self.assertEqual(getattr(a, name).dtype, np.float32)
+      np.testing.assert_array_equal(getattr(a, name), getattr(b, name), name)
+    self.assertEqual(a.chunks, b.chunks)
+    self.assertEqual(a.materialLib, b.materialLib)
+    np.testing.assert_array_equal(a.aabbMin, b.aabbMin)
+    np.testing.assert_array_equal(a.aabbMax, b.aabbMax)
+
+  def test_cube(self):
+    text = read(os.path.join(DATA, "cube.obj"))
+    mesh = ObjLoader.parseObj(text)
+    self.assertSameMesh(mesh, ObjLoader.parseObjLines(text.splitlines()))
+    # six quads and four triangles, a repeated usemtl continuing its chunk
+    self.assertEqual(mesh.chunks, [("wood", 0, 18), ("paint", 18, 18), ("wood", 36, 6)])
+    self.assertEqual(mesh.materialLib, "cube.mtl")
+    np.testing.assert_array_equal(mesh.aabbMax, [1.0, 1.0, 1.5])
+    # quads are fanned from their first corner
+    np.testing.assert_array_equal(mesh.positions[:6], [[0, 0, 0], [0, 1, 0], [1, 1, 0], [0, 0, 0], [1, 1, 0],
+      [1, 0, 0]])
+    # a corner without a uv gets (0, 0)
+    np.testing.assert_array_equal(mesh.uvs[24:30], np.zeros((6, 2)))
+
+  def test_models(self):
+    for name in ("board", "whiteKnight", "highlight"):
+      text = read(os.path.join(MODELS, name + ".obj"))
+      self.assertSameMesh(ObjLoader.parseObj(text), ObjLoader.parseObjLines(text.splitlines()))
+
+  def test_mtl(self):
+    materials = ObjLoader.parseMtl(read(os.path.join(DATA, "cube.mtl")).splitlines())
+    self.assertEqual(sorted(materials), ["paint", "wood"])
+    wood, paint = materials["wood"], materials["paint"]
+    self.assertEqual(wood["color"]["diffuse"], [0.6, 0.4, 0.2])
+    self.assertEqual(wood["specularExponent"], 10.0)
+    self.assertEqual(wood["texture"], {"diffuse" : "wood.png", "opacity" : None, "specular" : None,
+      "normal" : None})
+    self.assertEqual(paint["alpha"], 0.5)
+    self.assertEqual(paint["texture"]["normal"], "paint normal.png")
+    self.assertEqual(paint["color"]["ambient"], [0.5, 0.5, 0.5])
+
+def grid(size):
+  """The (n, 3) triangles of a size by size grid of quads."""
+  corner = np.arange(size * size).reshape(size, size)
+  a, b = corner[:-1, :-1].ravel(), corner[:-1, 1:].ravel()
+  c, d = corner[1:, :-1].ravel(), corner[1:, 1:].ravel()
+  return np.concatenate((np.stack((a, b, d), 1), np.stack((a, d, c), 1)))
+
+class IndexTest(unittest.TestCase):
+
+  def test_tipsify_is_a_permutation(self):
+    triangles = grid(30)
+    np.random.default_rng(3).shuffle(triangles)
+    for cacheSize in (3, 16, 32):
+      order = ObjLoader._tipsify(triangles, 30 * 30, cacheSize)
+      np.testing.assert_array_equal(np.sort(order), np.arange(len(triangles)))
+    self.assertEqual(len(ObjLoader._tipsify(np.zeros((0, 3), dtype=np.int64), 0, 16)), 0)
+
+  def test_tipsify_reduces_cache_misses(self):
+    triangles = grid(30)
+    np.random.default_rng(3).shuffle(triangles)
+    before = ObjLoader.cacheMissRatio(triangles.ravel())
+    after = ObjLoader.cacheMissRatio(triangles[ObjLoader._tipsify(triangles, 30 * 30, 16)].ravel())
+    self.assertLess(after, before)
+    # a grid's best is one vertex per two triangles, seen only through an
+    # unbounded cache
+    self.assertLess(after, 1.0)
+
+  def test_index_mesh(self):
+    mesh = ObjLoader.parseObj(read(os.path.join(DATA, "cube.obj")))
+    indexed = ObjLoader.indexMesh(mesh)
+    self.assertEqual(indexed.indices.dtype, np.uint16)
+    self.assertEqual(len(indexed.indices), len(mesh.positions))
+    self.assertEqual(indexed.chunks, mesh.chunks)
+    self.assertTrue(ObjLoader.sameTriangles(indexed, mesh))
+    # every face has a normal of its own, so only the two corners a quad's
+    # triangles have in common are shared: 5 * 4 + 4 * 3 vertices
+    self.assertEqual(len(indexed.positions), 32)
+    self.assertEqual(len(np.unique(indexed.vertices, axis=0)), 32)
+    # vertices are numbered in the order the triangles first use them
+    firstUse = np.unique(indexed.indices, return_index=True)[1]
+    self.assertTrue(np.all(np.diff(firstUse) > 0))
+
+  def test_same_triangles_notices_a_change(self):
+    mesh = ObjLoader.parseObj(read(os.path.join(DATA, "cube.obj")))
+    indexed = ObjLoader.indexMesh(mesh)
+    indexed.indices = indexed.indices.copy()
+    indexed.indices[[0, 1]] = indexed.indices[[1, 0]]
+    self.assertFalse(ObjLoader.sameTriangles(indexed, mesh))
+
+class InterleaveTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mesh = ObjLoader.indexMesh(ObjLoader.parseObj(read(os.path.join(DATA, "cube.obj"))))
+
+  def test_vertex_streams_are_the_vertices(self):
+    vertices = self.mesh.interleave(ObjLoader.VERTEX_STREAMS)
+    self.assertIs(vertices, self.mesh.vertices)
+    self.assertEqual(vertices.shape, (32, 8))
+    self.assertEqual(vertices.strides, (8 * 4, 4))
+    np.testing.assert_array_equal(vertices[:, 3:6], self.mesh.normals)
+
+  def test_widths_and_order(self):
+    streams = ("uvs", "positions", "tangents", "normals", "bitangents")
+    vertices = self.mesh.interleave(streams)
+    self.assertEqual(vertices.dtype, np.float32)
+    self.assertEqual(vertices.shape, (32, sum(ObjLoader.STREAM_WIDTHS[name] for name in streams)))
+    self.assertEqual(vertices.strides, (14 * 4, 4))
+    self.assertTrue(vertices.flags.c_contiguous)
+    np.testing.assert_array_equal(vertices[:, 0:2], self.mesh.uvs)
+    np.testing.assert_array_equal(vertices[:, 2:5], self.mesh.positions)
+    np.testing.assert_array_equal(vertices[:, 5:8], np.tile([0.0, 1.0, 0.0], (32, 1)))
+    np.testing.assert_array_equal(vertices[:, 8:11], self.mesh.normals)
+    np.testing.assert_array_equal(vertices[:, 11:14], np.tile([1.0, 0.0, 0.0], (32, 1)))
+
+  def test_without_vertices(self):
+    # a de-indexed mesh builds its streams on request, VERTEX_STREAMS too
+    mesh = ObjLoader.parseObj(read(os.path.join(DATA, "cube.obj")))
+    vertices = mesh.interleave(ObjLoader.VERTEX_STREAMS)
+    self.assertEqual(vertices.shape, (42, 8))
+    np.testing.assert_array_equal(vertices[:, 6:8], mesh.uvs)
+    self.assertEqual(mesh.interleave(["normals"]).shape, (42, 3))
+
+class CacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    for name in ("cube.obj", "cube.mtl"):
+      shutil.copy(os.path.join(DATA, name), self.directory)
+    self.obj = os.path.join(self.directory, "cube.obj")
+    self.cache = ObjLoader.cachePath(self.obj)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_round_trip(self):
+    parsed = ObjLoader.loadMesh(self.obj)
+    self.assertTrue(os.path.exists(self.cache))
+    mesh = ObjLoader.loadMesh(self.obj)
+    # the vertices are read only views of the mapped file
+    self.assertFalse(mesh.vertices.flags.writeable)
+    np.testing.assert_array_equal(mesh.vertices, parsed.vertices)
+    np.testing.assert_array_equal(mesh.indices, parsed.indices)
+    self.assertEqual(mesh.chunks, parsed.chunks)
+    self.assertEqual(mesh.materials, parsed.materials)
+    self.assertEqual(sorted(mesh.materials), ["paint", "wood"])
+    np.testing.assert_array_equal(mesh.aabbMin, [0.0, 0.0, 0.0])
+    self.assertTrue(ObjLoader.sameTriangles(mesh, ObjLoader.parseObj(read(self.obj))))
+
+  def test_changed_mtime_invalidates(self):
+    ObjLoader.loadMesh(self.obj)
+    self.assertIsNotNone(ObjLoader._mapCache(self.cache))
+    stat = os.stat(self.obj)
+    os.utime(self.obj, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    self.assertIsNone(ObjLoader._mapCache(self.cache))
+    # loading again writes a cache for the file as it is now
+    ObjLoader.loadMesh(self.obj)
+    self.assertIsNotNone(ObjLoader._mapCache(self.cache))
+
+  def test_changed_material_size_invalidates(self):
+    ObjLoader.loadMesh(self.obj)
+    stat = os.stat(os.path.join(self.directory, "cube.mtl"))
+    with open(os.path.join(self.directory, "cube.mtl"), "a") as f:
+      f.write("\nnewmtl extra\nKd 1 1 1\n")
+    # the same mtime, so only the size tells
+    os.utime(os.path.join(self.directory, "cube.mtl"), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    self.assertIsNone(ObjLoader._mapCache(self.cache))
+    self.assertIn("extra", ObjLoader.loadMesh(self.obj).materials)
+
+  def test_bad_or_truncated_file(self):
+    ObjLoader.loadMesh(self.obj)
+    with open(self.cache, "rb") as f:
+      data = f.read()
+    with open(self.cache, "wb") as f:
+      f.write(b"OBJMESH0" + data[8:])
+    self.assertIsNone(ObjLoader._mapCache(self.cache))
+    with open(self.cache, "wb") as f:
+      f.write(data[:-2])
+    self.assertIsNone(ObjLoader._mapCache(self.cache))
+    with open(self.cache, "wb") as f:
+      f.write(data[:10])
+    self.assertIsNone(ObjLoader._mapCache(self.cache))
+    self.assertIsNone(ObjLoader._mapCache(self.cache + ".missing"))
+
+if __name__ == '__main__':
+  unittest.main()
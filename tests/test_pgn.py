@@ -0,0 +1,104 @@
+"""Reading, writing, replaying and sharding PGN files."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from Chess.Pgn import (PgnGame, format_game, read_games, read_shard, replay, shard_bounds, verify,
+  verify_file)
+
+GAMES = '''[Event "Casual \\"blitz\\""]
+[Site "?"]
+[White "A"]
+[Black "B"]
+[Result "1-0"]
+
+1. e4 {King's pawn; a comment with a semicolon
+over two lines} e5 $1 2. Nf3 (2. f4 exf4 (2... d5) 3. Nf3) 2... Nc6 ; the rest of
+3. Bb5 a6 ; this line is a comment
+4. Ba4!? {book} Nf6?! ; {not a comment opener
+1-0
+
+[Event "Second"]
+[FEN "4k3/8/8/8/8/8/4P3/4K3 b - - 0 40"]
+[Result "*"]
+
+40... Kd7 41. e4 1/2-1/2
+'''
+
+class ParseTest(unittest.TestCase):
+
+  def test_moves_comments_variations_and_nags(self):
+    first, second = read_games(GAMES.splitlines())
+    self.assertEqual(first.headers["Event"], 'Casual "blitz"')
+    self.assertEqual(first.moves, ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "Ba4!?", "Nf6?!"])
+    self.assertEqual(first.result, "1-0")
+    self.assertEqual(second.moves, ["Kd7", "e4"])
+    # the result in the movetext wins over the tag
+    self.assertEqual(second.result, "1/2-1/2")
+
+  def test_replay(self):
+    first, second = read_games(GAMES.splitlines())
+    self.assertEqual(replay(first).to_fen(), "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 2 5")
+    self.assertEqual(replay(second).to_fen(), "8/3k4/8/8/4P3/8/8/4K3 b - e3 0 41")
+
+  def test_illegal_move(self):
+    pgn = PgnGame({}, ["e4", "e5", "Ke3"], "*")
+    with self.assertRaisesRegex(ValueError, r"move 2\. Ke3"):
+      replay(pgn)
+    stats = verify(format_game(pgn).splitlines())
+    self.assertEqual((stats.games, stats.failed, len(stats.errors)), (1, 1, 1))
+
+  def test_format_round_trip(self):
+    for pgn in read_games(GAMES.splitlines()):
+      again, = read_games(format_game(pgn).splitlines())
+      self.assertEqual((again.headers, again.moves, again.result),
+        (dict(pgn.headers, Result=pgn.result, **{name: again.headers[name] for name in again.headers
+          if name not in pgn.headers}), pgn.moves, pgn.result))
+
+class ShardTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, text):
+    path = os.path.join(self.directory, "games.pgn")
+    with open(path, "w") as f:
+      f.write(text)
+    return path
+
+  def games(self, first_tag, count):
+    return "".join('[%s "game %d"]\n[Result "*"]\n\n1. e4 e5 2. Nf3 Nc6 *\n\n' % (first_tag, i)
+      for i in range(count))
+
+  def check_shards(self, path, count):
+    shards = shard_bounds(path, 8)
+    self.assertEqual(shards[0][0], 0)
+    self.assertEqual(shards[-1][1], os.path.getsize(path))
+    games = [pgn for start, end in shards for pgn in read_games(read_shard(path, start, end))]
+    self.assertEqual(sorted(pgn.headers[next(iter(pgn.headers))] for pgn in games),
+      sorted("game %d" % i for i in range(count)))
+    return shards
+
+  def test_split_at_event_tags(self):
+    shards = self.check_shards(self.write(self.games("Event", 50)), 50)
+    self.assertEqual(len(shards), 8)
+
+  def test_split_at_other_first_tags(self):
+    shards = self.check_shards(self.write(self.games("White", 50)), 50)
+    self.assertEqual(len(shards), 8)
+
+  def test_file_without_tags_is_one_shard(self):
+    path = self.write("1. e4 e5 2. Nf3 *\n" * 20)
+    self.assertEqual(shard_bounds(path, 8), [(0, os.path.getsize(path))])
+
+  def test_verify_file_with_workers(self):
+    path = self.write(self.games("Site", 30))
+    stats = verify_file(path, workers=2)
+    self.assertEqual((stats.games, stats.moves, stats.failed), (30, 120, 0))
+
+if __name__ == '__main__':
+  unittest.main()
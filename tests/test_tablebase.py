@@ -0,0 +1,102 @@
+"""Tablebase generation and probing against known values and the search."""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from Chess import Tablebase
+from Chess.Model import Game
+from Chess.Search import Searcher, SearchLimits, MATE
+
+class TablebaseTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.mkdtemp()
+    cls.solved = {}
+    for name in ("KQK", "KRK", "KPK"):
+      Tablebase.generate(name, cls.solved)
+    for name in ("KQK", "KRK", "KPK"):
+      Tablebase.write(os.path.join(cls.directory, name + ".tb"), name, cls.solved[name][0])
+    cls.tablebase = Tablebase.Tablebase(cls.directory)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tablebase.close()
+    shutil.rmtree(cls.directory)
+
+  def probe(self, fen):
+    return self.tablebase.probe(Game.from_fen(fen))
+
+  def test_longest_mates(self):
+    # mate in 10 with a queen and in 16 with a rook, so the side to move
+    # loses in at most 20 and 32 plies
+    for name, longest in (("KQK", 20), ("KRK", 32)):
+      codes, valid = self.solved[name]
+      self.assertEqual(Tablebase.statistics(codes, valid)[4], longest, name)
+      wins = codes[(codes > 0) & (codes % 2 == 0)]
+      self.assertEqual(int(wins.max()) - 1, longest - 1, name)
+
+  def test_known_positions(self):
+    self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"), (1, 1))
+    self.assertEqual(self.probe("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1"), (-1, 0))
+    self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/7R w - - 0 1"), (1, 1))
+    # the king takes the queen, and stalemate
+    self.assertEqual(self.probe("k7/1Q6/8/8/8/8/8/7K b - - 0 1"), (0, 0))
+    self.assertEqual(self.probe("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1"), (0, 0))
+    # the king stops the pawn, or cannot
+    self.assertEqual(self.probe("8/8/8/8/8/k7/7P/K7 b - - 0 1")[0], -1)
+    self.assertEqual(self.probe("4k3/8/8/8/8/8/4P3/4K3 b - - 0 1"), (0, 0))
+    self.assertIsNone(self.probe("4k3/8/8/8/8/8/3NP3/4K3 w - - 0 1"))
+    self.assertIsNone(self.probe("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1"))
+
+  def test_probe_after_a_double_push(self):
+    game = Game.from_fen("7k/8/8/8/8/8/4P3/4K3 w - - 0 1")
+    game.make_move(game.parse_uci("e2e4"))
+    self.assertEqual(game.get_ep_square(), 20)
+    # nothing can take en passant, so the position is the table's
+    self.assertEqual(self.tablebase.probe(game), self.probe("7k/8/8/8/4P3/8/8/4K3 b - - 0 1"))
+    self.assertIsNotNone(self.tablebase.probe(game))
+
+  def test_ep_capture_legal(self):
+    self.assertTrue(Game.from_fen("8/8/8/8/3pP3/8/8/4K2k b - e3 0 1").ep_capture_legal())
+    self.assertFalse(Game.from_fen("8/8/8/8/2p1P3/8/8/4K2k b - e3 0 1").ep_capture_legal())
+    # the capture would open the rank to the rook
+    self.assertFalse(Game.from_fen("8/8/8/8/k2pP2R/8/8/4K3 b - e3 0 1").ep_capture_legal())
+
+  def test_probe_agrees_with_search(self):
+    rng = random.Random(7)
+    checked = 0
+    while checked < 12:
+      piece = rng.choice("QR")
+      squares = rng.sample(range(64), 3)
+      board = ["1"] * 64
+      for sq, letter in zip(squares, ("K", "k", piece)):
+        board[sq] = letter
+      rows = ["".join(board[rank * 8:rank * 8 + 8]) for rank in range(7, -1, -1)]
+      try:
+        game = Game.from_fen("/".join(rows) + " " + rng.choice("wb") + " - - 0 1")
+      except ValueError:
+        continue
+      kings = squares[0], squares[1]
+      if max(abs((kings[0] >> 3) - (kings[1] >> 3)), abs((kings[0] & 7) - (kings[1] & 7))) < 2:
+        continue
+      # search answers a single legal move without scoring it
+      if len(game.legal_moves()) < 2:
+        continue
+      # the side not to move may not be in check
+      game.turn = not game.turn
+      attacked = game.in_check()
+      game.turn = not game.turn
+      if attacked:
+        continue
+      wdl, plies = self.tablebase.probe(game)
+      if not wdl or plies > 5:
+        continue
+      result = Searcher(hash_mb=1).search(game, SearchLimits(depth=plies + 1))
+      self.assertEqual(result.score, wdl * (MATE - plies), game.to_fen())
+      checked += 1
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,107 @@
+"""The UCI front-end searches the position it was given, also with helpers."""
+import threading
+import unittest
+from unittest import mock
+
+import Chess.Parallel
+from Chess.Model import Game, START_FEN, move_uci
+from Chess.uci import UciEngine
+
+class UciTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.lines = []
+    self.done = threading.Event()
+    def write(line):
+      self.lines.append(line)
+      if line.startswith("bestmove"):
+        self.done.set()
+    self.engine = UciEngine(write)
+
+  def tearDown(self):
+    self.engine.handle("quit")
+
+  def go(self, command):
+    """Send a go command and return the info depths and the bestmove it gave."""
+    self.done.clear()
+    del self.lines[:]
+    self.assertTrue(self.engine.handle(command))
+    self.assertTrue(self.done.wait(120))
+    depths = [int(line.split()[2]) for line in self.lines if line.startswith("info depth")]
+    return depths, self.lines[-1].split()[1]
+
+  def errors(self):
+    return [line for line in self.lines if line.startswith("info string error")]
+
+class UciCommandTest(UciTestCase):
+
+  def test_position_startpos_moves(self):
+    self.engine.handle("position startpos moves e2e4 c7c5 g1f3")
+    game = Game.from_fen(START_FEN)
+    for text in ("e2e4", "c7c5", "g1f3"):
+      game.make_move(game.parse_uci(text))
+    self.assertEqual(self.engine.game.to_fen(), game.to_fen())
+
+  def test_position_fen_moves(self):
+    self.engine.handle("position fen 4k3/8/8/8/8/8/4P3/4K3 w - - 0 1 moves e2e4")
+    self.assertEqual(self.engine.game.to_fen(), "4k3/8/8/8/4P3/8/8/4K3 b - e3 0 1")
+
+  def test_go_depth_gives_a_legal_bestmove(self):
+    self.engine.handle("position startpos moves e2e4")
+    depths, bestmove = self.go("go depth 2")
+    self.assertEqual(max(depths), 2)
+    self.assertIn(bestmove, {move_uci(move) for move in self.engine.game.legal_moves()})
+
+  def test_limits_after_searchmoves_apply(self):
+    self.engine.handle("position startpos")
+    depths, _ = self.go("go searchmoves e2e4 d2d4 depth 1")
+    self.assertEqual(max(depths), 1)
+
+  def test_malformed_commands_are_reported(self):
+    for command in ("go depth", "go wtime", "go depth two", "position", "position startpos moves e2e5",
+        "setoption name Hash value lots"):
+      del self.lines[:]
+      self.assertTrue(self.engine.handle(command))
+      self.assertEqual(len(self.errors()), 1, command)
+    # the engine is still there to take the next command
+    self.engine.handle("position startpos")
+    _, bestmove = self.go("go depth 1")
+    self.assertIn(bestmove, {move_uci(move) for move in self.engine.game.legal_moves()})
+
+  def test_uci_handshake_and_quit(self):
+    self.engine.handle("uci")
+    self.assertEqual(self.lines[-1], "uciok")
+    self.engine.handle("isready")
+    self.assertEqual(self.lines[-1], "readyok")
+    self.assertFalse(self.engine.handle("quit"))
+
+class UciThreadsTest(UciTestCase):
+
+  def test_go_with_threads_searches_the_position_set(self):
+    moves = ["e2e4", "e7e5", "g1f3", "b8c6"]
+    game = Game.from_fen(START_FEN)
+    for text in moves:
+      game.make_move(game.parse_uci(text))
+
+    sent = []
+    dumps = Chess.Parallel.pickle.dumps
+    def record(obj):
+      sent.append(obj.to_fen())
+      return dumps(obj)
+
+    with mock.patch.object(Chess.Parallel.pickle, "dumps", record):
+      self.engine.handle("setoption name Threads value 3")
+      self.engine.handle("setoption name Hash value 8")
+      self.engine.handle("position startpos moves " + " ".join(moves))
+      self.engine.handle("go depth 3")
+      self.assertTrue(self.done.wait(120))
+    self.assertEqual(sent, [game.to_fen()])
+
+    legal = {move_uci(move) for move in game.legal_moves()}
+    self.assertIn(self.lines[-1].split()[1], legal)
+    for line in self.lines:
+      if line.startswith("info depth"):
+        self.assertIn(line.split(" pv ")[1].split()[0], legal)
+
+if __name__ == '__main__':
+  unittest.main()